@@ -0,0 +1,304 @@
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from records import Interner
+
+DEFAULT_WINDOWS = (60, 900, 3600)  # seconds
+
+KIND_OTHER = 0
+KIND_OPEN_LONG = 1
+KIND_OPEN_SHORT = 2
+
+
+class FlowRule(NamedTuple):
+    """Fires when `min_wallets` distinct wallets opened at least `min_notional` on `side` within `window` seconds."""
+    side: str  # "long" / "short"
+    window: int
+    min_wallets: int
+    min_notional: float
+    coin: Optional[str] = None  # None = any coin
+
+
+class FlowAlert(NamedTuple):
+    rule: FlowRule
+    coin: str
+    wallets: int
+    notional: float
+    net_flow: float
+    time: int  # ms
+
+
+class FillRingBuffer:
+    """Columnar ring buffer of the most recent fills across all wallets.
+
+    Positions are absolute (ever increasing); slot = position % capacity.
+    """
+
+    def __init__(self, capacity: int = 1 << 18):
+        self.capacity = capacity
+        self.time = np.zeros(capacity, dtype=np.int64)
+        self.coin = np.zeros(capacity, dtype=np.int32)
+        self.wallet = np.zeros(capacity, dtype=np.int32)
+        self.sign = np.zeros(capacity, dtype=np.int8)  # +1 buy, -1 sell
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.px = np.zeros(capacity, dtype=np.float64)
+        self.sz = np.zeros(capacity, dtype=np.float64)
+        self.notional = np.zeros(capacity, dtype=np.float64)
+        self.closed_pnl = np.zeros(capacity, dtype=np.float64)
+        self.count = 0
+
+    def append(self, time: int, coin: int, wallet: int, sign: int, kind: int,
+               px: float, sz: float, closed_pnl: float) -> int:
+        slot = self.count % self.capacity
+        self.time[slot] = time
+        self.coin[slot] = coin
+        self.wallet[slot] = wallet
+        self.sign[slot] = sign
+        self.kind[slot] = kind
+        self.px[slot] = px
+        self.sz[slot] = sz
+        self.notional[slot] = px * sz
+        self.closed_pnl[slot] = closed_pnl
+        self.count += 1
+        return self.count - 1
+
+    def recent(self, since_ms: int) -> np.ndarray:
+        """Slots of fills newer than `since_ms` (vectorized scan over the live part of the buffer)."""
+        live = min(self.count, self.capacity)
+        return np.nonzero(self.time[:live] >= since_ms)[0]
+
+
+class RollingWindow:
+    """Per-coin aggregates over the fills of the last `seconds`, kept incrementally.
+
+    Every fill is added once when it arrives and removed once when it leaves the
+    window, so the cost per fill is O(1) amortized regardless of history size.
+    """
+
+    def __init__(self, seconds: int, buffer: FillRingBuffer, coins: int = 64):
+        self.seconds = seconds
+        self.span_ms = seconds * 1000
+        self.buffer = buffer
+        self.tail = 0  # oldest absolute position still inside the window
+
+        self.net_flow = np.zeros(coins)
+        self.realized_pnl = np.zeros(coins)
+        self.open_long = np.zeros(coins)
+        self.open_short = np.zeros(coins)
+        self.fills = np.zeros(coins, dtype=np.int64)
+        self.long_wallets = np.zeros(coins, dtype=np.int32)  # wallets with net buying in the window
+        self.short_wallets = np.zeros(coins, dtype=np.int32)
+        self.open_long_wallets = np.zeros(coins, dtype=np.int32)  # distinct wallets that opened longs
+        self.open_short_wallets = np.zeros(coins, dtype=np.int32)
+
+        self.wallet_net: Dict[Tuple[int, int], float] = {}
+        self.wallet_opens: Dict[Tuple[int, int, int], int] = {}
+
+    def ensure(self, coins: int):
+        size = len(self.net_flow)
+        if coins <= size:
+            return
+        grow = max(coins, size * 2) - size
+        for name in ('net_flow', 'realized_pnl', 'open_long', 'open_short', 'fills',
+                     'long_wallets', 'short_wallets', 'open_long_wallets', 'open_short_wallets'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros(grow, dtype=array.dtype)]))
+
+    def _apply(self, position: int, direction: int):
+        b = self.buffer
+        slot = position % b.capacity
+        coin = int(b.coin[slot])
+        wallet = int(b.wallet[slot])
+        notional = float(b.notional[slot])
+        flow = notional * int(b.sign[slot])
+        kind = int(b.kind[slot])
+
+        self.net_flow[coin] += direction * flow
+        self.realized_pnl[coin] += direction * float(b.closed_pnl[slot])
+        self.fills[coin] += direction
+
+        key = (coin, wallet)
+        before = self.wallet_net.get(key, 0.0)
+        after = before + direction * flow
+        if abs(after) < 1e-6:
+            after = 0.0
+            self.wallet_net.pop(key, None)
+        else:
+            self.wallet_net[key] = after
+        if (before > 0) != (after > 0):
+            self.long_wallets[coin] += 1 if after > 0 else -1
+        if (before < 0) != (after < 0):
+            self.short_wallets[coin] += 1 if after < 0 else -1
+
+        if kind == KIND_OTHER:
+            return
+        totals, wallets = (self.open_long, self.open_long_wallets) if kind == KIND_OPEN_LONG \
+            else (self.open_short, self.open_short_wallets)
+        totals[coin] += direction * notional
+        open_key = (coin, wallet, kind)
+        opens = self.wallet_opens.get(open_key, 0) + direction
+        if opens:
+            self.wallet_opens[open_key] = opens
+        else:
+            self.wallet_opens.pop(open_key, None)
+        if opens == 1 and direction == 1:
+            wallets[coin] += 1
+        elif opens == 0:
+            wallets[coin] -= 1
+
+    def make_room(self, next_position: int):
+        # The slot about to be overwritten must leave the window first
+        while self.tail <= next_position - self.buffer.capacity:
+            self._apply(self.tail, -1)
+            self.tail += 1
+
+    def add(self, position: int, now_ms: int):
+        self._apply(position, 1)
+        self.expire(now_ms, position)
+
+    def expire(self, now_ms: int, position: int):
+        b = self.buffer
+        cutoff = now_ms - self.span_ms
+        while self.tail <= position and b.time[self.tail % b.capacity] < cutoff:
+            self._apply(self.tail, -1)
+            self.tail += 1
+
+    def forget_wallets(self, wallets: Set[int]):
+        # Leftovers of wallets whose fills all expired: float rounding can leave a net flow above the epsilon
+        for key in [key for key in self.wallet_net if key[1] in wallets]:
+            net = self.wallet_net.pop(key)
+            if net > 0:
+                self.long_wallets[key[0]] -= 1
+            elif net < 0:
+                self.short_wallets[key[0]] -= 1
+        for key in [key for key in self.wallet_opens if key[1] in wallets]:
+            del self.wallet_opens[key]
+
+    def stats(self, coin: int) -> Dict[str, float]:
+        if coin >= len(self.net_flow):
+            return {}
+        long_wallets, short_wallets = int(self.long_wallets[coin]), int(self.short_wallets[coin])
+        voters = long_wallets + short_wallets
+        return {
+            'fills': int(self.fills[coin]),
+            'net_flow': float(self.net_flow[coin]),
+            'realized_pnl': float(self.realized_pnl[coin]),
+            'open_long': float(self.open_long[coin]),
+            'open_short': float(self.open_short[coin]),
+            'open_long_wallets': int(self.open_long_wallets[coin]),
+            'open_short_wallets': int(self.open_short_wallets[coin]),
+            'consensus': (long_wallets - short_wallets) / voters if voters else 0.0,
+        }
+
+
+class FillAnalytics:
+    def __init__(self, windows=DEFAULT_WINDOWS, rules: Optional[List[FlowRule]] = None,
+                 capacity: int = 1 << 18):
+        self.rules = list(rules or [])
+        self.buffer = FillRingBuffer(capacity)
+        self.coins = Interner()
+        self.wallets = Interner()
+        spans = sorted(set(windows) | {rule.window for rule in self.rules})
+        self.windows: Dict[int, RollingWindow] = {seconds: RollingWindow(seconds, self.buffer) for seconds in spans}
+        self.max_span_ms = max(spans) * 1000
+        self.now_ms = 0
+        self.last_fired: Dict[Tuple[int, str], int] = {}
+
+    def add_fill(self, wallet_address: str, fill: Dict) -> List[FlowAlert]:
+        try:
+            time = int(fill['time'])
+            px = float(fill['px'])
+            sz = float(fill['sz'])
+            closed_pnl = float(fill.get('closedPnl') or 0)
+        except (KeyError, ValueError, TypeError):
+            return []
+
+        self.now_ms = max(self.now_ms, time)
+        if time < self.now_ms - self.max_span_ms:
+            return []
+
+        direction = fill.get('dir') or ''
+        if direction.startswith('Open'):
+            kind = KIND_OPEN_LONG if 'Long' in direction else KIND_OPEN_SHORT
+        else:
+            kind = KIND_OTHER
+        coin_name = fill.get('coin')
+        coin = self.coins(coin_name)
+        sign = 1 if fill.get('side') == 'B' else -1
+
+        for window in self.windows.values():
+            window.ensure(len(self.coins))
+            window.make_room(self.buffer.count)
+        position = self.buffer.append(time, coin, self.wallets(wallet_address), sign, kind, px, sz, closed_pnl)
+        for window in self.windows.values():
+            window.add(position, self.now_ms)
+
+        return self._check_rules(coin, coin_name, kind)
+
+    def _check_rules(self, coin: int, coin_name: str, kind: int) -> List[FlowAlert]:
+        if kind == KIND_OTHER:
+            return []
+        side = 'long' if kind == KIND_OPEN_LONG else 'short'
+
+        alerts = []
+        for index, rule in enumerate(self.rules):
+            if rule.side != side or (rule.coin and rule.coin != coin_name):
+                continue
+            window = self.windows[rule.window]
+            if side == 'long':
+                notional, wallets = window.open_long[coin], window.open_long_wallets[coin]
+            else:
+                notional, wallets = window.open_short[coin], window.open_short_wallets[coin]
+            if notional < rule.min_notional or wallets < rule.min_wallets:
+                continue
+            # Once per window per rule and coin
+            fired = self.last_fired.get((index, coin_name))
+            if fired is not None and self.now_ms - fired < window.span_ms:
+                continue
+            self.last_fired[(index, coin_name)] = self.now_ms
+            alerts.append(FlowAlert(rule, coin_name, int(wallets), float(notional),
+                                    float(window.net_flow[coin]), self.now_ms))
+        return alerts
+
+    def forget_idle_wallets(self) -> int:
+        """Release the ids of wallets without a fill left in any window, and their per-wallet state.
+
+        Windows only drop a wallet's entries when its fills expire, and the wallet
+        interner would otherwise keep every address ever seen.
+        """
+        if not self.wallets.ids:
+            return 0
+        last = self.buffer.count - 1
+        for window in self.windows.values():
+            window.expire(self.now_ms, last)
+        tail = min(window.tail for window in self.windows.values())
+        live = np.arange(tail, self.buffer.count) % self.buffer.capacity
+        active = set(np.unique(self.buffer.wallet[live]).tolist())
+        idle = {wallet for wallet in self.wallets.ids.values() if wallet not in active}
+        if not idle:
+            return 0
+        for window in self.windows.values():
+            window.forget_wallets(idle)
+        for wallet in idle:
+            self.wallets.forget(wallet)
+        return len(idle)
+
+    def snapshot(self, now_ms: int) -> Dict[Tuple[str, int], Dict[str, float]]:
+        """stats() of every coin with fills in a window, keyed by (coin, window seconds), as of now_ms."""
+        self.now_ms = max(self.now_ms, now_ms)
+        last = self.buffer.count - 1
+        result = {}
+        for seconds, window in self.windows.items():
+            window.expire(self.now_ms, last)
+            for coin in np.flatnonzero(window.fills[:len(self.coins)]).tolist():
+                result[(self.coins.names[coin], seconds)] = window.stats(coin)
+        return result
+
+    def stats(self, coin: str, window: int) -> Dict[str, float]:
+        coin_id = self.coins.ids.get(coin)
+        if coin_id is None or window not in self.windows:
+            return {}
+        rolling = self.windows[window]
+        rolling.expire(self.now_ms, self.buffer.count - 1)
+        return rolling.stats(coin_id)
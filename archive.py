@@ -0,0 +1,760 @@
+"""Columnar archive of fills and position changes, and a query CLI.
+
+Every new fill process_fills_update sees and every position event of
+process_position_update is appended to raw little-endian column files,
+partitioned by UTC day and coin:
+
+    <root>/fills/2026-10-18/BTC/<writer>/time.bin, wallet.bin, px.bin, ..., zones.bin, wallet.idx
+    <root>/positions/2026-10-18/BTC/<writer>/...
+    <root>/wallets.<writer>.txt
+
+Each process (the main one, or every worker process) appends to its own
+<writer> segments, so writers never share a file. Queries memory-map the
+columns and filter them with NumPy without copying them.
+
+Indexes:
+- day and coin: the partition directories.
+- time: zones.bin holds (end row, min time, max time) for runs of rows sorted
+  by time. A batch is sorted before it is appended and extends the last run
+  when it starts at or after its end, so time ranges are found with searchsorted.
+  zones.bin is written after the columns; rows past its last run are ignored.
+- wallet: the wallet column holds the first 8 bytes of the address. wallet.idx
+  is the (wallet, row) pairs of a segment sorted by wallet; writers build it once
+  a day has ended, `index` builds any that are missing. Rows appended after it
+  are scanned.
+
+    python archive.py fills --coin BTC --dir open --min-notional 1e6 --since 7d
+    python archive.py positions --wallet 0x3e05... --since 1d
+    python archive.py agg --by wallet --since 30d --top 20
+    python archive.py index
+"""
+import argparse
+import asyncio
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from metrics import Histogram
+from position_diff import POSITION_CLOSED, POSITION_OPENED, POSITION_RESIZED
+from records import COINS, FillRecord, PositionRecord
+from templates import format_number
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 86_400_000
+TIME_MIN, TIME_MAX = -(1 << 63), (1 << 63) - 1
+
+# Codes of the uint8 columns; 0 is anything not listed
+DIRECTIONS = ('other', 'Open Long', 'Close Long', 'Open Short', 'Close Short', 'Long > Short', 'Short > Long',
+              'Buy', 'Sell')
+ACTIONS = ('other', POSITION_OPENED, POSITION_RESIZED, POSITION_CLOSED)
+SIDES = ('-', 'long', 'short')
+
+
+class Table(NamedTuple):
+    name: str
+    columns: Dict[str, str]  # column -> dtype, in the order of the archived row tuples (after the coin)
+    labels: Dict[str, Tuple[str, ...]]  # coded columns -> the names of their codes
+    sums: Tuple[str, ...]  # columns totalled by queries
+    display: Tuple[str, ...]  # columns printed by the CLI
+
+
+FILLS = Table('fills', {
+    'time': '<i8', 'wallet': '<u8', 'tid': '<i8', 'oid': '<i8', 'px': '<f8', 'sz': '<f8', 'notional': '<f8',
+    'start_position': '<f8', 'closed_pnl': '<f8', 'fee': '<f8', 'dir': 'u1', 'crossed': 'u1',
+}, {'dir': DIRECTIONS}, ('notional', 'closed_pnl', 'fee'),
+    ('time', 'coin', 'wallet', 'dir', 'sz', 'px', 'notional', 'closed_pnl'))
+POSITIONS = Table('positions', {
+    'time': '<i8', 'wallet': '<u8', 'action': 'u1', 'side': 'u1', 'szi': '<f8', 'entry_px': '<f8',
+    'notional': '<f8', 'unrealized_pnl': '<f8', 'leverage': '<u2', 'cross': 'u1',
+}, {'action': ACTIONS, 'side': SIDES}, ('notional', 'unrealized_pnl'),
+    ('time', 'coin', 'wallet', 'action', 'side', 'szi', 'entry_px', 'notional', 'leverage'))
+TABLES: Dict[str, Table] = {table.name: table for table in (FILLS, POSITIONS)}
+_TOTALS = {name for table in TABLES.values() for name in table.sums}
+_LABEL_COLUMNS = {column for table in TABLES.values() for column in table.labels}
+
+_DIRECTION_CODES = {name: code for code, name in enumerate(DIRECTIONS)}
+_ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+_SIDE_CODES = {name: code for code, name in enumerate(SIDES)}
+
+ZONE_BYTES = 24  # end row, min time, max time (int64)
+WALLET_INDEX_DTYPE = np.dtype([('wallet', '<u8'), ('row', '<u8')])
+
+Selection = Union[slice, np.ndarray]  # rows of a segment: a sorted run, or row numbers
+
+
+def wallet_key(address: str) -> int:
+    """Value of the wallet column: the first 8 bytes of the address."""
+    try:
+        return int(address[2:18], 16)
+    except ValueError:
+        return int.from_bytes(hashlib.blake2b(address.encode(), digest_size=8).digest(), 'little')
+
+
+def day_name(day: int) -> str:
+    return datetime.datetime.fromtimestamp(day * 86400, datetime.timezone.utc).strftime('%Y-%m-%d')
+
+
+def parse_day(name: str) -> Optional[int]:
+    try:
+        return (datetime.date.fromisoformat(name) - datetime.date(1970, 1, 1)).days
+    except ValueError:
+        return None
+
+
+def coin_dir(coin: str) -> str:
+    # Spot pairs like PURR/USDC are valid coin names
+    return urllib.parse.quote(coin, safe='@')
+
+
+def segment_path(root: str, table: str, day: int, coin: str, writer: str) -> str:
+    return os.path.join(root, table, day_name(day), coin_dir(coin), writer)
+
+
+def read_zones(path: str) -> np.ndarray:
+    try:
+        zones = np.fromfile(os.path.join(path, 'zones.bin'), dtype='<i8')
+    except FileNotFoundError:
+        return np.empty((0, 3), dtype='<i8')
+    return zones[:len(zones) // 3 * 3].reshape(-1, 3)
+
+
+def map_file(path: str, dtype, count: int) -> np.ndarray:
+    """The first `count` items of a file as a read-only array over an mmap (cheaper to set up than np.memmap)."""
+    if not count:
+        return np.empty(0, dtype=dtype)
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(buffer, dtype=dtype, count=count)
+
+
+def index_segment(path: str) -> int:
+    """Writes the wallet index of a segment; returns the number of rows it covers."""
+    zones = read_zones(path)
+    rows = int(zones[-1, 0]) if len(zones) else 0
+    index = np.empty(rows, dtype=WALLET_INDEX_DTYPE)
+    if rows:
+        wallets = map_file(os.path.join(path, 'wallet.bin'), '<u8', rows)
+        order = np.argsort(wallets, kind='stable')
+        index['wallet'] = wallets[order]
+        index['row'] = order
+    temporary = os.path.join(path, 'wallet.idx.tmp')
+    index.tofile(temporary)
+    os.replace(temporary, os.path.join(path, 'wallet.idx'))
+    return rows
+
+
+def _read_lines(path: str) -> List[str]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+class Archive:
+    """Write-behind appender of one process (`writer`) to the archive at `root`.
+
+    `add_fills` and `add_position` only append tuples to a batch; a background
+    thread groups the batch by day and coin and appends it to the column files
+    every `flush_interval` seconds.
+    """
+
+    def __init__(self, root: str = 'storage/archive', writer: str = 'main', flush_interval: float = 1.0):
+        self.root = root
+        self.writer = writer
+        self.flush_interval = flush_interval
+        os.makedirs(root, exist_ok=True)
+
+        self.wallets_path = os.path.join(root, f'wallets.{writer}.txt')
+        self.wallet_keys: Dict[str, int] = {address: wallet_key(address) for address in _read_lines(self.wallets_path)}
+        self.pending: Dict[str, list] = {name: [] for name in TABLES}
+        self.pending_wallets: List[str] = []
+        # segment path -> [rows, last zone]; only touched by the flush thread
+        self.segments: Dict[str, list] = {}
+        self.unindexed: Dict[str, int] = {}  # segment path -> day, for segments written since their last index
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive')
+        self.flush_task: Optional[asyncio.Task] = None
+
+        self.archived = 0
+        self.flush_seconds = Histogram('hlmon_archive_flush_seconds', 'Duration of archive appends')
+
+    def _wallet(self, address: str) -> int:
+        key = self.wallet_keys.get(address)
+        if key is None:
+            key = self.wallet_keys[address] = wallet_key(address)
+            self.pending_wallets.append(address)
+        return key
+
+    def add_fills(self, wallet_address: str, fills: Iterable[FillRecord]):
+        wallet = self._wallet(wallet_address)
+        coins = COINS.names
+        self.pending['fills'].extend(
+            (coins[fill.coin], fill.time, wallet, fill.tid, fill.oid, fill.px, fill.sz, fill.px * fill.sz,
+             fill.start_position, fill.closed_pnl, fill.fee, _DIRECTION_CODES.get(fill.dir, 0), fill.crossed)
+            for fill in fills
+        )
+
+    def add_position(self, wallet_address: str, action: str, position: PositionRecord,
+                     event_time: Optional[int] = None):
+        self.pending['positions'].append((
+            position.coin_name, event_time or int(time.time() * 1000), self._wallet(wallet_address),
+            _ACTION_CODES.get(action, 0), _SIDE_CODES.get(position.side, 0), position.szi, position.entry_px,
+            abs(position.szi) * position.entry_px, position.unrealized_pnl, position.leverage_value or 0,
+            position.leverage_type == 'cross',
+        ))
+
+    def _segment(self, path: str, table: Table) -> list:
+        state = self.segments.get(path)
+        if state is None:
+            os.makedirs(path, exist_ok=True)
+            zones = read_zones(path)
+            rows = int(zones[-1, 0]) if len(zones) else 0
+            # Rows of an append that was interrupted before its zone was written
+            for name, dtype in table.columns.items():
+                column = os.path.join(path, f'{name}.bin')
+                size = rows * np.dtype(dtype).itemsize
+                if os.path.exists(column) and os.path.getsize(column) != size:
+                    os.truncate(column, size)
+            state = self.segments[path] = [rows, tuple(zones[-1].tolist()) if len(zones) else None]
+        return state
+
+    def _write_segment(self, path: str, table: Table, columns: Dict[str, np.ndarray]):
+        rows, last = self._segment(path, table)
+        times = columns['time']
+        order = np.argsort(times, kind='stable')
+        try:
+            for name, values in columns.items():
+                with open(os.path.join(path, f'{name}.bin'), 'ab') as f:
+                    f.write(values[order].tobytes())
+            first, latest = int(times[order[0]]), int(times[order[-1]])
+            end = rows + len(order)
+            with open(os.path.join(path, 'zones.bin'), 'r+b' if last else 'ab') as f:
+                if last and first >= last[2]:
+                    # Still sorted: the batch extends the last run
+                    zone = (end, last[1], latest)
+                    f.seek(-ZONE_BYTES, os.SEEK_END)
+                else:
+                    zone = (end, first, latest)
+                    f.seek(0, os.SEEK_END)
+                f.write(np.array(zone, dtype='<i8').tobytes())
+        except BaseException:
+            # Reopened (and truncated back to its last zone) on the next write
+            self.segments.pop(path, None)
+            raise
+        self.segments[path] = [end, zone]
+
+    def _append(self, table: Table, rows: list) -> list:
+        """Appends rows (coin first) to their segments; returns the rows that could not be written."""
+        groups: Dict[Tuple[int, str], list] = {}
+        for row in rows:
+            key = (row[1] // DAY_MS, row[0])
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = []
+            group.append(row)
+
+        failed = []
+        for (day, coin), group in groups.items():
+            path = segment_path(self.root, table.name, day, coin, self.writer)
+            values = list(zip(*group))[1:]
+            try:
+                self._write_segment(path, table, {name: np.array(column, dtype=dtype) for (name, dtype), column
+                                                  in zip(table.columns.items(), values)})
+            except (OSError, ValueError, OverflowError) as e:
+                logger.error(f"Archive write error ({path}): {e}")
+                failed.extend(group)
+                continue
+            self.unindexed[path] = day
+            self.archived += len(group)
+        return failed
+
+    def _index_ended_days(self):
+        today = int(time.time() * 1000) // DAY_MS
+        for path, day in list(self.unindexed.items()):
+            if day < today:
+                try:
+                    index_segment(path)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Archive index error ({path}): {e}")
+                del self.unindexed[path]
+                self.segments.pop(path, None)
+
+    def _flush_batch(self, pending: Dict[str, list], wallets: List[str]) -> Dict[str, list]:
+        start = time.perf_counter()
+        if wallets:
+            with open(self.wallets_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(f"{address}\n" for address in wallets))
+        failed = {name: self._append(TABLES[name], rows) for name, rows in pending.items() if rows}
+        self._index_ended_days()
+        if any(pending.values()):
+            self.flush_seconds.observe(time.perf_counter() - start)
+        return failed
+
+    async def flush(self):
+        pending, self.pending = self.pending, {name: [] for name in TABLES}
+        wallets, self.pending_wallets = self.pending_wallets, []
+        try:
+            failed = await asyncio.get_running_loop().run_in_executor(self.executor, self._flush_batch,
+                                                                      pending, wallets)
+        except Exception as e:
+            logger.error(f"Archive flush error: {e}")
+            failed = pending
+            self.pending_wallets = wallets + self.pending_wallets
+        for name, rows in failed.items():
+            self.pending[name] = rows + self.pending[name]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+        await self.flush()
+        self.executor.shutdown(wait=True)
+
+
+class Segment:
+    """The rows one writer appended to one (table, day, coin) partition, memory-mapped on demand."""
+
+    def __init__(self, table: Table, day: int, coin: str, path: str):
+        self.table = table
+        self.day = day
+        self.coin = coin
+        self.path = path
+        self.zones = read_zones(path)
+        self.rows = int(self.zones[-1, 0]) if len(self.zones) else 0
+        self.columns: Dict[str, np.ndarray] = {}
+
+    def column(self, name: str) -> np.ndarray:
+        values = self.columns.get(name)
+        if values is None:
+            values = self.columns[name] = map_file(os.path.join(self.path, f'{name}.bin'),
+                                                   self.table.columns[name], self.rows)
+        return values
+
+    def wallet_index(self) -> Optional[np.ndarray]:
+        path = os.path.join(self.path, 'wallet.idx')
+        try:
+            count = os.path.getsize(path) // WALLET_INDEX_DTYPE.itemsize
+        except OSError:
+            return None
+        return map_file(path, WALLET_INDEX_DTYPE, count) if count else None
+
+    def ranges(self, since: int, until: int) -> List[Tuple[int, int]]:
+        """Row ranges with since <= time < until, found by searchsorted in the sorted runs."""
+        ranges = []
+        start = 0
+        for end, first, last in self.zones.tolist():
+            if last >= since and first < until:
+                # Runs entirely inside the range do not touch the time column
+                lo = start + int(np.searchsorted(self.column('time')[start:end], since)) if first < since else start
+                hi = start + int(np.searchsorted(self.column('time')[start:end], until)) if last >= until else end
+                if lo < hi:
+                    ranges.append((lo, hi))
+            start = end
+        return ranges
+
+    def select(self, since: int, until: int, wallets: Optional[np.ndarray] = None) -> List[Selection]:
+        ranges = self.ranges(since, until)
+        if wallets is None or not ranges:
+            return [slice(lo, hi) for lo, hi in ranges]
+
+        selections = []
+        covered = 0
+        index = self.wallet_index()
+        if index is not None:
+            covered = min(len(index), self.rows)
+            keys = index['wallet']
+            starts = np.searchsorted(keys, wallets, 'left').tolist()
+            ends = np.searchsorted(keys, wallets, 'right').tolist()
+            rows = np.concatenate([index['row'][lo:hi] for lo, hi in zip(starts, ends)])
+            if len(rows):
+                rows = np.sort(rows[rows < self.rows])
+                if sum(hi - lo for lo, hi in ranges) < self.rows:
+                    times = self.column('time')[rows]
+                    rows = rows[(times >= since) & (times < until)]
+            if len(rows):
+                selections.append(rows)
+        # Rows appended after the index was built
+        for lo, hi in ranges:
+            lo = max(lo, covered)
+            if lo < hi:
+                hits = np.flatnonzero(np.isin(self.column('wallet')[lo:hi], wallets))
+                if len(hits):
+                    selections.append(hits + lo)
+        return selections
+
+
+def selection_size(selection: Selection) -> int:
+    return selection.stop - selection.start if isinstance(selection, slice) else len(selection)
+
+
+Filter = Callable[[Segment, Selection], Optional[np.ndarray]]
+
+
+class ArchiveReader:
+    def __init__(self, root: str = 'storage/archive'):
+        self.root = root
+
+    def wallets(self) -> Dict[int, str]:
+        """wallet column value -> address, for every writer."""
+        names = {}
+        for path in glob.glob(os.path.join(self.root, 'wallets.*.txt')):
+            for address in _read_lines(path):
+                names[wallet_key(address)] = address
+        return names
+
+    def segments(self, table: Table, coins: Optional[Sequence[str]] = None,
+                 since: int = TIME_MIN, until: int = TIME_MAX, newest_first: bool = False) -> Iterator[Segment]:
+        base = os.path.join(self.root, table.name)
+        if not os.path.isdir(base):
+            return
+        for name in sorted(os.listdir(base), reverse=newest_first):
+            day = parse_day(name)
+            if day is None or (day + 1) * DAY_MS <= since or day * DAY_MS >= until:
+                continue
+            day_path = os.path.join(base, name)
+            for coin in [coin_dir(coin) for coin in coins] if coins else sorted(os.listdir(day_path)):
+                coin_path = os.path.join(day_path, coin)
+                if not os.path.isdir(coin_path):
+                    continue
+                for writer in sorted(os.listdir(coin_path)):
+                    segment = Segment(table, day, urllib.parse.unquote(coin), os.path.join(coin_path, writer))
+                    if segment.rows:
+                        yield segment
+
+    def scan(self, table: Table, coins: Optional[Sequence[str]] = None, wallets: Optional[Sequence[str]] = None,
+             since: Optional[int] = None, until: Optional[int] = None, where: Optional[Filter] = None,
+             newest_first: bool = False) -> Iterator[Tuple[Segment, Selection]]:
+        """(segment, rows) of the rows matching every condition; `where` returns a mask over the rows or None."""
+        since = TIME_MIN if since is None else since
+        until = TIME_MAX if until is None else until
+        keys = np.array(sorted({wallet_key(wallet.lower()) for wallet in wallets}), dtype='<u8') if wallets else None
+        for segment in self.segments(table, coins, since, until, newest_first):
+            for selection in segment.select(since, until, keys):
+                mask = where(segment, selection) if where else None
+                if mask is not None:
+                    if isinstance(selection, slice):
+                        selection = np.flatnonzero(mask) + selection.start
+                    else:
+                        selection = selection[mask]
+                    if not len(selection):
+                        continue
+                yield segment, selection
+
+
+def label_codes(labels: Tuple[str, ...], patterns: str) -> List[int]:
+    """Codes whose names contain one of the comma separated patterns (case-insensitive)."""
+    wanted = [pattern.strip().lower() for pattern in patterns.split(',') if pattern.strip()]
+    return [code for code, name in enumerate(labels) if any(pattern in name.lower() for pattern in wanted)]
+
+
+def build_filter(codes: Optional[Dict[str, List[int]]] = None,
+                 min_notional: Optional[float] = None) -> Optional[Filter]:
+    codes = {name: np.array(values, dtype='u1') for name, values in (codes or {}).items()}
+    if not codes and min_notional is None:
+        return None
+
+    def where(segment: Segment, selection: Selection) -> np.ndarray:
+        mask = None
+        for name, values in codes.items():
+            column = segment.column(name)[selection]
+            matched = column == values[0] if len(values) == 1 else np.isin(column, values)
+            mask = matched if mask is None else mask & matched
+        if min_notional is not None:
+            matched = segment.column('notional')[selection] >= min_notional
+            mask = matched if mask is None else mask & matched
+        return mask
+    return where
+
+
+def _time_and_row(candidate) -> Tuple[int, int]:
+    # Rows of the same millisecond: the later appended one is newer
+    return candidate[0], candidate[2]
+
+
+def newest(scan: Iterable[Tuple[Segment, Selection]], table: Table, limit: int,
+           wallets: Optional[Dict[int, str]] = None) -> Tuple[List[Dict], int, Dict[str, float]]:
+    """The `limit` newest rows (as dicts, newest first), the number of rows and the totals of table.sums.
+
+    Cheapest over a scan with newest_first=True: once `limit` rows are kept, older rows are skipped.
+    """
+    count = 0
+    totals = {name: 0.0 for name in table.sums}
+    candidates = []  # (time, segment, row)
+    oldest = TIME_MIN  # time of the limit-th newest row kept so far
+    for segment, selection in scan:
+        size = selection_size(selection)
+        count += size
+        for name in table.sums:
+            totals[name] += float(segment.column(name)[selection].sum())
+        if not limit:
+            continue
+        if isinstance(selection, slice):
+            # A sorted run: its newest rows are its last ones
+            rows = np.arange(max(selection.start, selection.stop - limit), selection.stop)
+        elif size > limit:
+            rows = selection[np.argpartition(segment.column('time')[selection], size - limit)[size - limit:]]
+        else:
+            rows = selection
+        times = segment.column('time')[rows]
+        if oldest > TIME_MIN:
+            newer = times > oldest
+            rows, times = rows[newer], times[newer]
+        candidates.extend(zip(times.tolist(), [segment] * len(rows), rows.tolist()))
+        if len(candidates) > 4 * limit:
+            candidates = sorted(candidates, key=_time_and_row, reverse=True)[:limit]
+            oldest = candidates[-1][0]
+
+    wallets = wallets or {}
+    records = []
+    for _, segment, row in sorted(candidates, key=_time_and_row, reverse=True)[:limit]:
+        record = {'coin': segment.coin}
+        for name in table.columns:
+            value = segment.column(name)[row].item()
+            if name == 'wallet':
+                value = wallets.get(value, f"{value:016x}")
+            elif name in table.labels:
+                labels = table.labels[name]
+                value = labels[value] if value < len(labels) else labels[0]
+            elif name in ('crossed', 'cross'):
+                value = bool(value)
+            record[name] = value
+        records.append(record)
+    return records, count, totals
+
+
+class KeyTable:
+    """Positions of known wallet keys, looked up by their low bits (searchsorted per row is ~15x slower)."""
+
+    def __init__(self, known: Sequence[int]):
+        self.keys = np.array(sorted(known), dtype='<u8')
+        bits = min(24, max(18, (len(self.keys) * 64).bit_length()))
+        self.mask = np.uint64((1 << bits) - 1)
+        self.slots = np.zeros(1 << bits, dtype=np.int32)
+        # Colliding keys keep the last position; group() looks the others up with searchsorted
+        self.slots[(self.keys & self.mask).astype(np.intp)] = np.arange(len(self.keys))
+
+    def group(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(distinct values, inverse): the known keys when every value is one of them, else np.unique."""
+        if len(self.keys):
+            inverse = self.slots[(values & self.mask).astype(np.intp)]
+            missed = np.flatnonzero(self.keys[inverse] != values)
+            if not len(missed):
+                return self.keys, inverse
+            found = np.searchsorted(self.keys, values[missed])
+            found[found == len(self.keys)] = 0
+            if np.array_equal(self.keys[found], values[missed]):
+                inverse[missed] = found
+                return self.keys, inverse
+        return np.unique(values, return_inverse=True)
+
+
+def aggregate(scan: Iterable[Tuple[Segment, Selection]], table: Table, by: str,
+              known_wallets: Sequence[int] = ()) -> Dict[object, List[float]]:
+    """Group key -> [rows, *totals of table.sums]; `by` is coin, day, wallet or a coded column."""
+    known = KeyTable(known_wallets if by == 'wallet' else ())
+    # Groups with fixed keys (codes, known wallets) are summed as arrays, not per key
+    fixed = np.arange(len(table.labels[by])) if by in table.labels else known.keys
+    dense = np.zeros((1 + len(table.sums), len(fixed)))
+    groups: Dict[object, List[float]] = {}
+
+    def add(key, count, sums):
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = [0] + [0.0] * len(table.sums)
+        group[0] += count
+        for i, value in enumerate(sums, 1):
+            group[i] += value
+
+    for segment, selection in scan:
+        if by in ('coin', 'day'):
+            add(segment.coin if by == 'coin' else segment.day, selection_size(selection),
+                [float(segment.column(name)[selection].sum()) for name in table.sums])
+            continue
+        values = segment.column(by)[selection]
+        keys, inverse = (fixed, values) if by in table.labels else known.group(values)
+        counts = np.bincount(inverse, minlength=len(keys))
+        sums = [np.bincount(inverse, weights=segment.column(name)[selection], minlength=len(keys))
+                for name in table.sums]
+        if keys is fixed:
+            dense[0] += counts
+            for i, column in enumerate(sums, 1):
+                dense[i] += column
+            continue
+        for i in np.flatnonzero(counts).tolist():
+            add(keys[i].item(), int(counts[i]), [float(column[i]) for column in sums])
+    for i in np.flatnonzero(dense[0]).tolist():
+        add(fixed[i].item(), int(dense[0, i]), dense[1:, i].tolist())
+    return groups
+
+
+_DURATION_RE = re.compile(r'^(\d+(?:\.\d+)?)([smhdw])$')
+_UNITS = {'s': 1000, 'm': 60_000, 'h': 3_600_000, 'd': DAY_MS, 'w': 7 * DAY_MS}
+
+
+def parse_time(text: str, now_ms: Optional[int] = None) -> int:
+    """ms timestamp of '7d' / '12h' / '30m' ago, an ISO date or datetime (UTC unless given), or ms since the epoch."""
+    text = text.strip()
+    match = _DURATION_RE.match(text)
+    if match:
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        return now_ms - int(float(match.group(1)) * _UNITS[match.group(2)])
+    if text.isdigit():
+        return int(text)
+    moment = datetime.datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _format(name: str, value) -> str:
+    if name == 'time':
+        return datetime.datetime.fromtimestamp(value / 1000, datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    if name == 'day':
+        return day_name(value)
+    if isinstance(value, float):
+        return format_number(value, 2) if name in _TOTALS else format_number(value, 6, strip=True)
+    return str(value)
+
+
+def _scan_args(args, table: Table) -> dict:
+    codes = {}
+    for column in table.labels:
+        patterns = getattr(args, column, None)
+        if patterns:
+            codes[column] = label_codes(table.labels[column], patterns)
+    return dict(
+        coins=[coin for value in args.coin for coin in value.split(',')] if args.coin else None,
+        wallets=[wallet for value in args.wallet for wallet in value.split(',')] if args.wallet else None,
+        since=args.since, until=args.until,
+        where=build_filter(codes, args.min_notional),
+    )
+
+
+def run_rows(args, table: Table):
+    reader = ArchiveReader(args.root)
+    start = time.perf_counter()
+    scan = reader.scan(table, newest_first=True, **_scan_args(args, table))
+    records, count, totals = newest(scan, table, args.limit, reader.wallets())
+    elapsed = time.perf_counter() - start
+    if args.json:
+        for record in records:
+            print(json.dumps(record))
+        return
+    widths = {name: max([len(name)] + [len(_format(name, record[name])) for record in records])
+              for name in table.display}
+    print('  '.join(name.ljust(widths[name]) for name in table.display))
+    for record in records:
+        print('  '.join(_format(name, record[name]).ljust(widths[name]) for name in table.display))
+    print(f"{count:,} {table.name} (newest {len(records)} shown), "
+          + ', '.join(f"{name} {value:,.2f}" for name, value in totals.items()) + f"; {elapsed * 1e3:.1f} ms")
+
+
+def run_agg(args):
+    table = TABLES[args.table]
+    if args.by not in ('coin', 'day', 'wallet') and args.by not in table.labels:
+        raise SystemExit(f"--by for {table.name}: coin, day, wallet, " + ', '.join(table.labels))
+    # agg takes the coded filters of every table; one of another table would be silently ignored
+    for column in sorted(_LABEL_COLUMNS - set(table.labels)):
+        if getattr(args, column, None):
+            raise SystemExit(f"--{column} does not apply to {table.name} (--table)")
+    reader = ArchiveReader(args.root)
+    wallets = reader.wallets()
+    start = time.perf_counter()
+    groups = aggregate(reader.scan(table, **_scan_args(args, table)), table, args.by, wallets)
+    elapsed = time.perf_counter() - start
+
+    if args.by == 'day':
+        rows = sorted(groups.items())
+    else:
+        column = 1 + table.sums.index(args.sort) if args.sort in table.sums else 0
+        rows = sorted(groups.items(), key=lambda item: abs(item[1][column]), reverse=True)
+    if args.top:
+        rows = rows[:args.top]
+    if args.by == 'wallet':
+        labels = {key: wallets.get(key, f"{key:016x}") for key, _ in rows}
+    elif args.by in table.labels:
+        labels = {key: table.labels[args.by][key] for key, _ in rows}
+    else:
+        labels = {key: _format(args.by, key) for key, _ in rows}
+    width = max([len(args.by)] + [len(label) for label in labels.values()])
+    print(f"{args.by:<{width}}  {'rows':>12}  " + '  '.join(f"{name:>18}" for name in table.sums))
+    for key, (count, *sums) in rows:
+        print(f"{labels[key]:<{width}}  {count:>12,}  " + '  '.join(f"{value:>18,.2f}" for value in sums))
+    print(f"{len(groups):,} groups, {sum(group[0] for group in groups.values()):,} rows; {elapsed * 1e3:.1f} ms")
+
+
+def run_index(args):
+    reader = ArchiveReader(args.root)
+    built = 0
+    for table in TABLES.values():
+        for segment in reader.segments(table, since=args.since or TIME_MIN):
+            index = segment.wallet_index()
+            if args.force or index is None or len(index) != segment.rows:
+                index_segment(segment.path)
+                built += 1
+    print(f"Indexed {built} segments")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the fill/position archive")
+    parser.add_argument('--root', default=os.getenv('ARCHIVE_PATH') or 'storage/archive')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_filters(command, table: Optional[Table] = None):
+        command.add_argument('--coin', action='append', help="coin (repeat or comma separate)")
+        command.add_argument('--wallet', action='append', help="wallet address (repeat or comma separate)")
+        command.add_argument('--since', type=parse_time, help="7d, 12h, 2026-10-01, 2026-10-01T12:00 or ms")
+        command.add_argument('--until', type=parse_time)
+        command.add_argument('--min-notional', type=float, help="px * sz (fills) or |szi| * entry_px (positions)")
+        all_labels = {column: labels for t in TABLES.values() for column, labels in t.labels.items()}
+        for column, labels in (table.labels if table else all_labels).items():
+            command.add_argument(f'--{column}', help=f"comma separated substrings of: {', '.join(labels[1:])}")
+
+    for table in (FILLS, POSITIONS):
+        rows = commands.add_parser(table.name, help=f"newest {table.name} matching the filters")
+        add_filters(rows, table)
+        rows.add_argument('--limit', type=int, default=50)
+        rows.add_argument('--json', action='store_true', help="JSON lines instead of a table")
+
+    agg = commands.add_parser('agg', help="rows and totals grouped by coin, day, wallet or dir/action")
+    agg.add_argument('--table', choices=list(TABLES), default='fills')
+    agg.add_argument('--by', default='coin')
+    agg.add_argument('--sort', default='notional', help="rows, or the total to sort the groups by")
+    agg.add_argument('--top', type=int, default=50)
+    add_filters(agg)
+
+    index = commands.add_parser('index', help="build missing or stale wallet indexes")
+    index.add_argument('--since', type=parse_time)
+    index.add_argument('--force', action='store_true')
+
+    args = parser.parse_args()
+    if args.command == 'agg':
+        run_agg(args)
+    elif args.command == 'index':
+        run_index(args)
+    else:
+        run_rows(args, TABLES[args.command])
+
+
+if __name__ == '__main__':
+    main()
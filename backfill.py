@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from telegram_sender import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+HYPERLIQUID_INFO_URL = "https://api.hyperliquid.xyz/info"
+FILLS_PAGE_SIZE = 2000  # userFillsByTime returns at most this many fills per request
+
+
+class FillBackfill:
+    """Fetches the fills a wallet made while the websocket was down (info endpoint, userFillsByTime).
+
+    The userFills snapshot sent on (re)subscribe only holds the most recent fills; when
+    it does not reach back to the wallet's mark, the gap in between is fetched here.
+    """
+
+    def __init__(self, url: str = HYPERLIQUID_INFO_URL, rate: float = 2.0, max_pages: int = 10,
+                 timeout: float = 10.0):
+        self.url = url
+        self.max_pages = max_pages
+        self.timeout = timeout
+        # The info endpoint is weight limited per IP; reconnecting many wallets at once must not burst
+        self.bucket = TokenBucket(rate, rate)
+        self.session: Optional[aiohttp.ClientSession] = None
+
+        self.requests = 0
+        self.fetched = 0
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def _request(self, payload: Dict) -> Optional[list]:
+        await self.bucket.acquire()
+        self.requests += 1
+        try:
+            async with self.session.post(self.url, json=payload) as response:
+                if response.status != 200:
+                    logger.error(f"Backfill error: {response.status} - {await response.text()}")
+                    return None
+                return await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Backfill error: {e}")
+            return None
+
+    async def fetch(self, wallet_address: str, start_time: int, end_time: int) -> List[Dict]:
+        """Fills of a wallet with start_time <= time <= end_time (ms), oldest first."""
+        fills: Dict[int, Dict] = {}
+        for _ in range(self.max_pages):
+            page = await self._request({
+                "type": "userFillsByTime",
+                "user": wallet_address,
+                "startTime": start_time,
+                "endTime": end_time
+            })
+            if not page:
+                break
+            for fill in page:
+                fills[fill.get('tid', 0)] = fill
+            if len(page) < FILLS_PAGE_SIZE:
+                break
+            # Pages overlap on the boundary millisecond; tids make that harmless
+            newest = max(fill.get('time', 0) for fill in page)
+            if newest <= start_time:
+                # A full page all in one millisecond: asking from it again returns the same page
+                logger.warning(f"Backfill for wallet {wallet_address[-8:]}: more than {FILLS_PAGE_SIZE} fills "
+                               f"at {start_time}, some of them may be missed")
+                newest = start_time + 1
+            start_time = newest
+        else:
+            logger.warning(f"Backfill for wallet {wallet_address[-8:]} stopped after {self.max_pages} pages")
+
+        self.fetched += len(fills)
+        return sorted(fills.values(), key=lambda fill: (fill.get('time', 0), fill.get('tid', 0)))
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
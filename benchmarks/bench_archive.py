@@ -0,0 +1,206 @@
+"""Archive write cost and query latency over tens of millions of fills.
+
+Writes `--fills` synthetic fills spread over `--days` days, `--coins` coins
+(BTC and ETH busiest) and `--wallets` wallets straight into the segment
+files. Each segment gets eight in-order batches and one late batch, so it
+has two sorted runs. It then times the queries (best of 3, page cache warm)
+against the baseline of loading the fills as per-wallet JSON blobs. That
+baseline is extrapolated from 200k fills.
+
+Run from the repo root: python -m benchmarks.bench_archive
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from archive import (Archive, ArchiveReader, DAY_MS, FILLS, aggregate, build_filter, index_segment,
+                     label_codes, newest, segment_path)
+from records import FillRecord
+from benchmarks.bench_templates import random_fill
+
+COINS = ['BTC', 'ETH', 'SOL', 'HYPE', 'XRP', 'kPEPE', 'WIF', 'TAO', 'AAVE', 'VIRTUAL', 'DOGE', 'SUI', 'LINK',
+         'AVAX', 'ENA', 'FARTCOIN', 'TRUMP', 'LTC', 'BNB', 'ADA']
+
+
+def coin_names(count: int):
+    return (COINS + [f"@{i}" for i in range(count)])[:count]
+
+
+def bench_append(count: int = 100_000):
+    """Cost of Archive.add_fills on the event loop and of one flush in the archive thread."""
+    now_ms = int(time.time() * 1000)
+    wallets = [f"0x{random.getrandbits(160):040x}" for _ in range(100)]
+    frames = [(wallets[i % 100], [FillRecord.from_dict(random_fill(now_ms)) for _ in range(10)])
+              for i in range(count // 10)]
+    with tempfile.TemporaryDirectory() as directory:
+        archive = Archive(directory)
+        start = time.perf_counter()
+        for wallet, records in frames:
+            archive.add_fills(wallet, records)
+        added = time.perf_counter() - start
+        pending, archive.pending = archive.pending, {name: [] for name in archive.pending}
+        start = time.perf_counter()
+        archive._flush_batch(pending, archive.pending_wallets)
+        flushed = time.perf_counter() - start
+        archive.executor.shutdown()
+    print(f"append:  add_fills {added / count * 1e6:.2f} µs/fill on the event loop, "
+          f"flush {flushed / count * 1e6:.2f} µs/fill in the archive thread")
+
+
+def generate(directory: str, fills: int, days: int, coins: int, wallets: int, now_ms: int):
+    rng = np.random.default_rng(1)
+    names = coin_names(coins)
+    coin_weights = 1 / np.arange(1, coins + 1) ** 0.8
+    coin_weights /= coin_weights.sum()
+    wallet_keys = np.array([random.getrandbits(64) for _ in range(wallets)], dtype='<u8')
+    wallet_weights = 1 / np.arange(1, wallets + 1) ** 0.7
+    wallet_weights /= wallet_weights.sum()
+    prices = 10 ** rng.uniform(-2, 5, coins)
+    prices[:2] = (100_000, 3_000)
+
+    archive = Archive(directory)
+    first_day = now_ms // DAY_MS - days + 1
+    per_day = rng.multinomial(fills, [1 / days] * days)
+    segments = 0
+    for day_offset, day_fills in enumerate(per_day):
+        day = first_day + day_offset
+        end = min((day + 1) * DAY_MS, now_ms)
+        for coin, rows in enumerate(rng.multinomial(day_fills, coin_weights)):
+            if not rows:
+                continue
+            times = np.sort(rng.integers(day * DAY_MS, end, rows))
+            px = prices[coin] * rng.lognormal(0, 0.02, rows)
+            sz = rng.lognormal(np.log(20_000 / prices[coin]), 1.5, rows)
+            columns = {
+                'time': times, 'wallet': rng.choice(wallet_keys, rows, p=wallet_weights),
+                'tid': rng.integers(0, 1 << 50, rows), 'oid': rng.integers(0, 1 << 40, rows),
+                'px': px, 'sz': sz, 'notional': px * sz, 'start_position': rng.normal(0, 10, rows),
+                'closed_pnl': rng.normal(0, 100, rows), 'fee': px * sz * 0.00035,
+                'dir': rng.choice([1, 2, 3, 4, 7, 8], rows, p=[0.3, 0.3, 0.15, 0.15, 0.05, 0.05]),
+                'crossed': rng.integers(0, 2, rows),
+            }
+            columns = {name: values.astype(FILLS.columns[name]) for name, values in columns.items()}
+            path = segment_path(directory, 'fills', day, names[coin], 'main')
+            # Eight in-order batches, then a late one (a backfill) that starts a second sorted run
+            late = rng.random(rows) < 0.05
+            for part in np.array_split(np.flatnonzero(~late), 8):
+                if len(part):
+                    archive._write_segment(path, FILLS, {name: values[part] for name, values in columns.items()})
+            if late.any():
+                archive._write_segment(path, FILLS, {name: values[late] for name, values in columns.items()})
+            segments += 1
+    archive.executor.shutdown()
+    return wallet_keys, segments
+
+
+def timed(fn, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def json_baseline(fills: int, sample: int = 200_000) -> float:
+    """Seconds to answer "BTC opens above $1M" by loading per-wallet JSON blobs, extrapolated to `fills`."""
+    now_ms = int(time.time() * 1000)
+    blobs = []
+    for start in range(0, sample, 5000):
+        blob = {}
+        for tid in range(start, start + 5000):
+            fill = random_fill(now_ms)
+            fill['tid'] = tid
+            blob[f"{fill['coin']}_{tid}"] = fill
+        blobs.append(json.dumps(blob))
+    start = time.perf_counter()
+    matches = 0
+    for blob in blobs:
+        for fill in json.loads(blob).values():
+            if fill['coin'] == 'BTC' and 'Open' in fill['dir'] and float(fill['px']) * float(fill['sz']) >= 1e6:
+                matches += 1
+    return (time.perf_counter() - start) * fills / sample
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fills', type=int, default=20_000_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--coins', type=int, default=50)
+    parser.add_argument('--wallets', type=int, default=2000)
+    parser.add_argument('--directory', help="keep the generated archive here instead of a temp directory")
+    args = parser.parse_args()
+    random.seed(1)
+
+    bench_append()
+
+    directory = args.directory or tempfile.mkdtemp(prefix='archive-bench-')
+    now_ms = int(time.time() * 1000)
+    try:
+        start = time.perf_counter()
+        wallet_keys, segments = generate(directory, args.fills, args.days, args.coins, args.wallets, now_ms)
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(directory) for name in names)
+        print(f"archive: {args.fills:,} fills, {segments:,} segments, {size / 1e9:.2f} GB, "
+              f"written in {time.perf_counter() - start:.1f} s")
+
+        reader = ArchiveReader(directory)
+        known = wallet_keys.tolist()
+        busy = f"0x{int(wallet_keys[0]):016x}" + "0" * 24  # the busiest wallet
+        quiet = f"0x{int(wallet_keys[-1]):016x}" + "0" * 24
+        opens = build_filter({'dir': label_codes(FILLS.labels['dir'], 'open')}, 1e6)
+        week = now_ms - 7 * DAY_MS
+
+        def listing(**query):
+            return lambda: newest(reader.scan(FILLS, newest_first=True, **query), FILLS, 50)
+
+        queries = [
+            ("BTC opens >= $1M, last 7 days, newest 50", listing(coins=['BTC'], since=week, where=opens)),
+            ("all opens >= $1M, last 7 days, newest 50", listing(since=week, where=opens)),
+            ("all coins, one hour, newest 50", listing(since=now_ms - 3 * 3_600_000, until=now_ms - 2 * 3_600_000)),
+            ("busiest wallet, all days, newest 50 (scan)", listing(wallets=[busy])),
+            ("quietest wallet, all days, newest 50 (scan)", listing(wallets=[quiet])),
+        ]
+        print(f"{'query':<48} {'time':>10} {'rows':>12}")
+
+        def report(name, fn):
+            elapsed, result = timed(fn)
+            rows = result[1] if isinstance(result, tuple) else sum(group[0] for group in result.values())
+            print(f"{name:<48} {elapsed * 1e3:>7.1f} ms {rows:>12,}")
+
+        for name, fn in queries:
+            report(name, fn)
+
+        start = time.perf_counter()
+        for segment in reader.segments(FILLS):
+            index_segment(segment.path)
+        print(f"{'(wallet indexes built)':<48} {(time.perf_counter() - start) * 1e3:>7.0f} ms")
+
+        for name, fn in [
+            ("busiest wallet, all days, newest 50 (index)", listing(wallets=[busy])),
+            ("quietest wallet, all days, newest 50 (index)", listing(wallets=[quiet])),
+            ("agg by coin, everything", lambda: aggregate(reader.scan(FILLS), FILLS, 'coin')),
+            ("agg by day, everything", lambda: aggregate(reader.scan(FILLS), FILLS, 'day')),
+            ("agg by dir, last 7 days", lambda: aggregate(reader.scan(FILLS, since=week), FILLS, 'dir')),
+            ("agg by wallet, everything", lambda: aggregate(reader.scan(FILLS), FILLS, 'wallet', known)),
+            ("agg by wallet, BTC opens >= $1M, everything",
+             lambda: aggregate(reader.scan(FILLS, coins=['BTC'], where=opens), FILLS, 'wallet', known)),
+        ]:
+            report(name, fn)
+
+        print(f"{'baseline: JSON blobs, BTC opens >= $1M':<48} {json_baseline(args.fills):>8.1f} s"
+              f"  (extrapolated from 200k fills)")
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""Coinglass response decoding throughput (MB/s of base64 payload): test.py vs coinglass.py.
+
+The sample ciphertext and `user` header come from test.py. They are not from the
+same response (the key they give fails the padding check), so the sample only
+measures the base64 + AES stage. The full pipeline runs on payloads encrypted
+under the sample's key the way Coinglass does it, from the sample's size up.
+They use raw deflate so test.py's Ydecoder can decode them unchanged.
+
+The last part runs the whole path: a CoinglassSource polls a local aiohttp stub
+that serves obfuscated (gzip framed) topPosition/action responses, each with the
+latest `--window` actions of which `--new-per-poll` are new, into a HyperliquidMonitor
+with an archive and a counting sink behind AlertHub. It reports new actions/s
+from poll to sink delivery, and how many became alerts, archive rows and flow fills.
+
+Run from the repo root: python -m benchmarks.bench_coinglass
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+import urllib.parse
+import zlib
+
+from aiohttp import web
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad, unpad
+
+import main as monitor_main
+from archive import Archive
+from coinglass import CoinglassDecoder, CoinglassSource, TOP_POSITION_ACTION_PATH
+from fill_store import FillStore
+from sinks import AlertHub, Sink
+
+TEST_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test.py')
+URL = "https://capi.coinglass.com" + TOP_POSITION_ACTION_PATH
+
+
+def load_sample():
+    with open(TEST_PY, encoding='utf-8') as f:
+        source = f.read()
+    ciphertext = re.search(r'^ciphertext = "([^"]+)"', source, re.M).group(1)
+    user_header = re.search(r'^user_header = "([^"]+)"', source, re.M).group(1)
+    return ciphertext, user_header
+
+
+def reference_decode(t_base64: str, e_key_str: str) -> str:
+    """Ydecoder from test.py, step for step."""
+    encrypted = base64.b64decode(t_base64 + '=' * ((4 - len(t_base64) % 4) % 4))
+    cipher = AES.new(e_key_str.encode('utf-8'), AES.MODE_ECB)
+    decrypted = unpad(cipher.decrypt(encrypted), AES.block_size)
+    byte_array = bytes.fromhex(decrypted.hex())
+    decompressed = zlib.decompress(byte_array, wbits=-zlib.MAX_WBITS)
+    unescaped = urllib.parse.unquote(decompressed.decode('latin1'))
+    if unescaped.startswith('"'):
+        unescaped = unescaped[1:]
+    if unescaped.endswith('"'):
+        unescaped = unescaped[:-1]
+    return unescaped
+
+
+def reference_key(url: str, user_header: str) -> str:
+    """build_decryption_key from test.py: the header payload is gzip framed, so raw inflate fails on it."""
+    path = re.search(r'/api/[^?]+', url).group(0)
+    b64_key = base64.b64encode(f"coinglass{path}coinglass".encode()).decode()[:16]
+    encrypted = base64.b64decode(user_header)
+    decrypted = unpad(AES.new(b64_key.encode(), AES.MODE_ECB).decrypt(encrypted), AES.block_size)
+    return zlib.decompress(decrypted, wbits=31).decode()
+
+
+def reference_aes_stage(payload: str, key: str) -> bytes:
+    encrypted = base64.b64decode(payload + '=' * ((4 - len(payload) % 4) % 4))
+    return bytes.fromhex(AES.new(key.encode(), AES.MODE_ECB).decrypt(encrypted).hex())
+
+
+def make_payload(key: bytes, size: int) -> str:
+    actions = []
+    length = 0
+    while length * 0.35 < size:  # base64 of deflated JSON is ~1/3 of the JSON
+        actions.append(json.dumps({
+            "userAddress": f"0x{random.getrandbits(160):040x}", "symbol": random.choice(["BTC", "ETH", "SOL", "HYPE"]),
+            "side": random.choice([1, 2]), "positionValueUsd": round(random.uniform(1e5, 1e8), 2),
+            "entryPrice": round(random.uniform(0.1, 1e5), 4), "time": 1_750_000_000_000 + len(actions)
+        }))
+        length += len(actions[-1])
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    raw = compressor.compress(('[' + ','.join(actions) + ']').encode()) + compressor.flush()
+    return base64.b64encode(AES.new(key, AES.MODE_ECB).encrypt(pad(raw, AES.block_size))).decode()
+
+
+def random_action(index: int, wallets: list) -> dict:
+    return {
+        "userAddress": random.choice(wallets), "symbol": random.choice(["BTC", "ETH", "SOL", "HYPE"]),
+        "side": random.choice([1, 2]), "positionAction": random.choice([1, 1, 2]),
+        "positionValueUsd": round(random.uniform(1e4, 1e7), 2), "entryPrice": round(random.uniform(0.1, 1e5), 4),
+        "leverage": random.randint(1, 40), "time": int(time.time() * 1000) + index,
+    }
+
+
+def obfuscate(data, key: bytes) -> str:
+    """base64 of AES-ECB over gzip, as Coinglass sends it."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    raw = compressor.compress(json.dumps(data).encode()) + compressor.flush()
+    return base64.b64encode(AES.new(key, AES.MODE_ECB).encrypt(pad(raw, AES.block_size))).decode()
+
+
+class ActionStub:
+    """topPosition/action: the latest `window` actions, `batch` new ones per request."""
+
+    def __init__(self, batch: int, window: int, wallets: int):
+        self.batch = batch
+        self.window = window
+        self.wallets = [f"0x{random.getrandbits(160):040x}" for _ in range(wallets)]
+        self.actions = []
+        self.key = b'0123456789abcdef'
+        path_key = base64.b64encode(f"coinglass{TOP_POSITION_ACTION_PATH}coinglass".encode())[:16]
+        self.user_header = obfuscate(self.key.decode(), path_key)
+
+    async def handle(self, request: web.Request):
+        self.actions.extend(random_action(len(self.actions), self.wallets) for _ in range(self.batch))
+        self.actions = self.actions[-self.window:]
+        return web.json_response({'code': '0', 'data': obfuscate(self.actions[::-1], self.key)},
+                                 headers={'user': self.user_header})
+
+
+class CountingSink(Sink):
+    def __init__(self):
+        super().__init__('counting', max_queue=1 << 20)
+        self.events = 0
+
+    async def deliver(self, batch):
+        self.events += len(batch)
+
+
+async def end_to_end(polls: int, batch: int, window: int, wallets: int, port: int):
+    stub = ActionStub(batch, window, wallets)
+    app = web.Application()
+    app.router.add_get(TOP_POSITION_ACTION_PATH, stub.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    sink = CountingSink()
+    hub = AlertHub([sink])
+    await hub.start()
+    with tempfile.TemporaryDirectory() as directory:
+        archive = Archive(os.path.join(directory, 'archive'))
+        monitor = monitor_main.HyperliquidMonitor([], hub, FillStore(os.path.join(directory, 'fills.db')),
+                                                  archive=archive)
+        source = CoinglassSource(monitor.process_coinglass_actions, api_url=f'http://127.0.0.1:{port}')
+        await source.start()
+        await source.poll()  # baseline
+
+        flow_fills = monitor.analytics.buffer.count
+        start = time.perf_counter()
+        for _ in range(polls):
+            await source.poll()
+        polled = time.perf_counter() - start
+        await sink.drain(30.0)
+        elapsed = time.perf_counter() - start
+
+        archived = sum(len(rows) for rows in archive.pending.values()) + archive.archived
+        print(f"{polls} polls, {source.new_actions} new of {source.actions} decoded actions: "
+              f"{source.new_actions / elapsed:,.0f} actions/s to the sink "
+              f"({polled / polls * 1e3:.2f} ms/poll), {sink.events} alerts delivered, "
+              f"{archived} archive rows, {monitor.analytics.buffer.count - flow_fills} flow fills")
+        assert source.new_actions == polls * batch and archived == source.new_actions
+
+        await source.close()
+        await hub.stop()
+        monitor.fill_store.executor.shutdown()
+    await runner.cleanup()
+
+
+def throughput(fn, payloads: list, seconds: float) -> float:
+    size = sum(len(p) for p in payloads)
+    done = 0
+    start = time.perf_counter()
+    while True:
+        fn(payloads)
+        done += size
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return done / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='2896,65536,1048576,16777216', help="payload sizes (base64 chars)")
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--threads', default='1,2,4')
+    parser.add_argument('--seconds', type=float, default=1.0)
+    parser.add_argument('--polls', type=int, default=200, help="end to end: polls of the stub API")
+    parser.add_argument('--new-per-poll', type=int, default=20, help="end to end: new actions per poll")
+    parser.add_argument('--window', type=int, default=100, help="end to end: actions per response")
+    parser.add_argument('--port', type=int, default=8791)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)  # main logs every flow alert
+    random.seed(1)
+
+    ciphertext, user_header = load_sample()
+    decoder = CoinglassDecoder()
+    key = decoder.key_for(URL, user_header)
+
+    def ref_aes(batch):
+        for payload in batch:
+            reference_aes_stage(payload, reference_key(URL, user_header))
+
+    def aes(batch):
+        for payload in batch:
+            decoder._cipher(decoder.key_for(URL, user_header)).decrypt(base64.b64decode(payload))
+
+    sample = [ciphertext] * 100
+    ref, new = throughput(ref_aes, sample, args.seconds), throughput(aes, sample, args.seconds)
+    print(f"sample ({len(ciphertext):,} chars), base64 + AES only: test.py {ref:7.1f} MB/s  "
+          f"cached key/cipher {new:7.1f} MB/s  x{new / ref:.1f}")
+
+    print(f"{'payload':>10} {'test.py':>10} {'decrypt':>10} " + ' '.join(
+        f"{f'batch x{n}':>12}" for n in args.threads.split(',')))
+    for size in (int(size) for size in args.sizes.split(',')):
+        payload = make_payload(key, size)
+        assert decoder.decrypt(payload, key) == reference_decode(payload, key.decode())
+        count = max(1, min(args.batch, (64 << 20) // len(payload)))
+        batch = [payload] * count
+
+        ref = throughput(lambda b: [reference_decode(p, reference_key(URL, user_header)) for p in b],
+                         batch, args.seconds)
+        new = throughput(lambda b: [decoder.decrypt(p, decoder.key_for(URL, user_header)) for p in b], batch, args.seconds)
+        columns = []
+        for threads in (int(n) for n in args.threads.split(',')):
+            pooled = CoinglassDecoder(workers=threads)
+            columns.append(f"{throughput(lambda b: pooled.decrypt_many(b, key), batch, args.seconds):7.1f} MB/s")
+            pooled.close()
+        print(f"{len(payload):>10,} {ref:>5.1f} MB/s {new:>5.1f} MB/s " + ' '.join(f"{c:>12}" for c in columns))
+    print(f"{os.cpu_count()} cpus; decrypted to text, without json.loads")
+
+    asyncio.run(end_to_end(args.polls, args.new_per_poll, args.window, 2000, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Frames/sec through HyperliquidMonitor.handle_message for each decoder backend.
+
+Replays a recording made with WS_RECORD_PATH (--recording), or frames synthesized
+by replay.synthesize_frames from the fills stored in storage/.
+
+Run from the repo root: python -m benchmarks.bench_decoding
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+import main as monitor_main
+from decoding import FrameDecoder
+from fill_store import FillStore
+from replay import load_recording, synthesize_frames
+from sinks import LocalSender
+
+
+class LegacyMonitor(monitor_main.HyperliquidMonitor):
+    """handle_message as it was before FrameDecoder: full json.loads and a list lookup."""
+
+    async def handle_message(self, message: str):
+        data = json.loads(message)
+        if data.get('channel') == 'userFills' and data.get('data'):
+            user_data = data['data']
+            user_wallet = user_data.get('user', '').lower()
+            if user_wallet in self.wallet_addresses:
+                fills = user_data.get('fills')
+                if fills:
+                    self.process_fills_update(fills, user_wallet)
+        elif data.get('channel') == 'webData2' and data.get('data'):
+            user_data = data['data']
+            user_wallet = user_data.get('user', '').lower()
+            if user_wallet in self.wallet_addresses:
+                positions = user_data.get('clearinghouseState', {}).get('assetPositions')
+                if positions:
+                    self.process_position_update(positions, user_wallet)
+
+
+async def replay(monitor, frames: list) -> float:
+    start = time.perf_counter()
+    for frame in frames:
+        await monitor.handle_message(frame)
+    return time.perf_counter() - start
+
+
+async def run(args):
+    random.seed(1)
+    wallets = [f"0x{random.getrandbits(160):040x}" for _ in range(args.wallets)]
+    if args.recording:
+        frames = [message for _, message in load_recording(args.recording)]
+        wallets += sorted({frame.user for frame in map(FrameDecoder('json').decode, frames) if frame})
+    else:
+        frames = synthesize_frames(wallets, args.frames)
+    megabytes = sum(len(frame) for frame in frames) / 1e6
+
+    with tempfile.TemporaryDirectory() as directory:
+        fill_store = FillStore(os.path.join(directory, 'fills.db'))
+        variants = [("legacy json + list", LegacyMonitor, None)]
+        variants += [(f"FrameDecoder[{backend}]", monitor_main.HyperliquidMonitor, backend)
+                     for backend in ("json", "orjson", "msgspec")]
+
+        print(f"{len(frames)} frames ({megabytes:.1f} MB), {len(wallets)} wallets")
+        for name, cls, backend in variants:
+            monitor = cls(wallets, LocalSender(), fill_store)
+            if backend:
+                monitor.decoder = FrameDecoder(backend)
+                if monitor.decoder.backend != backend:
+                    continue
+            await replay(monitor, frames[:200])  # warm up fill dedup
+            elapsed = await replay(monitor, frames)
+            print(f"{name:<28} {len(frames) / elapsed:>10,.0f} frames/s {megabytes / elapsed:>8,.1f} MB/s")
+
+        fill_store.executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=5000)
+    parser.add_argument('--wallets', type=int, default=2000)
+    parser.add_argument('--recording', help="gzip recording written by FrameRecorder")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Per-frame persistence cost of FillStore vs. the old full JSON rewrite, as stored fills grow.
+
+Run from the repo root: python -m benchmarks.bench_fill_store
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from fill_store import FillStore
+
+WALLET = "0x3e051c89cd06e6867ce98c758fcc665d2148e1bb"
+
+
+def make_fill(tid: int) -> dict:
+    return {
+        "coin": "BTC", "px": "104250.0", "sz": "0.012", "side": "B", "time": int(time.time() * 1000),
+        "startPosition": "1.5", "dir": "Open Long", "closedPnl": "0.0",
+        "hash": "0x1a73e8e8ada02284bda90424951cb301fb0093743a2568c8e7e2f0e1045af6bc",
+        "oid": 98870166297, "crossed": True, "fee": "0.917428", "tid": tid, "feeToken": "USDC"
+    }
+
+
+def bench_store(directory: str, stored: int, frames: int, frame_size: int, flush_every: int):
+    store = FillStore(os.path.join(directory, f'fills_{stored}.db'))
+    chunk = 50_000
+    for start in range(0, stored, chunk):
+        store._write([(WALLET, f"BTC_{tid}", int(time.time() * 1000), json.dumps(make_fill(tid)))
+                      for tid in range(start, min(stored, start + chunk))])
+
+    add_time = flush_time = 0.0
+    tid = stored
+    for frame in range(frames):
+        fills = {}
+        for _ in range(frame_size):
+            fills[tid] = make_fill(tid)
+            tid += 1
+
+        start = time.perf_counter()
+        store.add(WALLET, fills)
+        add_time += time.perf_counter() - start
+
+        if (frame + 1) % flush_every == 0:
+            rows, store.pending = store.pending, []
+            start = time.perf_counter()
+            store._flush_batch(rows)
+            flush_time += time.perf_counter() - start
+
+    store.executor.shutdown()
+    store.db.close()
+    return add_time / frames, flush_time / frames
+
+
+def bench_legacy(directory: str, stored: int, frames: int, frame_size: int):
+    active_fills = {f"BTC_{tid}": make_fill(tid) for tid in range(stored)}
+    path = os.path.join(directory, 'active_fills_legacy.json')
+    tid = stored
+    start = time.perf_counter()
+    for _ in range(frames):
+        current_fills = {}
+        for _ in range(frame_size):
+            current_fills[f"BTC_{tid}"] = make_fill(tid)
+            tid += 1
+        active_fills = {**active_fills, **current_fills.copy()}
+        with open(path, 'w') as f:
+            f.write(json.dumps(active_fills))
+    return (time.perf_counter() - start) / frames
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--frame-size', type=int, default=20)
+    parser.add_argument('--flush-every', type=int, default=10, help="frames per write-behind batch")
+    parser.add_argument('--legacy-max', type=int, default=100000, help="skip the JSON rewrite above this size")
+    args = parser.parse_args()
+
+    print(f"{'stored':>10} {'add/frame':>12} {'flush/frame':>12} {'legacy/frame':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for stored in (int(size) for size in args.sizes.split(',')):
+            add, flush = bench_store(directory, stored, args.frames, args.frame_size, args.flush_every)
+            legacy = ''
+            if stored <= args.legacy_max:
+                legacy_frames = max(1, min(args.frames, 1_000_000 // stored))
+                legacy = f"{bench_legacy(directory, stored, legacy_frames, args.frame_size) * 1e3:10.2f} ms"
+            print(f"{stored:>10,} {add * 1e6:9.1f} us {flush * 1e6:9.1f} us {legacy:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Bytes per fill / position held in memory: raw decoded dicts vs. records.py.
+
+Fills are decoded from userFills-style JSON frames, the same way the websocket
+delivers them, and kept the way active_fills used to keep them ("<coin>_<tid>" ->
+dict) and the way it does now (tid -> FillRecord). Positions compare the webData2
+assetPositions dicts PositionTracker used to keep with PositionRecord.
+
+Run from the repo root: python -m benchmarks.bench_memory
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+
+from position_diff import position_side
+from records import FillRecord, PositionRecord
+from replay import web_data2_frame
+
+COINS = ["BTC", "ETH", "SOL", "HYPE", "XRP", "DOGE", "SUI", "kPEPE", "FARTCOIN", "ENA"]
+
+
+def fill_frames(count: int, per_frame: int = 50) -> list:
+    frames = []
+    for start in range(0, count, per_frame):
+        fills = []
+        for tid in range(start, min(count, start + per_frame)):
+            coin = random.choice(COINS)
+            fills.append({
+                "coin": coin, "px": f"{random.uniform(0.1, 100000):.2f}", "sz": f"{random.uniform(0.01, 100):.4f}",
+                "side": random.choice("AB"), "time": 1_750_000_000_000 + tid * 37, "startPosition": "1.5",
+                "dir": random.choice(["Open Long", "Close Long", "Open Short", "Close Short"]),
+                "closedPnl": f"{random.uniform(-1000, 1000):.6f}", "hash": f"0x{random.getrandbits(256):064x}",
+                "oid": 98_870_166_297 + tid, "crossed": True, "fee": f"{random.uniform(0, 10):.6f}",
+                "tid": 900_000_000_000_000 + tid, "feeToken": "USDC", "builderFee": "0.0"
+            })
+        frames.append(json.dumps({"channel": "userFills", "data": {"user": "0x0", "fills": fills}}))
+    return frames
+
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def raw_fills(frames: list):
+    fills = {}
+    for frame in frames:
+        for fill in json.loads(frame)['data']['fills']:
+            fills[f"{fill['coin']}_{fill['tid']}"] = fill
+    return fills
+
+
+def record_fills(frames: list):
+    fills = {}
+    for frame in frames:
+        for fill in json.loads(frame)['data']['fills']:
+            fills[fill['tid']] = FillRecord.from_dict(fill)
+    return fills
+
+
+def raw_positions(frames: list):
+    positions = []
+    for frame in frames:
+        current = {}
+        for item in json.loads(frame)['data']['clearinghouseState']['assetPositions']:
+            pos = item['position']
+            pos['side'] = position_side(pos)
+            current[f"{pos['coin']}_{pos['side']}"] = pos
+        positions.append(current)
+    return positions
+
+
+def record_positions(frames: list):
+    positions = []
+    for frame in frames:
+        current = {}
+        for item in json.loads(frame)['data']['clearinghouseState']['assetPositions']:
+            pos = item['position']
+            side = position_side(pos)
+            current[f"{pos['coin']}_{side}"] = PositionRecord.from_dict(pos, side)
+        positions.append(current)
+    return positions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fills', type=int, default=100000)
+    parser.add_argument('--wallets', type=int, default=2000, help="webData2 snapshots, one per wallet")
+    args = parser.parse_args()
+    random.seed(1)
+
+    frames = fill_frames(args.fills)
+    raw, compact = measure(lambda: raw_fills(frames)), measure(lambda: record_fills(frames))
+    print(f"fills:     {raw / args.fills:7.0f} B/fill raw dict  {compact / args.fills:7.0f} B/fill FillRecord  "
+          f"x{raw / compact:.1f}  (5000 fills x 1000 wallets: {raw * 5e6 / args.fills / 1e9:.1f} GB -> "
+          f"{compact * 5e6 / args.fills / 1e9:.1f} GB)")
+
+    frames = [web_data2_frame(f"0x{i:040x}", random.sample(COINS, 6)) for i in range(args.wallets)]
+    count = sum(len(json.loads(frame)['data']['clearinghouseState']['assetPositions']) for frame in frames)
+    raw, compact = measure(lambda: raw_positions(frames)), measure(lambda: record_positions(frames))
+    print(f"positions: {raw / count:7.0f} B/pos  raw dict  {compact / count:7.0f} B/pos  PositionRecord  "
+          f"x{raw / compact:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Cost of resuming a wallet after a restart/reconnect, and backfilling the gap.
+
+1. For wallets with 10 .. 100k stored fills, a fresh monitor processes the userFills
+   snapshot sent on subscribe: with the fill mark vs. reloading stored fills for dedup.
+2. A wallet that made more fills while disconnected than the snapshot holds is
+   backfilled from a local userFillsByTime stub.
+
+Fills come FILLS_PER_MS to a millisecond with random tids, as on Hyperliquid, where
+tids are not ordered; the snapshot and the backfill page both start in the middle
+of a millisecond.
+
+Run from the repo root: python -m benchmarks.bench_resume
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from aiohttp import web
+
+import main as monitor_main
+from backfill import FILLS_PAGE_SIZE, FillBackfill
+from fill_store import FillStore
+from sinks import LocalSender
+from benchmarks.bench_fill_store import make_fill
+
+SNAPSHOT_SIZE = 2000
+START_MS = 1_700_000_000_000
+FILLS_PER_MS = 3
+TIDS = []  # fill index -> random tid
+
+
+def fill_at(index: int) -> dict:
+    """The index-th fill of a wallet: FILLS_PER_MS fills a millisecond, in random tid order."""
+    if index >= len(TIDS):
+        rng = random.Random(len(TIDS))
+        TIDS.extend(rng.getrandbits(50) for _ in range(index + 1 - len(TIDS) + 100_000))
+    return {**make_fill(TIDS[index]), "time": START_MS + index // FILLS_PER_MS * 1000}
+
+
+def store_fills(fill_store: FillStore, wallet: str, indexes: range):
+    fill_store._write([(wallet, f"BTC_{fill['tid']}", fill['time'], json.dumps(fill))
+                       for fill in map(fill_at, indexes)])
+
+
+def reload_dedup(fill_store: FillStore, wallet: str, snapshot: list) -> int:
+    """Resume as before fill marks: reload the stored fills and dedup the snapshot by key."""
+    rows = fill_store.reader.execute("SELECT key, data FROM fills WHERE wallet = ? ORDER BY time DESC LIMIT ?",
+                                     (wallet, fill_store.max_fills_per_wallet)).fetchall()
+    known_fills = {key: json.loads(data) for key, data in rows}
+    return sum(1 for fill in snapshot if f"{fill['coin']}_{fill['tid']}" not in known_fills)
+
+
+def bench_resume(directory: str, stored: int, wallets: int, rounds: int):
+    fill_store = FillStore(os.path.join(directory, f'resume_{stored}.db'))
+    addresses = [f"0x{i:040x}" for i in range(wallets)]
+    for wallet in addresses:
+        store_fills(fill_store, wallet, range(stored))
+    snapshot = [fill_at(index) for index in range(max(0, stored - SNAPSHOT_SIZE), stored)]
+
+    marked = reloaded = float('inf')
+    for _ in range(rounds):
+        monitor = monitor_main.HyperliquidMonitor(addresses, LocalSender(), fill_store)
+        start = time.perf_counter()
+        for wallet in addresses:
+            monitor.process_fills_update(snapshot, wallet, is_snapshot=True)
+        marked = min(marked, time.perf_counter() - start)
+        assert not fill_store.pending, "snapshot fills below the mark were reprocessed"
+
+        start = time.perf_counter()
+        for wallet in addresses:
+            reload_dedup(fill_store, wallet, snapshot)
+        reloaded = min(reloaded, time.perf_counter() - start)
+
+    fill_store.executor.shutdown()
+    fill_store.db.close()
+    return marked / wallets, reloaded / wallets
+
+
+class UserFillsByTimeStub:
+    """Local stand-in for the info endpoint: serves one wallet's fills by time, paginated."""
+
+    def __init__(self, fills: list):
+        self.fills = fills
+        self.requests = 0
+
+    async def handle(self, request: web.Request):
+        body = await request.json()
+        self.requests += 1
+        page = [fill for fill in self.fills if body['startTime'] <= fill['time'] <= body['endTime']]
+        return web.json_response(page[:FILLS_PAGE_SIZE])
+
+
+async def bench_backfill(directory: str, gap: int, port: int):
+    wallet = "0x3e051c89cd06e6867ce98c758fcc665d2148e1bb"
+    fill_store = FillStore(os.path.join(directory, 'backfill.db'))
+    # The mark falls in the middle of a millisecond: the fills after it at that time are missed too
+    history = 100
+    store_fills(fill_store, wallet, range(history))
+    # Fills made while disconnected: more than the snapshot holds
+    missed = [fill_at(index) for index in range(history, history + gap)]
+    snapshot = missed[-SNAPSHOT_SIZE:]
+
+    stub = UserFillsByTimeStub(missed)
+    app = web.Application()
+    app.router.add_post('/info', stub.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    backfill = FillBackfill(f"http://127.0.0.1:{port}/info", rate=100)
+    await backfill.start()
+    monitor = monitor_main.HyperliquidMonitor([wallet], LocalSender(), fill_store, backfill=backfill)
+
+    start = time.perf_counter()
+    monitor.process_fills_update(snapshot, wallet, is_snapshot=True)
+    while wallet in monitor.resuming:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    processed = len(fill_store.pending)
+    mark_time, mark_tids = monitor.fill_mark(wallet)
+    print(f"backfill: {gap:,} fills missed, snapshot {len(snapshot):,}, {processed:,} processed "
+          f"({backfill.fetched:,} fetched in {stub.requests} requests, {elapsed * 1e3:.0f} ms), "
+          f"mark at {mark_time - START_MS} ms with {len(mark_tids)} tids")
+    newest = missed[-1]['time']
+    assert processed == gap, "missed fills were dropped or processed twice"
+    assert mark_time == newest and mark_tids == {fill['tid'] for fill in missed if fill['time'] == newest}
+
+    monitor.coalescer.flush_all()
+    await backfill.close()
+    await runner.cleanup()
+    fill_store.executor.shutdown()
+    fill_store.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10,1000,10000,100000')
+    parser.add_argument('--wallets', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--gap', type=int, default=5000)
+    parser.add_argument('--port', type=int, default=8791)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"{'stored':>10} {'mark/wallet':>12} {'reload/wallet':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        for stored in (int(size) for size in args.sizes.split(',')):
+            marked, reloaded = bench_resume(directory, stored, args.wallets, args.rounds)
+            print(f"{stored:>10,} {marked * 1e3:9.2f} ms {reloaded * 1e3:11.2f} ms")
+        asyncio.run(bench_backfill(directory, args.gap, args.port))
+
+
+if __name__ == '__main__':
+    main()
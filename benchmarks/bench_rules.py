@@ -0,0 +1,95 @@
+"""Rule evaluation cost per fill with hundreds of compiled rules loaded.
+
+Run from the repo root: python -m benchmarks.bench_rules
+"""
+import argparse
+import random
+import time
+
+from rules import FillFacts, RuleSet
+
+DIRECTIONS = ["Open Long", "Open Short", "Close Long", "Close Short", "Long > Short", "Short > Long"]
+
+
+def random_rule(i: int, coins: list, groups: dict) -> dict:
+    rule = {"name": f"rule-{i}"}
+    if random.random() < 0.95:
+        rule["coins"] = random.sample(coins, random.randint(1, 3))
+    if random.random() < 0.5:
+        rule["directions"] = random.sample(["Open", "Close", "Long", "Short"], random.randint(1, 2))
+    if random.random() < 0.3:
+        rule["groups"] = [random.choice(list(groups))]
+    if random.random() < 0.3:
+        rule["leverage"] = random.choice(["cross", "isolated"])
+    if "coins" in rule and random.random() < 0.03:
+        rule["action"] = "drop"
+    rule["min_notional"] = random.choice([10_000, 100_000, 1_000_000, 5_000_000])
+    rule["max_age"] = 3600
+    return rule
+
+
+def random_fill(coins: list, wallets: list, now: float) -> tuple:
+    fill = {
+        "coin": random.choice(coins), "px": str(random.uniform(0.1, 100_000)), "sz": str(random.uniform(0.01, 500)),
+        "side": random.choice("AB"), "time": int((now - random.uniform(0, 7200)) * 1000),
+        "startPosition": str(random.uniform(-5000, 5000)), "dir": random.choice(DIRECTIONS),
+        "closedPnl": "0.0", "crossed": random.random() < 0.7, "tid": random.getrandbits(48),
+    }
+    return fill, random.choice(wallets)
+
+
+def linear_match(rules, facts: FillFacts):
+    for rule in rules:
+        if rule.action == 'drop' and (rule.coins is None or facts.coin in rule.coins) and \
+                (rule.wallets is None or facts.wallet in rule.wallets) and rule.predicate(facts):
+            return None
+    for rule in rules:
+        if rule.action == 'alert' and (rule.coins is None or facts.coin in rule.coins) and \
+                (rule.wallets is None or facts.wallet in rule.wallets) and rule.predicate(facts):
+            return rule.name
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rules', type=int, default=500)
+    parser.add_argument('--fills', type=int, default=100_000)
+    parser.add_argument('--coins', type=int, default=150)
+    parser.add_argument('--wallets', type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(7)
+    coins = [f"COIN{i}" for i in range(args.coins)]
+    wallets = [f"0x{random.getrandbits(160):040x}" for _ in range(args.wallets)]
+    groups = {f"group-{i}": random.sample(wallets, 50) for i in range(10)}
+    config = {"groups": groups, "rules": [random_rule(i, coins, groups) for i in range(args.rules)]}
+
+    start = time.perf_counter()
+    rule_set = RuleSet.from_config(config)
+    compile_ms = (time.perf_counter() - start) * 1e3
+
+    now = time.time()
+    fills = [random_fill(coins, wallets, now) for _ in range(args.fills)]
+
+    start = time.perf_counter()
+    facts = [FillFacts.from_fill(fill, wallet, now) for fill, wallet in fills]
+    facts_ns = (time.perf_counter() - start) / len(fills) * 1e9
+
+    start = time.perf_counter()
+    indexed = [rule_set.match(f) for f in facts]
+    indexed_ns = (time.perf_counter() - start) / len(fills) * 1e9
+
+    start = time.perf_counter()
+    linear = [linear_match(rule_set.rules, f) for f in facts]
+    linear_ns = (time.perf_counter() - start) / len(fills) * 1e9
+
+    assert [m is None for m in indexed] == [m is None for m in linear]
+    print(f"{args.rules} rules compiled in {compile_ms:.1f} ms, {sum(m is not None for m in indexed)} of "
+          f"{len(fills)} fills alert")
+    print(f"fill facts:         {facts_ns:8.0f} ns/fill")
+    print(f"indexed evaluation: {indexed_ns:8.0f} ns/fill")
+    print(f"linear evaluation:  {linear_ns:8.0f} ns/fill")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Alert fan-out throughput through AlertHub with 1 to 10 sinks.
+
+Sinks cycle through jsonl (a temp file), webhook (a local aiohttp stub) and
+pubsub (a unix socket with one subscriber reading). Alerts are fills
+LazyMessages published back to back with AlertHub.publish, as the monitor does.
+The table shows:
+- publish: time the caller spends per alert
+- end to end: alerts/s until every sink has delivered all of them
+The last rows add a stalled sink that takes 1 s per batch, with each policy.
+The other sinks' rates should not change, and publish never waits on the
+stalled one (a full block sink drops its oldest alert on publish).
+
+Run from the repo root: python -m benchmarks.bench_sinks
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+from aiohttp import web
+
+from sinks import AlertHub, BLOCK, DROP_OLDEST, JsonlSink, PubSubSink, Sink, SPILL, WebhookSink
+from templates import fills_message
+from benchmarks.bench_templates import random_fill
+
+WALLET = "0x3e051c89cd06e6867ce98c758fcc665d2148e1bb"
+
+
+class WebhookStub:
+    def __init__(self):
+        self.events = 0
+
+    async def handle(self, request: web.Request):
+        self.events += len(await request.json())
+        return web.Response()
+
+
+class Subscriber:
+    def __init__(self):
+        self.events = 0
+
+    async def run(self, path: str):
+        reader, writer = await asyncio.open_unix_connection(path)
+        try:
+            while await reader.readline():
+                self.events += 1
+        finally:
+            writer.close()
+
+
+class StalledSink(Sink):
+    async def deliver(self, batch):
+        await asyncio.sleep(1.0)
+
+
+async def run(count: int, sinks: int, directory: str, port: int, stalled: str = ''):
+    stub = WebhookStub()
+    app = web.Application(client_max_size=64 << 20)
+    app.router.add_post('/alerts', stub.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    built = []
+    options = {'max_queue': count}  # nothing is dropped from the measured sinks
+    for i in range(sinks):
+        kind = ('jsonl', 'webhook', 'pubsub')[i % 3]
+        if kind == 'jsonl':
+            built.append(JsonlSink(os.path.join(directory, f'alerts-{i}.jsonl'), name=f'jsonl-{i}', **options))
+        elif kind == 'webhook':
+            built.append(WebhookSink(f'http://127.0.0.1:{port}/alerts', name=f'webhook-{i}', **options))
+        else:
+            built.append(PubSubSink(os.path.join(directory, f'alerts-{i}.sock'), name=f'pubsub-{i}', **options))
+    if stalled:
+        built.append(StalledSink('stalled', max_queue=1000, policy=stalled, batch_size=100,
+                                 spill_path=os.path.join(directory, 'spill.jsonl')))
+    hub = AlertHub(built)
+    await hub.start()
+
+    subscribers = []
+    for sink in built:
+        if isinstance(sink, PubSubSink):
+            subscriber = Subscriber()
+            subscribers.append((subscriber, asyncio.create_task(subscriber.run(sink.path))))
+    while any(isinstance(sink, PubSubSink) and not sink.clients for sink in built):
+        await asyncio.sleep(0.01)
+
+    now_ms = int(time.time() * 1000)
+    messages = [fills_message(random_fill(now_ms), WALLET) for _ in range(count)]
+    measured = [sink for sink in built if not isinstance(sink, StalledSink)]
+
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        hub.publish(message)
+        if i % 1000 == 999:
+            await asyncio.sleep(0)  # live alerts arrive spread over loop iterations
+    published = time.perf_counter() - start
+    while (any(sink.delivered < count for sink in measured)
+           or any(subscriber.events < count for subscriber, _ in subscribers)
+           or stub.events < count * sum(isinstance(sink, WebhookSink) for sink in measured)):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    stalled_sink = built[-1] if stalled else None
+    summary = (f"stalled: {stalled_sink.delivered} delivered, {stalled_sink.dropped} dropped, "
+               f"{stalled_sink.spilled} spilled") if stalled_sink else ""
+    for _, task in subscribers:
+        task.cancel()
+    for sink in built:
+        await sink.close()
+    await runner.cleanup()
+    return published / count, count / elapsed, summary
+
+
+async def main_async(args):
+    random.seed(1)
+    print(f"{'sinks':>6} {'publish':>12} {'end to end':>16}")
+    with tempfile.TemporaryDirectory() as directory:
+        for sinks in range(1, args.max_sinks + 1):
+            per_alert, rate, _ = await run(args.alerts, sinks, directory, args.port)
+            print(f"{sinks:>6} {per_alert * 1e6:>9.2f} µs {rate:>10,.0f} alerts/s")
+        for policy in (DROP_OLDEST, BLOCK, SPILL):
+            per_alert, rate, summary = await run(args.alerts, 3, directory, args.port, stalled=policy)
+            print(f"{'3+1':>6} {per_alert * 1e6:>9.2f} µs {rate:>10,.0f} alerts/s  ({policy}; {summary})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--alerts', type=int, default=10000)
+    parser.add_argument('--max-sinks', type=int, default=10)
+    parser.add_argument('--port', type=int, default=8792)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Latency/throughput benchmark of TelegramSender against a local fake Telegram API.
+
+Run from the repo root: python -m benchmarks.bench_telegram
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from collections import deque
+
+from aiohttp import web
+
+from telegram_sender import TelegramSender
+
+
+class FakeTelegram:
+    """sendMessage that answers `responses` ((status, body text) pairs) first, then 200s with
+    a 429 every `throttle_every` requests. Message texts are the sender's perf_counter()."""
+
+    def __init__(self, latency: float = 0.0, throttle_every: int = 0, responses=()):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.responses = deque(responses)
+        self.requests = 0
+        self.received = []  # (perf_counter(), chat_id) of every request
+        self.delays = []
+
+    async def send_message(self, request: web.Request):
+        payload = await request.json()
+        self.requests += 1
+        self.received.append((time.perf_counter(), payload['chat_id']))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.responses:
+            status, text = self.responses.popleft()
+            return web.Response(status=status, text=text, content_type='application/json')
+        if self.throttle_every and self.requests % self.throttle_every == 0:
+            return web.json_response(
+                {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.05}}, status=429)
+        self.delays.append(time.perf_counter() - float(payload['text']))
+        return web.json_response({"ok": True, "result": {}})
+
+
+async def loop_lag_probe(samples: list, interval: float = 0.01):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def serve(fake: FakeTelegram):
+    """Start the fake API on a free port; returns (runner, api_url)."""
+    app = web.Application()
+    app.router.add_post('/bot{token}/sendMessage', fake.send_message)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    return runner, f'http://127.0.0.1:{runner.addresses[0][1]}'
+
+
+async def run(args):
+    fake = FakeTelegram(args.latency, args.throttle_every)
+    runner, api_url = await serve(fake)
+
+    sender = TelegramSender('bench', 'chat-0', api_url=api_url,
+                            global_rate=args.global_rate, chat_rate=args.chat_rate,
+                            chat_burst=args.chat_rate)
+    await sender.start()
+
+    lags = []
+    probe = asyncio.create_task(loop_lag_probe(lags))
+
+    start = time.perf_counter()
+    for i in range(args.messages):
+        await sender.queue_message(repr(time.perf_counter()), chat_id=f'chat-{i % args.chats}')
+    await sender.join()
+    elapsed = time.perf_counter() - start
+
+    probe.cancel()
+    await sender.stop()
+    await runner.cleanup()
+
+    delays = sorted(fake.delays)
+    print(f"messages:   {len(delays)} delivered, {sender.failed_count} failed, "
+          f"{fake.requests - len(delays)} throttled by fake server")
+    print(f"throughput: {len(delays) / elapsed:,.0f} msg/s over {args.chats} chats")
+    print(f"latency:    p50 {statistics.median(delays) * 1e3:.1f} ms, "
+          f"p99 {delays[int(len(delays) * 0.99) - 1] * 1e3:.1f} ms")
+    print(f"loop lag:   max {max(lags, default=0) * 1e3:.1f} ms")
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.005, help="fake server response time (s)")
+    parser.add_argument('--throttle-every', type=int, default=100, help="answer every Nth request with 429")
+    parser.add_argument('--global-rate', type=float, default=100000)
+    parser.add_argument('--chat-rate', type=float, default=100000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
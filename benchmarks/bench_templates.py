@@ -0,0 +1,228 @@
+"""Alerts rendered per second: the f-string formatters main.py used to have vs. templates.py.
+
+The legacy functions below are the old HyperliquidMonitor.format_*_message,
+copied unchanged. Three numbers for the templates:
+- eager: build the LazyMessage and render it right away
+- lazy: only build it. This is what the hot path pays for an alert that is
+  dropped or merged before it leaves the queue.
+- text: render the plain-text variant
+- uncached: eager with the number/timestamp/text fragment caches disabled.
+  The other columns replay the same alerts, so their fragments are always cached.
+tests/test_templates.py checks the templates against the legacy output.
+
+Run from the repo root: python -m benchmarks.bench_templates
+"""
+import argparse
+import datetime
+import logging
+import random
+import time
+from typing import Dict
+
+from analytics import FlowAlert, FlowRule
+from position_diff import POSITION_CLOSED, POSITION_OPENED, POSITION_RESIZED
+from records import PositionRecord
+import templates
+from templates import fills_message, flow_message, position_message
+
+logger = logging.getLogger(__name__)
+
+COINS = ["BTC", "ETH", "SOL", "HYPE", "XRP", "DOGE", "SUI", "kPEPE"]
+DIRECTIONS = ["Open Long", "Open Short", "Close Long", "Close Short"]
+
+
+def legacy_position_message(position: PositionRecord, action: str, wallet_address: str) -> str:
+    symbol = position.coin_name
+    side = position.side
+    leverage_value = position.leverage_value
+    leverage_type = position.leverage_type
+    pnl_float = position.unrealized_pnl
+
+    size_formatted = f"{position.szi:,.4f}".rstrip('0').rstrip('.')
+    entry_price_formatted = f"{position.entry_px:,.4f}".rstrip('0').rstrip('.')
+    pnl_formatted = f"{pnl_float:,.2f}"
+
+    is_long = side in ("A", "long")  # A = Long (خرید), B = Short (فروش)
+    if action == POSITION_OPENED:
+        emoji = "🟢" if is_long else "🔴"
+    elif action == POSITION_RESIZED:
+        emoji = "🟡"
+    else:
+        emoji = "⚪"
+
+    pnl_emoji = "💰" if pnl_float > 0 else "💸" if pnl_float < 0 else "💱"
+
+    side_text = "Buy (Long)" if is_long else "Sell (Short)" if side in ("B", "short") else side
+
+    message = f"""
+{emoji} <b>Position {action} {leverage_value}x {leverage_type}</b>
+
+💎 <b>Coin:</b> {symbol}
+📊 <b>Type:</b> {side_text}  
+📏 <b>Margin:</b> {size_formatted}
+💵 <b>Entry:</b> ${entry_price_formatted}
+{pnl_emoji} <b>Pnl:</b> ${pnl_formatted}
+
+🕐 <b>Time:</b> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+🔗 <b>Wallet:</b> <code>{wallet_address[-8:]}</code>
+    """.strip()
+
+    return message
+
+
+def legacy_fills_message(position: Dict, wallet_address: str) -> str:
+    symbol = position.get('coin', 'N/A')
+    side = position.get('side', 'N/A')
+    dir = position.get('dir', 'N/A')
+    entry_price = position.get('px', '0')
+    margin = float(position.get('sz', '0'))
+    amount = abs(float(position.get('startPosition', '0')))
+    time = position.get('time', '0')
+    date = datetime.datetime.fromtimestamp(time / 1e3)
+    closed_pnl = position.get('closedPnl', '0')
+    leverage_type = 'Cross' if position.get('crossed') else 'Isolate'
+
+    try:
+        size_float = float(margin)
+        entry_price_float = float(entry_price)
+        pnl_float = float(closed_pnl)
+
+        size_formatted = f"{size_float:,.4f}".rstrip('0').rstrip('.')
+        entry_price_formatted = f"{entry_price_float:,.4f}".rstrip('0').rstrip('.')
+        pnl_formatted = f"{pnl_float:,.2f}"
+        amount_formatted = f"{amount:,.2f}"
+
+    except (ValueError, TypeError):
+        size_formatted = margin
+        entry_price_formatted = entry_price
+        pnl_formatted = closed_pnl
+        pnl_float = 0
+        amount_formatted = 0
+    except Exception as e:
+        logger.error(f"Format Message Error: {e}")
+
+    # فیلتر هشدارها در alert_rules.json انجام می‌شود
+    if "Open" in dir:
+        emoji = "🔵" if side == "A" else "🔵"  # A = Long (خرید), B = Short (فروش)
+    else:
+        emoji = "⚪"
+
+    if 'Long' in dir:
+        side_text = "🟢 Buy (Long)"
+    elif 'Short' in dir:
+        side_text = "🔴 Sell (Short)"
+    else:
+        side_text = 'N/A'
+
+    if not pnl_float:
+        pnl_float = 0
+
+    pnl_emoji = "💰" if pnl_float > 0 else "💸" if pnl_float < 0 else "💱"
+
+    # تعداد فیل‌های تجمیع‌شده توسط coalescer
+    fill_count = position.get('fillCount', 1)
+    fills_formatted = f" ×{fill_count} fills" if fill_count > 1 else ""
+
+    message = f"""
+{emoji} <b>{dir} ({leverage_type})</b>
+
+🆔 <b>id:</b> <code>{position.get('tid', 'N/A')}</code>
+💎 <b>Symbol:</b> {symbol}
+📊 <b>Type:</b> {side_text}  
+📏 <b>Margin:</b> {size_formatted} (${amount_formatted}){fills_formatted}
+💵 <b>Entry:</b> {entry_price_formatted}
+{pnl_emoji} <b>Pnl:</b> {pnl_formatted}
+🕐 <b>Time:</b> {date.strftime('%Y-%m-%d %H:%M:%S')}
+🔗 <b>Wallet:</b> <a href="https://www.coinglass.com/hyperliquid/{wallet_address}">{wallet_address}</a>
+    """.strip()
+
+    return message
+
+
+def legacy_flow_message(alert: FlowAlert) -> str:
+    emoji = "🟢" if alert.rule.side == "long" else "🔴"
+    window = f"{alert.rule.window // 60}m" if alert.rule.window >= 60 else f"{alert.rule.window}s"
+    flow_emoji = "📈" if alert.net_flow >= 0 else "📉"
+
+    message = f"""
+🐋 <b>Whale Flow: {alert.coin} {alert.rule.side.title()}</b>
+
+{emoji} <b>{alert.wallets}</b> tracked wallets opened <b>${alert.notional:,.0f}</b> {alert.rule.side} in {window}
+{flow_emoji} <b>Net flow:</b> ${alert.net_flow:,.0f}
+🕐 <b>Time:</b> {datetime.datetime.fromtimestamp(alert.time / 1e3).strftime('%Y-%m-%d %H:%M:%S')}
+    """.strip()
+
+    return message
+
+
+def random_fill(now_ms: int) -> Dict:
+    return {
+        "coin": random.choice(COINS), "px": f"{random.choice([0.1, 1, 100, 3000, 100000]) * random.random():.4f}",
+        "sz": f"{random.uniform(0.01, 500):.3f}", "side": random.choice("AB"), "dir": random.choice(DIRECTIONS),
+        "startPosition": f"{random.uniform(-5000, 5000):.3f}", "closedPnl": f"{random.uniform(-1000, 1000):.2f}",
+        "crossed": random.random() < 0.7, "tid": random.getrandbits(48),
+        "time": now_ms - random.randint(0, 60_000), "fillCount": random.choice([1, 1, 1, 2, 5]),
+    }
+
+
+def random_position() -> PositionRecord:
+    return PositionRecord.from_dict({
+        "coin": random.choice(COINS), "szi": f"{random.uniform(-500, 500):.4f}",
+        "entryPx": f"{random.uniform(0.1, 100000):.2f}", "unrealizedPnl": f"{random.uniform(-1e4, 1e4):.2f}",
+        "leverage": {"type": random.choice(["cross", "isolated"]), "value": random.randint(1, 50)}
+    }, random.choice(["long", "short"]))
+
+
+def random_flow(now_ms: int) -> FlowAlert:
+    rule = FlowRule(side=random.choice(["long", "short"]), window=random.choice([30, 300]), min_wallets=2,
+                    min_notional=1e5)
+    return FlowAlert(rule, random.choice(COINS), random.randint(2, 20), random.uniform(1e5, 1e8),
+                     random.uniform(-1e8, 1e8), now_ms)
+
+
+def rate(fn, items: list, seconds: float) -> float:
+    done = 0
+    start = time.perf_counter()
+    while True:
+        for item in items:
+            fn(*item)
+        done += len(items)
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--alerts', type=int, default=5000)
+    parser.add_argument('--seconds', type=float, default=1.0)
+    args = parser.parse_args()
+    random.seed(1)
+    now_ms = int(time.time() * 1000)
+    wallet = "0x3e051c89cd06e6867ce98c758fcc665d2148e1bb"
+
+    fills = [(random_fill(now_ms), wallet) for _ in range(args.alerts)]
+    actions = [POSITION_OPENED, POSITION_RESIZED, POSITION_CLOSED]
+    positions = [(random_position(), random.choice(actions), wallet) for _ in range(args.alerts)]
+    flows = [(random_flow(now_ms),) for _ in range(args.alerts)]
+
+    print(f"{'alerts/s':<10} {'legacy':>10} {'eager':>10} {'lazy':>11} {'text':>10} {'uncached':>10}")
+    for name, items, legacy, new in [
+        ('fills', fills, legacy_fills_message, fills_message),
+        ('position', positions, legacy_position_message, position_message),
+        ('flow', flows, legacy_flow_message, flow_message),
+    ]:
+        old = rate(legacy, items, args.seconds)
+        eager = rate(lambda *item: new(*item).render(), items, args.seconds)
+        lazy = rate(new, items, args.seconds)
+        text = rate(lambda *item: new(*item).render('text'), items, args.seconds)
+        cache_size, templates.FRAGMENT_CACHE_SIZE = templates.FRAGMENT_CACHE_SIZE, 0
+        templates.clear_fragment_caches()
+        uncached = rate(lambda *item: new(*item).render(), items, args.seconds)
+        templates.FRAGMENT_CACHE_SIZE = cache_size
+        print(f"{name:<10} {old:>10,.0f} {eager:>10,.0f} {lazy:>11,.0f} {text:>10,.0f} {uncached:>10,.0f}  "
+              f"eager x{eager / old:.1f}, lazy x{lazy / old:.1f}, uncached x{uncached / old:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Throughput of the worker pool from 1 to N processes on replayed traffic.
+
+Frames come from a recording made with WS_RECORD_PATH (--recording) or from
+replay.synthesize_frames. The single-process HyperliquidMonitor is the baseline.
+Every run starts on an empty fill store so each one does the full dedup/alert work.
+
+Run from the repo root: python -m benchmarks.bench_workers
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+import main as monitor_main
+from decoding import FrameDecoder
+from fill_store import FillStore
+from replay import load_recording, synthesize_frames
+from sinks import LocalSender
+from workers import WorkerPool
+from benchmarks.bench_decoding import replay
+
+
+async def run_pool(workers: int, wallets: list, frames: list, directory: str, chunk: int):
+    pool = WorkerPool(workers, wallets, LocalSender().publish, lambda fills, wallet: None,
+                      os.path.join(directory, f'pool-{workers}.db'), coalesce_window=0.5,
+                      log_level=logging.INFO)
+    await pool.start()
+    start = time.perf_counter()
+    for i in range(0, len(frames), chunk):
+        for frame in frames[i:i + chunk]:
+            pool.submit(frame)
+        await asyncio.sleep(0)  # one batch per worker per loop iteration, as with live traffic
+    submitted = time.perf_counter() - start
+    await pool.drain()
+    elapsed = time.perf_counter() - start
+    await pool.stop()
+    return elapsed, submitted
+
+
+async def run(args):
+    random.seed(1)
+    wallets = [f"0x{random.getrandbits(160):040x}" for _ in range(args.wallets)]
+    if args.recording:
+        frames = [message for _, message in load_recording(args.recording)]
+        wallets += sorted({frame.user for frame in map(FrameDecoder('json').decode, frames) if frame})
+    else:
+        frames = synthesize_frames(wallets, args.frames)
+    megabytes = sum(len(frame) for frame in frames) / 1e6
+    # Cores this process may run on, which can be fewer than os.cpu_count() in a container
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    max_workers = args.max_workers or cores
+
+    with tempfile.TemporaryDirectory() as directory:
+        fill_store = FillStore(os.path.join(directory, 'single.db'))
+        monitor = monitor_main.HyperliquidMonitor(wallets, LocalSender(), fill_store)
+        baseline = await replay(monitor, frames)
+        fill_store.executor.shutdown()
+
+        print(f"{len(frames)} frames ({megabytes:.1f} MB), {len(wallets)} wallets, {cores} usable cores")
+        if cores < 2:
+            print("only one usable core: the workers share it with the front end, so this measures overhead, "
+                  "not speedup")
+        print(f"{'single process':<16} {len(frames) / baseline:>10,.0f} frames/s")
+        for workers in range(1, max_workers + 1):
+            elapsed, submitted = await run_pool(workers, wallets, frames, directory, args.chunk)
+            # front end = event loop time spent peeking and handing frames to the workers
+            print(f"{f'{workers} workers':<16} {len(frames) / elapsed:>10,.0f} frames/s  "
+                  f"x{baseline / elapsed:.2f}  front end {submitted / len(frames) * 1e6:.1f} µs/frame")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--wallets', type=int, default=2000)
+    parser.add_argument('--recording', help="gzip recording written by FrameRecorder")
+    parser.add_argument('--max-workers', type=int, default=0, help="default: usable cores")
+    parser.add_argument('--chunk', type=int, default=200, help="frames arriving per loop iteration")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
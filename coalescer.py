@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram_sender import TelegramSender, TELEGRAM_MAX_MESSAGE_LENGTH
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+
+
+def merge_fills(fills: List[Dict]) -> List[Dict]:
+    """Collapse partial fills of the same order into one fill (summed size/pnl, VWAP price)."""
+    merged: Dict[Tuple, Dict] = OrderedDict()
+    seen_tids = set()
+
+    for fill in fills:
+        tid = fill.get('tid')
+        if tid in seen_tids:
+            continue
+        seen_tids.add(tid)
+
+        key = (fill.get('oid', tid), fill.get('dir'))
+        current = merged.get(key)
+        if current is None:
+            merged[key] = dict(fill)
+            continue
+
+        try:
+            sz_a, sz_b = float(current['sz']), float(fill['sz'])
+            total = sz_a + sz_b
+            if total:
+                current['px'] = str((float(current['px']) * sz_a + float(fill['px']) * sz_b) / total)
+            current['sz'] = str(total)
+            current['closedPnl'] = str(float(current.get('closedPnl', 0)) + float(fill.get('closedPnl', 0)))
+            current['fee'] = str(float(current.get('fee', 0)) + float(fill.get('fee', 0)))
+        except (KeyError, ValueError, TypeError):
+            pass
+        # startPosition stays from the first fill, time/tid move to the latest one
+        current['time'] = fill.get('time', current.get('time'))
+        current['tid'] = tid
+        current['fillCount'] = current.get('fillCount', 1) + 1
+
+    return list(merged.values())
+
+
+class Digest:
+    """Several alerts sent as one Telegram message; structured sinks get them one by one."""
+    __slots__ = ('messages',)
+
+    def __init__(self, messages: List):
+        self.messages = messages
+
+    def render(self, fmt: str = 'html') -> str:
+        return DIGEST_SEPARATOR.join(m if isinstance(m, str) else m.render(fmt) for m in self.messages)
+
+    def __str__(self):
+        return self.render()
+
+
+def build_digests(messages: List, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List:
+    """Packs messages into Digests of at most max_length characters; a message left alone stays as it is."""
+    groups = []
+    current = []
+    length = 0
+    for message in messages:
+        size = len(str(message))
+        if current and length + len(DIGEST_SEPARATOR) + size <= max_length:
+            current.append(message)
+            length += len(DIGEST_SEPARATOR) + size
+        else:
+            if current:
+                groups.append(current)
+            current = [message]
+            length = size
+    if current:
+        groups.append(current)
+    return [group[0] if len(group) == 1 else Digest(group) for group in groups]
+
+
+class FillCoalescer:
+    def __init__(self, telegram_sender: TelegramSender, formatter: Callable[[Dict, str], object],
+                 window: float = 2.0, max_pending: int = 200,
+                 max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH,
+                 predicate: Optional[Callable[[Dict, str], bool]] = None):
+        self.telegram_sender = telegram_sender
+        self.formatter = formatter
+        self.predicate = predicate
+        self.window = window
+        self.max_pending = max_pending
+        self.max_length = max_length
+
+        self.pending: Dict[Tuple[str, str], List[Dict]] = {}  # (wallet, coin) -> fills
+        self.timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+
+        self.fills_in = 0
+        self.alerts_out = 0
+        self.messages_out = 0
+
+    def add(self, wallet_address: str, fill: Dict):
+        key = (wallet_address, fill.get('coin'))
+        bucket = self.pending.get(key)
+        if bucket is None:
+            bucket = self.pending[key] = []
+            self.timers[key] = asyncio.get_running_loop().call_later(self.window, self.flush, key)
+
+        bucket.append(fill)
+        self.fills_in += 1
+
+        if len(bucket) >= self.max_pending:
+            self.flush(key)
+
+    def flush(self, key: Tuple[str, str]):
+        fills = self.pending.pop(key, None)
+        timer = self.timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        if not fills:
+            return
+
+        wallet_address = key[0]
+        merged = merge_fills(fills)
+        if self.predicate:
+            # Rules run on the merged fills, before any formatting work
+            merged = [fill for fill in merged if self.predicate(fill, wallet_address)]
+        messages = [m for m in (self.formatter(fill, wallet_address) for fill in merged) if m]
+        if not messages:
+            return
+
+        created_at = min(fill.get('time', 0) for fill in fills) / 1e3 or time.time()
+        self.alerts_out += len(messages)
+        if len(messages) > 1:
+            # Splitting into digests needs their length; LazyMessage keeps the rendering for the sender
+            messages = build_digests(messages, self.max_length)
+        for digest in messages:
+            self.messages_out += 1
+            self.telegram_sender.publish(digest, created_at=created_at)
+
+    def flush_all(self):
+        for key in list(self.pending):
+            self.flush(key)
+
+    def metrics(self) -> Dict[str, float]:
+        lag = sorted(self.telegram_sender.lag_samples)
+        return {
+            'queue_depth': self.telegram_sender.qsize(),
+            'pending_fills': sum(len(fills) for fills in self.pending.values()),
+            'fills_in': self.fills_in,
+            'messages_out': self.messages_out,
+            'coalescing_ratio': self.fills_in / self.messages_out if self.messages_out else 0.0,
+            'alert_lag_p50': lag[len(lag) // 2] if lag else 0.0,
+            'alert_lag_p99': lag[int(len(lag) * 0.99)] if lag else 0.0,
+        }
+
+    async def report(self, interval: float = 60.0):
+        while True:
+            await asyncio.sleep(interval)
+            m = self.metrics()
+            logger.info(
+                f"Alerts: queue={m['queue_depth']} pending={m['pending_fills']} "
+                f"ratio={m['coalescing_ratio']:.1f} lag_p50={m['alert_lag_p50']:.1f}s "
+                f"lag_p99={m['alert_lag_p99']:.1f}s"
+            )
@@ -0,0 +1,317 @@
+"""Decoding of Coinglass API responses, and a poller for topPosition/action.
+
+Coinglass obfuscates the `data` field of its responses: base64 of AES-128-ECB
+(PKCS7) over a deflate stream. The AES key is itself sent encrypted in the
+`user` response header, under a key derived from the API path:
+
+    path_key = base64("coinglass" + path + "coinglass")[:16]
+    key      = decode(user_header, path_key)
+    data     = decode(response['data'], key)
+
+The browser decodes the inflated bytes with decodeURIComponent(escape(...)),
+i.e. as UTF-8. Derived keys and cipher objects are cached; large payloads are
+decrypted and inflated in chunks, and batches are spread over a thread pool
+(AES and zlib release the GIL on large buffers).
+
+Each topPosition action is parsed into a CoinglassAction: `side` 1 is long and
+2 short, `positionAction` 1 opens and 2 closes (opens when missing), and the
+size is `positionSize` or, without it, `positionValueUsd / entryPrice`.
+"""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import re
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+from Crypto.Cipher import AES
+
+from position_diff import POSITION_CLOSED, POSITION_OPENED
+from records import COINS, PositionRecord
+
+logger = logging.getLogger(__name__)
+
+COINGLASS_API_URL = "https://capi.coinglass.com"
+TOP_POSITION_ACTION_PATH = "/api/hyperliquid/topPosition/action"
+
+CHUNK_SIZE = 256 * 1024  # ciphertext bytes per decrypt/inflate step
+# base64 characters per step: whole base64 quanta (3 bytes) that also hold whole AES blocks (16 bytes)
+_B64_CHUNK = CHUNK_SIZE // 48 * 64
+_PATH_RE = re.compile(r'/api/[^?#]+')
+
+
+class CoinglassDecodeError(ValueError):
+    pass
+
+
+def _wbits(head: bytes) -> int:
+    # Responses seen so far are gzip framed; keep raw deflate (as the JS client assumes) working too
+    if head[:2] == b'\x1f\x8b':
+        return 16 + zlib.MAX_WBITS
+    if head[:1] == b'\x78':
+        return zlib.MAX_WBITS
+    return -zlib.MAX_WBITS
+
+
+def _strip_quotes(text: str) -> str:
+    if text.startswith('"'):
+        text = text[1:]
+    if text.endswith('"'):
+        text = text[:-1]
+    return text
+
+
+def api_path(url: str) -> str:
+    match = _PATH_RE.search(url)
+    if not match:
+        raise CoinglassDecodeError(f"URL must contain '/api/...' path: {url}")
+    return match.group(0)
+
+
+class CoinglassDecoder:
+    def __init__(self, workers: int = 4, max_keys: int = 1024):
+        self.max_keys = max_keys
+        self.keys: Dict[Tuple[str, str], bytes] = {}
+        self.ciphers: Dict[bytes, Any] = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='coinglass-decode')
+
+        self.decoded_bytes = 0
+
+    def _cipher(self, key: bytes):
+        cipher = self.ciphers.get(key)
+        if cipher is None:
+            if len(self.ciphers) >= self.max_keys:
+                self.ciphers.clear()
+            # ECB keeps no state between calls, so one object serves every payload under this key
+            cipher = self.ciphers[key] = AES.new(key, AES.MODE_ECB)
+        return cipher
+
+    def key_for(self, url: str, user_header: str) -> bytes:
+        """AES key of a response, from its URL (or API path) and `user` header."""
+        path = api_path(url)
+        key = self.keys.get((path, user_header))
+        if key is None:
+            path_key = base64.b64encode(f"coinglass{path}coinglass".encode())[:16]
+            key = self.decrypt(user_header, path_key).encode()
+            if len(self.keys) >= self.max_keys:
+                self.keys.clear()
+            self.keys[(path, user_header)] = key
+        return key
+
+    def decrypt(self, payload: str, key: bytes) -> str:
+        """Plain text of one base64 payload. Raises CoinglassDecodeError."""
+        decrypt = self._cipher(key).decrypt
+        payload = payload.strip()
+        if len(payload) % 4:
+            payload += '=' * (-len(payload) % 4)
+        end = len(payload)
+        try:
+            inflater = None
+            parts = []
+            for start in range(0, end, _B64_CHUNK):
+                plain = decrypt(binascii.a2b_base64(payload[start:start + _B64_CHUNK]))
+                if start + _B64_CHUNK >= end:
+                    # PKCS7 padding, in the final block
+                    pad = plain[-1] if plain else 0
+                    if not 1 <= pad <= 16 or plain[-pad:] != bytes([pad]) * pad:
+                        raise ValueError("bad padding (wrong key?)")
+                    plain = memoryview(plain)[:-pad]
+                if inflater is None:
+                    inflater = zlib.decompressobj(_wbits(bytes(plain[:2])))
+                parts.append(inflater.decompress(plain))
+            if inflater is None:
+                raise ValueError("empty payload")
+            parts.append(inflater.flush())
+        except (binascii.Error, zlib.error, ValueError) as e:
+            raise CoinglassDecodeError(str(e)) from e
+
+        data = b''.join(parts)
+        self.decoded_bytes += len(data)
+        try:
+            return _strip_quotes(data.decode('utf-8'))
+        except UnicodeDecodeError as e:
+            raise CoinglassDecodeError(str(e)) from e
+
+    def decode(self, payload: str, url: str, user_header: str) -> Any:
+        """JSON value of a response's `data` field."""
+        text = self.decrypt(payload, self.key_for(url, user_header))
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+
+    def _map(self, fn, items: list) -> list:
+        def call(item):
+            try:
+                return fn(*item)
+            except CoinglassDecodeError as e:
+                logger.error(f"Coinglass decode error: {e}")
+                return None
+        if len(items) < 2 or sum(len(item[0]) for item in items) < CHUNK_SIZE:
+            # Small batches decode faster inline than through the pool's hand-off
+            return [call(item) for item in items]
+        return list(self.executor.map(call, items))
+
+    def decrypt_many(self, payloads: List[str], key: bytes) -> List[Optional[str]]:
+        """decrypt() over a batch, in parallel; failed payloads are None."""
+        return self._map(self.decrypt, [(payload, key) for payload in payloads])
+
+    def decode_many(self, items: List[Tuple[str, str, str]]) -> List[Any]:
+        """decode() over (payload, url, user_header) items, in parallel; failed items are None."""
+        return self._map(self.decode, items)
+
+    async def decode_async(self, payload: str, url: str, user_header: str) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.decode, payload, url, user_header)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class CoinglassAction(NamedTuple):
+    wallet: str
+    action: str  # POSITION_OPENED / POSITION_CLOSED
+    position: PositionRecord
+    time: int  # ms
+    key: Tuple  # identity of the action across polls
+
+    def fill(self) -> Dict:
+        """The action as a fill, for the flow windows."""
+        side = self.position.side
+        opened = self.action == POSITION_OPENED
+        return {
+            'coin': self.position.coin_name,
+            'px': self.position.entry_px,
+            'sz': abs(self.position.szi),
+            'time': self.time,
+            'dir': f"{'Open' if opened else 'Close'} {side.title()}",
+            # Opening a long or closing a short buys
+            'side': 'B' if opened == (side == 'long') else 'A',
+        }
+
+
+def parse_action(item: Dict) -> Optional[CoinglassAction]:
+    """CoinglassAction of one topPosition/action item, or None if it lacks the fields."""
+    try:
+        wallet = (item.get('userAddress') or item.get('user') or '').lower()
+        coin = item['symbol']
+        side = 'long' if int(item['side']) == 1 else 'short'
+        action = POSITION_CLOSED if int(item.get('positionAction') or 1) == 2 else POSITION_OPENED
+        entry_px = float(item.get('entryPrice') or 0)
+        size = abs(float(item.get('positionSize') or 0))
+        if not size and entry_px:
+            size = float(item.get('positionValueUsd') or 0) / entry_px
+        event_time = int(item.get('time') or item.get('createTime') or 0)
+        leverage = int(float(item.get('leverage') or 0))
+        pnl = float(item.get('unrealizedPnl') or 0)
+    except (KeyError, ValueError, TypeError):
+        return None
+    if not wallet or not size or not event_time:
+        return None
+    position = PositionRecord(COINS(coin), side, size if side == 'long' else -size, entry_px, pnl, '', leverage)
+    return CoinglassAction(wallet, action, position, event_time, (wallet, coin, side, action, event_time))
+
+
+class CoinglassSource:
+    """Polls topPosition/action and hands the new actions to `on_actions`.
+
+    The endpoint returns the latest actions on every poll, so actions are
+    deduplicated on their key; the first poll only fills the seen set.
+    """
+
+    def __init__(self, on_actions: Callable[[List[CoinglassAction]], None], interval: float = 10.0,
+                 api_url: str = COINGLASS_API_URL, path: str = TOP_POSITION_ACTION_PATH,
+                 decoder: Optional[CoinglassDecoder] = None, timeout: float = 10.0, max_seen: int = 10000):
+        self.on_actions = on_actions
+        self.interval = interval
+        self.url = api_url.rstrip('/') + path
+        self.timeout = timeout
+        self.decoder = decoder or CoinglassDecoder()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.max_seen = max_seen
+        self.seen: Dict[Tuple, None] = OrderedDict()
+        self.baseline = True
+
+        self.requests = 0
+        self.errors = 0
+        self.actions = 0
+        self.new_actions = 0
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def fetch(self) -> Optional[Any]:
+        self.requests += 1
+        try:
+            async with self.session.get(self.url) as response:
+                if response.status != 200:
+                    logger.error(f"Coinglass error: {response.status} - {await response.text()}")
+                    self.errors += 1
+                    return None
+                body = await response.json(content_type=None)
+                user_header = response.headers.get('user')
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Coinglass error: {e}")
+            self.errors += 1
+            return None
+
+        data = body.get('data') if isinstance(body, dict) else None
+        if not isinstance(data, str) or not user_header:
+            # Not obfuscated
+            return data
+        try:
+            return await self.decoder.decode_async(data, self.url, user_header)
+        except CoinglassDecodeError as e:
+            logger.error(f"Coinglass decode error: {e}")
+            self.errors += 1
+            return None
+
+    def new(self, data: Any) -> List[CoinglassAction]:
+        """The actions of a response not seen before, oldest first."""
+        if isinstance(data, dict):
+            data = data.get('list', [data])
+        if not isinstance(data, list):
+            return []
+        actions = [action for action in map(parse_action, data) if action]
+        self.actions += len(actions)
+
+        fresh = []
+        for action in sorted(actions, key=lambda a: a.time):
+            if action.key in self.seen:
+                continue
+            self.seen[action.key] = None
+            fresh.append(action)
+        while len(self.seen) > self.max_seen:
+            self.seen.popitem(last=False)
+
+        if self.baseline:
+            self.baseline = False
+            return []
+        self.new_actions += len(fresh)
+        return fresh
+
+    async def poll(self):
+        data = await self.fetch()
+        if data is None:
+            return
+        actions = self.new(data)
+        if actions:
+            try:
+                self.on_actions(actions)
+            except Exception as e:
+                logger.error(f"Coinglass actions error: {e}")
+
+    async def run(self):
+        while True:
+            await self.poll()
+            await asyncio.sleep(self.interval)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+        self.decoder.close()
@@ -0,0 +1,138 @@
+import json
+import logging
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+logger = logging.getLogger(__name__)
+
+ROUTED_CHANNELS = ("userFills", "webData2")
+
+# "channel" is the first key Hyperliquid writes, so a short prefix is enough to route a frame
+CHANNEL_RE = re.compile(r'"channel"\s*:\s*"([^"]*)"')
+CHANNEL_PEEK_BYTES = 64
+USER_RE = re.compile(r'"user"\s*:\s*"(0x[0-9a-fA-F]{40})"')
+
+
+class Frame(NamedTuple):
+    channel: str
+    user: str
+    items: list  # fills for userFills, assetPositions for webData2
+    is_snapshot: bool = False
+
+
+if msgspec is not None:
+    # Only the fields the monitor reads are declared; msgspec skips everything else
+    # (spotState, openOrders, ...) without building Python objects for it.
+    # Fills stay raw dicts: they are stored, archived and forwarded to workers as
+    # Hyperliquid sent them, and FillRecord.from_dict builds the compact record.
+    class UserFillsData(msgspec.Struct):
+        user: str = ""
+        fills: List[Dict[str, Any]] = []
+        isSnapshot: bool = False
+
+    class UserFillsFrame(msgspec.Struct):
+        channel: str
+        data: Optional[UserFillsData] = None
+
+    class ClearinghouseState(msgspec.Struct):
+        assetPositions: List[Dict[str, Any]] = []
+
+    class WebData2Data(msgspec.Struct):
+        user: str = ""
+        clearinghouseState: Optional[ClearinghouseState] = None
+
+    class WebData2Frame(msgspec.Struct):
+        channel: str
+        data: Optional[WebData2Data] = None
+
+
+def peek_channel(message: Union[str, bytes]) -> Optional[str]:
+    head = message[:CHANNEL_PEEK_BYTES]
+    if isinstance(head, bytes):
+        head = head.decode('utf-8', 'replace')
+    match = CHANNEL_RE.search(head)
+    return match.group(1) if match else None
+
+
+def peek_user(message: Union[str, bytes]) -> Optional[str]:
+    """Wallet of a userFills/webData2 frame without decoding it (first "user" key in the frame)."""
+    if isinstance(message, bytes):
+        message = message.decode('utf-8', 'replace')
+    match = USER_RE.search(message)
+    return match.group(1).lower() if match else None
+
+
+class FrameDecoder:
+    """Decodes websocket frames into `Frame`s, or None for channels the monitor ignores.
+
+    backend: "msgspec" (typed structs), "orjson", "json" or "auto" (fastest installed).
+    """
+
+    def __init__(self, backend: str = "auto"):
+        if backend == "auto":
+            backend = "msgspec" if msgspec else "orjson" if orjson else "json"
+        if backend == "msgspec" and msgspec is None or backend == "orjson" and orjson is None:
+            logger.warning(f"Decoder backend {backend} is not installed, falling back to json")
+            backend = "json"
+        self.backend = backend
+
+        if backend == "msgspec":
+            self._fills_decoder = msgspec.json.Decoder(UserFillsFrame)
+            self._positions_decoder = msgspec.json.Decoder(WebData2Frame)
+            self._decode = self._decode_msgspec
+        else:
+            self._loads = orjson.loads if backend == "orjson" else json.loads
+            self._decode = self._decode_dict
+
+    def decode(self, message: Union[str, bytes]) -> Optional[Frame]:
+        channel = peek_channel(message)
+        if channel is not None and channel not in ROUTED_CHANNELS:
+            return None
+        try:
+            return self._decode(message, channel)
+        except ValueError:
+            raise
+        except Exception as e:
+            # msgspec.DecodeError / ValidationError are not ValueErrors
+            raise ValueError(str(e)) from e
+
+    def _decode_msgspec(self, message: Union[str, bytes], channel: Optional[str]) -> Optional[Frame]:
+        if channel is None:
+            channel = msgspec.json.decode(message, type=dict).get('channel')
+
+        if channel == 'userFills':
+            data = self._fills_decoder.decode(message).data
+            if data is None:
+                return None
+            return Frame(channel, data.user.lower(), data.fills, data.isSnapshot)
+
+        if channel == 'webData2':
+            data = self._positions_decoder.decode(message).data
+            if data is None:
+                return None
+            positions = data.clearinghouseState.assetPositions if data.clearinghouseState else []
+            return Frame(channel, data.user.lower(), positions)
+
+        return None
+
+    def _decode_dict(self, message: Union[str, bytes], channel: Optional[str]) -> Optional[Frame]:
+        data = self._loads(message)
+        channel = data.get('channel')
+        user_data = data.get('data')
+        if user_data is None or channel not in ROUTED_CHANNELS:
+            return None
+
+        user = user_data.get('user', '').lower()
+        if channel == 'userFills':
+            return Frame(channel, user, user_data.get('fills') or [], bool(user_data.get('isSnapshot')))
+        return Frame(channel, user, (user_data.get('clearinghouseState') or {}).get('assetPositions') or [])
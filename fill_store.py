@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    wallet TEXT NOT NULL,
+    key TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (wallet, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fills_wallet_time ON fills (wallet, time);
+CREATE TABLE IF NOT EXISTS fill_marks (
+    wallet TEXT PRIMARY KEY,
+    time INTEGER NOT NULL,
+    tids TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# (time, tids) of the newest processed fills of a wallet: tids are not ordered, so every
+# tid seen in the newest millisecond is kept to tell which fills at that time were processed
+Mark = Tuple[int, FrozenSet[int]]
+
+
+def _key_tid(key: str) -> Optional[int]:
+    tid = key.rsplit('_', 1)[-1]
+    return int(tid) if tid.isdigit() else None
+
+
+class FillStore:
+    """Write-behind SQLite (WAL) store for seen fills.
+
+    `add` only appends to an in-memory batch; a single background thread
+    commits the batch every `flush_interval` seconds, so the event loop never
+    writes to the disk and a frame costs the same no matter how many fills are stored.
+    Only that thread writes; mark lookups on the event loop go through a separate
+    read connection, which WAL lets read while a batch commits.
+    """
+
+    def __init__(self, path: str = 'storage/fills.db', flush_interval: float = 1.0,
+                 retention_days: float = 30, max_fills_per_wallet: int = 5000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention_ms = int(retention_days * 86400 * 1000)
+        self.max_fills_per_wallet = max_fills_per_wallet
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.reader = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+        self.pending: List[Tuple[str, str, int, str]] = []
+        self.pending_marks: Dict[str, Mark] = {}
+        self.flushing_marks: List[Dict[str, Mark]] = []  # taken by running flushes, not committed yet
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fill-store')
+        self.flush_task: Optional[asyncio.Task] = None
+        self.last_prune = 0.0
+        self.flush_seconds = Histogram('hlmon_fill_store_flush_seconds', 'Duration of fill store batch commits')
+
+    @staticmethod
+    def _stored_tids(db: sqlite3.Connection, wallet_address: str, fill_time: int) -> FrozenSet[int]:
+        keys = db.execute("SELECT key FROM fills WHERE wallet = ? AND time = ?",
+                               (wallet_address, fill_time)).fetchall()
+        return frozenset(tid for tid in (_key_tid(key) for key, in keys) if tid is not None)
+
+    def load_mark(self, wallet_address: str) -> Optional[Mark]:
+        """(time, tids) of the newest fills processed for a wallet, or None for a wallet never seen.
+
+        One indexed lookup, whatever the number of stored fills. Marks are kept apart
+        from the fills, so retention pruning never moves a wallet's mark back.
+        """
+        for marks in [self.pending_marks, *reversed(self.flushing_marks)]:
+            if wallet_address in marks:
+                return marks[wallet_address]
+        row = self.reader.execute("SELECT time, tids FROM fill_marks WHERE wallet = ?", (wallet_address,)).fetchone()
+        if row:
+            return row[0], frozenset(int(tid) for tid in row[1].split(',') if tid)
+
+        # Stores written before marks existed: the newest stored fills
+        row = self.reader.execute("SELECT MAX(time) FROM fills WHERE wallet = ?", (wallet_address,)).fetchone()
+        if row[0] is None:
+            return self._import_legacy(wallet_address)
+        return row[0], self._stored_tids(self.reader, wallet_address, row[0])
+
+    def set_mark(self, wallet_address: str, fill_time: int, tids: FrozenSet[int]):
+        self.pending_marks[wallet_address] = (fill_time, tids)
+
+    def _import_legacy(self, wallet_address: str) -> Optional[Mark]:
+        """Queue a wallet's legacy JSON fills for the next flush; the mark of the newest of them."""
+        # فایل‌های قدیمی storage/active_fills_<suffix>.json
+        legacy_path = os.path.join(os.path.dirname(self.path) or '.', f'active_fills_{wallet_address[-8:]}.json')
+        if not os.path.exists(legacy_path):
+            return None
+        try:
+            with open(legacy_path, 'r') as f:
+                fills = json.loads(f.read())
+        except (ValueError, OSError) as e:
+            logger.error(f"Legacy fills import error ({legacy_path}): {e}")
+            return None
+        if not fills:
+            return None
+
+        rows = [(wallet_address, key, int(fill.get('time', 0)), json.dumps(fill)) for key, fill in fills.items()]
+        self.pending.extend(rows)
+        newest = max(fill_time for _, _, fill_time, _ in rows)
+        tids = frozenset(tid for tid in (_key_tid(key) for _, key, fill_time, _ in rows if fill_time == newest)
+                         if tid is not None)
+        self.set_mark(wallet_address, newest, tids)
+        logger.info(f"Imported {len(fills)} legacy fills for wallet {wallet_address[-8:]}")
+        return newest, tids
+
+    def add(self, wallet_address: str, fills: Dict[int, Dict]):
+        """fills: tid -> raw fill; rows keep the "<coin>_<tid>" keys of the legacy JSON files."""
+        for tid, fill in fills.items():
+            self.pending.append((wallet_address, f"{fill.get('coin')}_{tid}", int(fill.get('time', 0)),
+                                 json.dumps(fill)))
+
+    def _write(self, rows: List[Tuple[str, str, int, str]], marks: Optional[Dict[str, Mark]] = None):
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT OR IGNORE INTO fills (wallet, key, time, data) VALUES (?, ?, ?, ?)", rows)
+            if marks:
+                self._write_marks(marks)
+
+    def _write_marks(self, marks: Dict[str, Mark]):
+        self.db.executemany("INSERT OR REPLACE INTO fill_marks (wallet, time, tids) VALUES (?, ?, ?)",
+                            [(wallet, fill_time, ','.join(map(str, sorted(tids))))
+                             for wallet, (fill_time, tids) in marks.items()])
+
+    def _prune(self):
+        cutoff = int(time.time() * 1000) - self.retention_ms
+        with self.db:
+            self.db.execute("BEGIN")
+            deleted = self.db.execute("DELETE FROM fills WHERE time < ?", (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} fills older than retention")
+
+    def _flush_batch(self, rows: List[Tuple[str, str, int, str]], marks: Optional[Dict[str, Mark]] = None):
+        start = time.perf_counter()
+        if rows or marks:
+            self._write(rows, marks)
+        if time.monotonic() - self.last_prune > 3600:
+            self.last_prune = time.monotonic()
+            self._prune()
+        if rows:
+            self.flush_seconds.observe(time.perf_counter() - start)
+
+    async def flush(self):
+        rows, self.pending = self.pending, []
+        marks, self.pending_marks = self.pending_marks, {}
+        self.flushing_marks.append(marks)
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._flush_batch, rows, marks)
+        except Exception as e:
+            logger.error(f"Fill store flush error: {e}")
+            self.pending = rows + self.pending
+            self.pending_marks = {**marks, **self.pending_marks}
+        finally:
+            self.flushing_marks.remove(marks)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+        await self.flush()
+        self.executor.shutdown(wait=True)
+        self.reader.close()
+        self.db.close()
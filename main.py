@@ -1,383 +1,669 @@
 import datetime
 import os
+import time
 import asyncio
-import websockets
 import json
-import requests
 import logging
-from typing import Dict, Set, List
+from typing import Dict, Set, List, Optional
 from dotenv import load_dotenv
 
+from analytics import FillAnalytics, FlowAlert, FlowRule
+from archive import Archive
+from backfill import FillBackfill, HYPERLIQUID_INFO_URL
+from coalescer import FillCoalescer
+from coinglass import COINGLASS_API_URL, CoinglassAction, CoinglassSource
+from decoding import FrameDecoder
+from fill_store import FillStore, Mark
+from metrics import Counter, Gauge, Histogram, LoopProfiler, MetricsRegistry, watch_loop_lag
+from position_diff import PositionTracker
+from records import FillRecord, PositionRecord
+from replay import FrameRecorder
+from rules import AlertRules
+from sinks import AlertHub, TelegramSink, build_sink
+from telegram_sender import TelegramSender, TELEGRAM_API_URL
+from templates import LazyMessage, fills_message, flow_message, position_message
+from wallet_registry import WalletRegistry, load_wallets
+from workers import WorkerPool
+from ws_manager import ConnectionManager
+
 load_dotenv()
 
 # تنظیمات
-HYPERLIQUID_WS_URL = "wss://api.hyperliquid.xyz/ws"
+HYPERLIQUID_WS_URL = os.getenv('HYPERLIQUID_WS_URL', "wss://api.hyperliquid.xyz/ws")
+WS_RECORD_PATH = os.getenv('WS_RECORD_PATH')
+WS_CONNECTIONS = int(os.getenv('WS_CONNECTIONS', '1'))
+WS_MAX_SUBSCRIPTIONS = int(os.getenv('WS_MAX_SUBSCRIPTIONS', '1000'))
+WS_SUBSCRIBE_RATE = float(os.getenv('WS_SUBSCRIBE_RATE', '30'))
+FRAME_DECODER = os.getenv('FRAME_DECODER', 'auto')
+# هشدار پوزیشن‌ها طبق قوانین "positions" در alert_rules.json؛ false همه را خاموش می‌کند
+POSITION_ALERTS = os.getenv('POSITION_ALERTS', 'true').lower() in ('1', 'true', 'yes')
+ALERT_RULES_PATH = os.getenv('ALERT_RULES_PATH', 'alert_rules.json')
+ALERT_RULES_RELOAD_INTERVAL = float(os.getenv('ALERT_RULES_RELOAD_INTERVAL', '5'))
+# هشدار تجمیعی: چند والت در یک بازه زمانی روی یک کوین پوزیشن باز کرده‌اند
+FLOW_ALERT_RULES = [FlowRule(**rule) for rule in json.loads(os.getenv(
+    'FLOW_ALERT_RULES', '[{"side": "long", "window": 600, "min_wallets": 5, "min_notional": 5000000},'
+                        ' {"side": "short", "window": 600, "min_wallets": 5, "min_notional": 5000000}]'))]
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', TELEGRAM_API_URL)
+# Telegram allows ~30 msg/s per bot and ~20 msg/min in one group
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '0.33'))
+TELEGRAM_CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+ALERT_COALESCE_WINDOW = float(os.getenv('ALERT_COALESCE_WINDOW', '2'))
+ALERT_METRICS_INTERVAL = float(os.getenv('ALERT_METRICS_INTERVAL', '60'))
+MESSAGE_LOCALE = os.getenv('MESSAGE_LOCALE', 'en')  # number separators, see templates.LOCALES
+# مقصدهای دیگر هشدارها در کنار تلگرام (sinks.py)
+ALERT_SINKS = json.loads(os.getenv('ALERT_SINKS', '[]'))
+TELEGRAM_SINK_QUEUE = int(os.getenv('TELEGRAM_SINK_QUEUE', '10000'))
+TELEGRAM_SINK_POLICY = os.getenv('TELEGRAM_SINK_POLICY', 'spill')
+FILL_STORE_PATH = os.getenv('FILL_STORE_PATH', 'storage/fills.db')
+FILL_STORE_FLUSH_INTERVAL = float(os.getenv('FILL_STORE_FLUSH_INTERVAL', '1'))
+FILL_RETENTION_DAYS = float(os.getenv('FILL_RETENTION_DAYS', '30'))
+MAX_FILLS_PER_WALLET = int(os.getenv('MAX_FILLS_PER_WALLET', '5000'))
+# آرشیو ستونی فیل‌ها و تغییرات پوزیشن برای archive.py (خالی = غیرفعال)
+ARCHIVE_PATH = os.getenv('ARCHIVE_PATH', 'storage/archive')
 
 # تنظیم لاگ
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # لیست والت‌ها
-WALLET_ADDRESSES = json.loads(open('wallets.json', 'r').read())
-
-
-class TelegramSender:
-    def __init__(self):
-        self.message_queue = asyncio.Queue()
-        self.is_running = False
-
-    async def start(self):
-        self.is_running = True
-        asyncio.create_task(self._process_queue())
-
-    async def _process_queue(self):
-        while self.is_running:
-            try:
-                if not self.message_queue.empty():
-                    message = await self.message_queue.get()
-                    await self._send_message(message)
-                    await asyncio.sleep(3)  # مکث 10 ثانیه بین پیام‌ها
-                else:
-                    await asyncio.sleep(1)  # چک کردن کیو هر ثانیه
-            except Exception as e:
-                logger.error(f"Error in message queue processor: {e}")
-                await asyncio.sleep(5)
-
-    async def _send_message(self, message: str):
-        try:
-            url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-            payload = {
-                "chat_id": TELEGRAM_CHAT_ID,
-                "text": message,
-                "parse_mode": "HTML"
-            }
-
-            response = requests.post(url, json=payload, timeout=10)
-            if response.status_code == 200:
-                logger.info("Telegram Message Sent.")
-            else:
-                logger.error(f"Send TG Message Error: {response.status_code} - {response.text}")
+WALLETS_PATH = os.getenv('WALLETS_PATH', 'wallets.json')
+WALLETS_RELOAD_INTERVAL = float(os.getenv('WALLETS_RELOAD_INTERVAL', '5'))
+WALLET_API_PORT = int(os.getenv('WALLET_API_PORT', '8780'))  # 0 = disabled
+WALLET_IDLE_EVICT = float(os.getenv('WALLET_IDLE_EVICT', '3600'))
+WALLET_ADDRESSES = load_wallets(WALLETS_PATH)
 
-        except Exception as e:
-            logger.error(f"TG Error: {e}")
+# متریک‌های Prometheus روی /metrics
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # 0 = disabled
+METRICS_PROFILE = os.getenv('METRICS_PROFILE', 'false').lower() in ('1', 'true', 'yes')
+METRICS_PROFILE_INTERVAL = float(os.getenv('METRICS_PROFILE_INTERVAL', '0.005'))
+TIMING_SAMPLE = 16  # frames per latency sample, a power of two
+TIMING_MASK = TIMING_SAMPLE - 1
 
-    async def queue_message(self, message: str):
-        await self.message_queue.put(message)
-        logger.info(f"Message queued. Queue size: {self.message_queue.qsize()}")
+# دریافت فیل‌های از دست رفته هنگام قطعی از userFillsByTime
+FILL_BACKFILL = os.getenv('FILL_BACKFILL', 'false').lower() in ('1', 'true', 'yes')
+FILL_BACKFILL_RATE = float(os.getenv('FILL_BACKFILL_RATE', '2'))  # requests/s, shared by all worker processes
+HYPERLIQUID_INFO_URL = os.getenv('HYPERLIQUID_INFO_URL', HYPERLIQUID_INFO_URL)
 
-    def stop(self):
-        self.is_running = False
+# پردازش فریم‌ها در چند پروسس (0 = همه چیز در همین پروسس)
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '0'))
+
+# منبع دوم معاملات: topPosition/action کوین‌گلس
+COINGLASS_POLL_INTERVAL = float(os.getenv('COINGLASS_POLL_INTERVAL', '0'))  # 0 = disabled
+COINGLASS_API_URL = os.getenv('COINGLASS_API_URL', COINGLASS_API_URL)
 
 
 class HyperliquidMonitor:
-    def __init__(self, wallet_addresses: List[str], telegram_sender: TelegramSender):
+    def __init__(self, wallet_addresses: List[str], telegram_sender: TelegramSender, fill_store: FillStore,
+                 coalesce_window: float = 2.0, ws_url: str = HYPERLIQUID_WS_URL,
+                 recorder: Optional[FrameRecorder] = None, backfill: Optional[FillBackfill] = None,
+                 archive: Optional[Archive] = None):
         self.wallet_addresses = [addr.lower() for addr in wallet_addresses]
-        self.active_positions: Dict[str, Dict[str, Dict]] = {}  # wallet -> position_key -> position
-        self.active_fills: Dict[str, Dict[str, Dict]] = {}  # wallet -> fill_key -> fill
-        self.is_connected = False
+        self.wallet_set: Set[str] = set(self.wallet_addresses)
+        self.decoder = FrameDecoder(FRAME_DECODER)
+        self.ws_url = ws_url
+        self.recorder = recorder
+        self.active_positions: Dict[str, Dict[str, object]] = {}  # wallet -> position_key -> Fill/PositionRecord
+        self.active_fills: Dict[str, Dict[int, FillRecord]] = {}  # wallet -> tid -> fill
+        self.position_tracker = PositionTracker()
+        self.analytics = self.create_analytics()
+        self.connection_manager: Optional[ConnectionManager] = None
+        self.pool: Optional[WorkerPool] = None  # set: frames are processed by worker processes
         self.telegram_sender = telegram_sender
-
-        # بارگذاری داده‌های قبلی برای هر والت
-        for wallet in self.wallet_addresses:
-            self.active_positions[wallet] = {}
-            try:
-                with open(f'storage/active_fills_{wallet[-8:]}.json', 'r') as f:
-                    self.active_fills[wallet] = json.loads(f.read())
-            except FileNotFoundError:
-                self.active_fills[wallet] = {}
-
-    def format_position_message(self, position: Dict, action: str, wallet_address: str) -> str:
-        symbol = position.get('coin', 'N/A')
-        side = position.get('side', 'N/A')
-        size = position.get('szi', '0')
-        entry_price = position.get('entryPx', '0')
-        unrealized_pnl = position.get('unrealizedPnl', '0')
-        leverage = position.get('leverage', {})
-        leverage_value = leverage.get('value', 0)
-        leverage_type = leverage.get('type', 0)
-
-        try:
-            size_float = float(size)
-            entry_price_float = float(entry_price)
-            pnl_float = float(unrealized_pnl)
-
-            size_formatted = f"{size_float:,.4f}".rstrip('0').rstrip('.')
-            entry_price_formatted = f"{entry_price_float:,.4f}".rstrip('0').rstrip('.')
-            pnl_formatted = f"{pnl_float:,.2f}"
-
-        except (ValueError, TypeError):
-            size_formatted = size
-            entry_price_formatted = entry_price
-            pnl_formatted = unrealized_pnl
-            pnl_float = 0
-
-        if action == "Opened":
-            emoji = "🟢" if side == "A" else "🔴"  # A = Long (خرید), B = Short (فروش)
-        else:
-            emoji = "⚪"
-
-        pnl_emoji = "💰" if pnl_float > 0 else "💸" if pnl_float < 0 else "💱"
-
-        side_text = "Buy (Long)" if side == "A" else "Sell (Short)" if side == "B" else side
-
-        message = f"""
-{emoji} <b>Position {action} {leverage_value}x {leverage_type}</b>
-
-💎 <b>Coin:</b> {symbol}
-📊 <b>Type:</b> {side_text}  
-📏 <b>Margin:</b> {size_formatted}
-💵 <b>Entry:</b> ${entry_price_formatted}
-{pnl_emoji} <b>Pnl:</b> ${pnl_formatted}
-
-🕐 <b>Time:</b> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-🔗 <b>Wallet:</b> <code>{wallet_address[-8:]}</code>
-        """.strip()
-
-        return message
-
-    def format_fills_message(self, position: Dict, wallet_address: str) -> str:
-        symbol = position.get('coin', 'N/A')
-        side = position.get('side', 'N/A')
-        dir = position.get('dir', 'N/A')
-        entry_price = position.get('px', '0')
-        margin = float(position.get('sz', '0'))
-        amount = abs(float(position.get('startPosition', '0')))
-        time = position.get('time', '0')
-        date = datetime.datetime.fromtimestamp(time / 1e3)
-        closed_pnl = position.get('closedPnl', '0')
-        leverage_type = 'Cross' if position.get('crossed') else 'Isolate'
-
-        if (datetime.datetime.now() - date > datetime.timedelta(hours=1)) or amount < 1000:
-            return ""
-
-        try:
-            size_float = float(margin)
-            entry_price_float = float(entry_price)
-            pnl_float = float(closed_pnl)
-
-            size_formatted = f"{size_float:,.4f}".rstrip('0').rstrip('.')
-            entry_price_formatted = f"{entry_price_float:,.4f}".rstrip('0').rstrip('.')
-            pnl_formatted = f"{pnl_float:,.2f}"
-            amount_formatted = f"{amount:,.2f}"
-
-        except (ValueError, TypeError):
-            size_formatted = margin
-            entry_price_formatted = entry_price
-            pnl_formatted = closed_pnl
-            pnl_float = 0
-            amount_formatted = 0
-        except Exception as e:
-            logger.error(f"Format Message Error: {e}")
-
-        if "Open" in dir:
-            emoji = "🔵" if side == "A" else "🔵"  # A = Long (خرید), B = Short (فروش)
-        else:
-            emoji = "⚪"
-            return ""
-
-        if 'Long' in dir:
-            side_text = "🟢 Buy (Long)"
-        elif 'Short' in dir:
-            side_text = "🔴 Sell (Short)"
-        else:
-            side_text = 'N/A'
-
-        if not pnl_float:
-            pnl_float = 0
-
-        pnl_emoji = "💰" if pnl_float > 0 else "💸" if pnl_float < 0 else "💱"
-
-
-        message = f"""
-{emoji} <b>{dir} ({leverage_type})</b>
-
-🆔 <b>id:</b> <code>{position.get('tid', 'N/A')}</code>
-💎 <b>Symbol:</b> {symbol}
-📊 <b>Type:</b> {side_text}  
-📏 <b>Margin:</b> {size_formatted} (${amount_formatted})
-💵 <b>Entry:</b> {entry_price_formatted}
-{pnl_emoji} <b>Pnl:</b> {pnl_formatted}
-🕐 <b>Time:</b> {date.strftime('%Y-%m-%d %H:%M:%S')}
-🔗 <b>Wallet:</b> <a href="https://www.coinglass.com/hyperliquid/{wallet_address}">{wallet_address}</a>
-        """.strip()
-
-        return message
+        self.alert_rules = AlertRules(ALERT_RULES_PATH)
+        self.coalescer = FillCoalescer(telegram_sender, self.format_fills_message, window=coalesce_window,
+                                       predicate=self.alert_rules)
+
+        self.fill_store = fill_store
+        self.archive = archive
+        # وضعیت هر والت با اولین فریم آن بارگذاری و پس از بیکاری از حافظه حذف می‌شود
+        self.last_active: Dict[str, float] = {}  # wallet -> monotonic() of its last fill or position change
+        # (time, tids) of the newest processed fills: anything older, or at that time with one of
+        # those tids, was already handled
+        self.fill_marks: Dict[str, Optional[Mark]] = {}
+        self.backfill = backfill
+        self.resuming: Dict[str, List[list]] = {}  # wallet -> userFills held back during a backfill
+        self.resume_tasks: Set[asyncio.Task] = set()
+
+        self.last_seen: Dict[str, float] = {}  # wallet -> perf_counter() of its last frame
+        # Plain ints on the hot path, read by the Counter at scrape time
+        self.frame_counts: Dict[str, int] = {'userFills': 0, 'webData2': 0, 'other': 0}
+        self.frames = Counter('hlmon_frames', 'Websocket frames received', labels=('channel',),
+                              collect=lambda: dict(self.frame_counts))
+        # Latencies are timed on one frame in TIMING_SAMPLE, which keeps the clock reads off most frames
+        self.decode_latency = Histogram('hlmon_decode_seconds',
+                                        f'Frame decode time in handle_message (1 in {TIMING_SAMPLE} frames)')
+        self.handle_latency = Histogram('hlmon_handle_seconds',
+                                        f'Frame processing time after decoding (1 in {TIMING_SAMPLE} frames)',
+                                        labels=('channel',))
+        self.channel_latency = {channel: self.handle_latency.labels(channel) for channel in ('userFills', 'webData2')}
+        self.frame_seq = 0
+
+    def create_analytics(self) -> Optional[FillAnalytics]:
+        return FillAnalytics(rules=FLOW_ALERT_RULES)
+
+    def wallet_fills(self, wallet_address: str) -> Dict[int, FillRecord]:
+        # Only fills of this session; history is covered by the mark, not reloaded
+        fills = self.active_fills.get(wallet_address)
+        if fills is None:
+            fills = self.active_fills[wallet_address] = {}
+        self.last_active[wallet_address] = time.monotonic()
+        return fills
+
+    def fill_mark(self, wallet_address: str) -> Optional[Mark]:
+        if wallet_address not in self.fill_marks:
+            self.fill_marks[wallet_address] = self.fill_store.load_mark(wallet_address)
+        return self.fill_marks[wallet_address]
+
+    def add_wallets(self, wallets: List[str]):
+        added = [wallet.lower() for wallet in wallets if wallet.lower() not in self.wallet_set]
+        for wallet in added:
+            self.wallet_set.add(wallet)
+            self.wallet_addresses.append(wallet)
+        if added and self.pool:
+            self.pool.add_wallets(added)
+        if added and self.connection_manager:
+            asyncio.create_task(self.connection_manager.add_wallets(added))
+
+    def remove_wallets(self, wallets: List[str]):
+        removed = [wallet.lower() for wallet in wallets if wallet.lower() in self.wallet_set]
+        for wallet in removed:
+            self.wallet_set.discard(wallet)
+            self.wallet_addresses.remove(wallet)
+            self.forget_wallet(wallet)
+            self.resuming.pop(wallet, None)
+            self.last_seen.pop(wallet, None)
+        if removed and self.pool:
+            self.pool.remove_wallets(removed)
+        if removed and self.connection_manager:
+            asyncio.create_task(self.connection_manager.remove_wallets(removed))
+
+    def evict_wallet(self, wallet_address: str):
+        """Drop the fill state of an idle wallet; the fill mark is restored from the FillStore on its
+        next userFills frame. Positions stay: webData2 keeps pushing them, and the next snapshot must be
+        diffed against the last one rather than taken as a new baseline."""
+        self.active_fills.pop(wallet_address, None)
+        self.fill_marks.pop(wallet_address, None)
+        self.last_active.pop(wallet_address, None)
+
+    def forget_wallet(self, wallet_address: str):
+        """Drop all in-memory state of a wallet that left the registry, positions included."""
+        self.evict_wallet(wallet_address)
+        self.active_positions.pop(wallet_address, None)
+        self.position_tracker.forget(wallet_address)
+
+    async def evict_idle_wallets(self, idle_seconds: float, interval: float = 60.0):
+        while True:
+            await asyncio.sleep(interval)
+            # فیل‌های در صف باید قبل از حذف از حافظه در FillStore نوشته شوند
+            await self.fill_store.flush()
+            now = time.monotonic()
+            idle = [wallet for wallet, active in self.last_active.items()
+                    if now - active > idle_seconds and wallet not in self.resuming]
+            for wallet in idle:
+                self.evict_wallet(wallet)
+            forgotten = self.analytics.forget_idle_wallets() if self.analytics else 0
+            if idle or forgotten:
+                logger.info(f"Evicted the state of {len(idle)} idle wallets, "
+                            f"{forgotten} wallets left the flow windows")
+
+    def format_position_message(self, position: PositionRecord, action: str, wallet_address: str) -> LazyMessage:
+        return position_message(position, action, wallet_address, locale=MESSAGE_LOCALE)
+
+    def format_fills_message(self, position: Dict, wallet_address: str) -> LazyMessage:
+        return fills_message(position, wallet_address, locale=MESSAGE_LOCALE)
+
+    def format_flow_message(self, alert: FlowAlert) -> LazyMessage:
+        return flow_message(alert, locale=MESSAGE_LOCALE)
+
+    def position_event(self, wallet_address: str, action: str, position: PositionRecord, event_time: int,
+                       previous: Optional[PositionRecord] = None):
+        """Archive a position change and alert on it if a position rule matches."""
+        if self.archive:
+            self.archive.add_position(wallet_address, action, position, event_time)
+        if POSITION_ALERTS and self.alert_rules.match_position(action, position, wallet_address, previous):
+            self.telegram_sender.publish(self.format_position_message(position, action, wallet_address),
+                                         created_at=event_time / 1e3)
 
     def process_position_update(self, positions: list, wallet_address: str):
-        current_positions = {}
-
-        for pos in positions:
-            _type = pos.get('type')
-            pos = pos.get('position')
-            if not pos:
+        events = self.position_tracker.diff(wallet_address, positions)
+        if events is None:
+            return
+        self.last_active[wallet_address] = time.monotonic()
+
+        active_positions = self.active_positions.setdefault(wallet_address, {})
+        event_time = int(time.time() * 1000)
+        for event in events:
+            logger.info(f"Position {event.action}: {event.key} for wallet {wallet_address[-8:]}")
+            self.position_event(wallet_address, event.action, event.position, event_time, event.previous)
+
+        # کلیدهایی که process_fills_update اضافه کرده تا snapshot بعدی معتبرند
+        current_positions = self.position_tracker.current(wallet_address)
+        for key in [key for key in active_positions if key not in current_positions]:
+            del active_positions[key]
+        active_positions.update(current_positions)
+
+    def process_flow(self, fills: list, wallet_address: str):
+        for fill in fills:
+            for alert in self.analytics.add_fill(wallet_address, fill):
+                logger.info(f"Flow alert: {alert.wallets} wallets {alert.rule.side} {alert.coin}")
+                self.telegram_sender.publish(self.format_flow_message(alert))
+
+    def process_coinglass_actions(self, actions: List[CoinglassAction]):
+        """Coinglass topPosition actions, for wallets the websockets do not cover: position rules,
+        sinks and archive as for a webData2 change, and the flow windows."""
+        for action in actions:
+            if action.wallet in self.wallet_set:
                 continue
-            coin = pos.get('coin')
-            try:
-                pos['side'] = 'short' if float(pos.get('entryPx', '0')) < float(pos.get('liquidationPx', '0')) else 'long'
-            except:
-                pos['side'] = '-'
-
-            if coin:
-                position_key = f"{coin}_{pos.get('side')}"
-                current_positions[position_key] = pos
-
-        # # بررسی پوزیشن‌های جدید
-        # for key, pos in current_positions.items():
-        #     if key not in self.active_positions[wallet_address]:
-        #         logger.info(f"New Position Detected: {key} for wallet {wallet_address[-8:]}")
-        #         message = self.format_position_message(pos, "Opened", wallet_address)
-        #         asyncio.create_task(self.telegram_sender.queue_message(message))
-        #
-        # # بررسی پوزیشن‌های بسته شده
-        # for key, pos in self.active_positions[wallet_address].items():
-        #     if key not in current_positions:
-        #         logger.info(f"Position Closed: {key} for wallet {wallet_address[-8:]}")
-        #         message = self.format_position_message(pos, "Closed", wallet_address)
-        #         asyncio.create_task(self.telegram_sender.queue_message(message))
-
-        self.active_positions[wallet_address] = current_positions.copy()
-
-    def process_fills_update(self, fills: list, wallet_address: str):
-        current_fills = {}
-
+            self.position_event(action.wallet, action.action, action.position, action.time)
+            if self.analytics:
+                self.process_flow([action.fill()], action.wallet)
+
+    def process_fills_update(self, fills: list, wallet_address: str, is_snapshot: bool = False):
+        held = self.resuming.get(wallet_address)
+        if held is not None:
+            # ترتیب فیل‌ها حفظ می‌شود تا backfill تمام شود
+            held.append(fills)
+            return
+
+        known_fills = self.wallet_fills(wallet_address)
+        active_positions = self.active_positions.setdefault(wallet_address, {})
+        mark = self.fill_mark(wallet_address)
+        # اولین snapshot والتی که هیچ سابقه‌ای ندارد فقط مبنا است؛ برای آن هشدار نمی‌دهیم
+        baseline = is_snapshot and mark is None
+        mark_time, mark_tids = mark or (-1, frozenset())
+
+        if is_snapshot and mark and self.backfill and fills:
+            oldest = min(fill.get('time', 0) for fill in fills)
+            if oldest > mark_time:
+                # snapshot به mark نمی‌رسد: فیل‌های بین این دو در زمان قطعی از دست رفته‌اند
+                self.resuming[wallet_address] = []
+                task = asyncio.create_task(self.resume_wallet(wallet_address, mark_time, oldest, fills),
+                                           name=f"resume-{wallet_address[-8:]}")
+                self.resume_tasks.add(task)
+                task.add_done_callback(self._resume_done)
+                return
+
+        new_fills = {}  # tid -> raw fill
         for fill in fills:
-            coin = fill.get('coin')
-            fills_key = f"{coin}_{fill.get('tid')}"
-            current_fills[fills_key] = fill
-
-        for key, pos in current_fills.items():
+            # Already processed fills are skipped on an int compare; tids are not ordered,
+            # so fills in the mark's own millisecond are checked against the tids seen there
+            fill_time = fill.get('time', 0)
+            tid = fill.get('tid', 0)
+            if fill_time < mark_time or fill_time == mark_time and tid in mark_tids:
+                continue
+            if tid not in known_fills:
+                new_fills[tid] = fill
+
+        if not new_fills:
+            return
+
+        newest = max(fill.get('time', 0) for fill in new_fills.values())
+        newest_tids = frozenset(tid for tid, fill in new_fills.items() if fill.get('time', 0) == newest)
+        new_mark = (newest, newest_tids | mark_tids if newest == mark_time else newest_tids)
+        self.fill_marks[wallet_address] = new_mark
+        self.fill_store.set_mark(wallet_address, *new_mark)
+
+        # پوزیشن‌هایی که در همین فریم باز شده‌اند؛ بقیه فیل‌هایشان در coalescer تجمیع می‌شوند
+        records = {tid: FillRecord.from_dict(fill) for tid, fill in new_fills.items()}
+        opened_now = set()
+        for tid, pos in new_fills.items():
             if 'Long' in pos.get('dir'):
                 side = "long"
             else:
                 side = "short"
             key2 = f"{pos.get('coin')}_{side}"
-            if key not in self.active_fills[wallet_address] and key2 not in self.active_positions[wallet_address]:
-                logger.info(f"New fills Detected: {key} for wallet {wallet_address[-8:]}")
-                self.active_positions[wallet_address][key2] = pos
-                message = self.format_fills_message(pos, wallet_address)
-                if message:
-                    asyncio.create_task(self.telegram_sender.queue_message(message))
-
-        self.active_fills[wallet_address] = {
-            **(self.active_fills[wallet_address] if self.active_fills[wallet_address] else {}), **current_fills.copy()}
+            if key2 not in active_positions:
+                logger.info(f"New fills Detected: {pos.get('coin')}_{tid} for wallet {wallet_address[-8:]}")
+                active_positions[key2] = records[tid]
+                opened_now.add(key2)
+            if key2 in opened_now and not baseline and self.alert_rules.may_match(wallet_address, pos.get('coin')):
+                self.coalescer.add(wallet_address, pos)
+
+        if not baseline:
+            self.process_flow(list(new_fills.values()), wallet_address)
+
+        known_fills.update(records)
+        # قدیمی‌ترین فیل‌ها از حافظه حذف می‌شوند؛ نسخه کامل در FillStore می‌ماند
+        while len(known_fills) > self.fill_store.max_fills_per_wallet:
+            del known_fills[next(iter(known_fills))]
+
+        # ذخیره در پس‌زمینه (write-behind)
+        self.fill_store.add(wallet_address, new_fills)
+        if self.archive:
+            self.archive.add_fills(wallet_address, records.values())
+
+    def _resume_done(self, task: asyncio.Task):
+        self.resume_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"{task.get_name()} failed: {task.exception()!r}")
+
+    async def resume_wallet(self, wallet_address: str, start_time: int, end_time: int, snapshot: list):
+        try:
+            missed = await self.backfill.fetch(wallet_address, start_time, end_time)
+            logger.info(f"Backfilled {len(missed)} fills for wallet {wallet_address[-8:]}")
+        except Exception as e:
+            logger.error(f"Backfill error for wallet {wallet_address[-8:]}: {e}")
+            missed = []
 
-        # ذخیره فایل برای هر والت جداگانه
-        with open(f'storage/active_fills_{wallet_address[-8:]}.json', 'w') as f:
-            f.write(json.dumps(self.active_fills[wallet_address]))
+        held = self.resuming.pop(wallet_address, [])
+        if wallet_address not in self.wallet_set:
+            return
+        for fills in [missed + snapshot] + held:
+            self.process_fills_update(fills, wallet_address)
 
     async def handle_message(self, message: str):
+        if self.recorder:
+            self.recorder.record(message)
+        if self.pool:
+            # Routed frames are counted by the worker that processes them
+            if not self.pool.submit(message):
+                self.frame_counts['other'] += 1
+            return
+
+        start = time.perf_counter()
+        self.frame_seq += 1
+        timed = not self.frame_seq & TIMING_MASK
         try:
-            data = json.loads(message)
-
-            if data.get('channel') == 'userFills' and data.get('data'):
-                user_data = data['data']
-                user_wallet = user_data.get('user', '').lower()
-
-                if user_wallet in self.wallet_addresses:
-                    fills = user_data.get('fills')
-                    if fills:
-                        logger.info(f"Get {len(fills)} fills For Wallet {user_wallet[-8:]}")
-                        self.process_fills_update(fills, user_wallet)
-
-            elif data.get('channel') == 'webData2' and data.get('data'):
-                user_data = data['data']
-                user_wallet = user_data.get('user', '').lower()
-
-                if user_wallet in self.wallet_addresses:
-                    positions = user_data.get('clearinghouseState', {}).get('assetPositions')
-                    if positions:
-                        logger.info(f"Get {len(positions)} Positions For Wallet {user_wallet[-8:]}")
-                        self.process_position_update(positions, user_wallet)
-
-        except json.JSONDecodeError:
+            frame = self.decoder.decode(message)
+            if timed:
+                decoded = time.perf_counter()
+                self.decode_latency.observe(decoded - start)
+            if frame is None:
+                self.frame_counts['other'] += 1
+                return
+            self.frame_counts[frame.channel] += 1
+            if frame.user not in self.wallet_set:
+                return
+            self.last_seen[frame.user] = start
+            if not frame.items:
+                return
+
+            if frame.channel == 'userFills':
+                self.process_fills_update(frame.items, frame.user, frame.is_snapshot)
+
+            elif frame.channel == 'webData2':
+                self.process_position_update(frame.items, frame.user)
+
+            if timed:
+                self.channel_latency[frame.channel].observe(time.perf_counter() - decoded)
+
+        except ValueError:
             logger.error("Error JSON")
         except Exception as e:
             logger.error(f"Process Message Error: {e}")
 
-    async def subscribe_to_wallets(self, websocket):
-        # Subscribe to webData2 for all wallets
-        for wallet in self.wallet_addresses:
-            subscription_message = {
-                "method": "subscribe",
-                "subscription": {
-                    "type": "webData2",
-                    "user": wallet
-                }
-            }
-            await websocket.send(json.dumps(subscription_message))
-            logger.info(f"Subscribed to webData2 for wallet {wallet[-8:]}")
-            await asyncio.sleep(0.1)  # مکث کوتاه بین subscribe ها
-
-        # Subscribe to userFills for all wallets
-        for wallet in self.wallet_addresses:
-            subscription_message = {
-                "method": "subscribe",
-                "subscription": {
-                    "type": "userFills",
-                    "user": wallet
-                }
-            }
-            await websocket.send(json.dumps(subscription_message))
-            logger.info(f"Subscribed to userFills for wallet {wallet[-8:]}")
-            await asyncio.sleep(0.1)  # مکث کوتاه بین subscribe ها
+    def take_frame_metrics(self) -> Dict:
+        """Frame counts, latencies and last-seen ages since the last call; a worker sends them to the front end."""
+        now = time.perf_counter()
+        metrics = {
+            'frames': self.frame_counts,
+            'decode': self.decode_latency.take(),
+            'handle': {channel: histogram.take() for channel, histogram in self.channel_latency.items()},
+            'ages': {wallet: now - seen for wallet, seen in self.last_seen.items()},
+        }
+        self.frame_counts = dict.fromkeys(self.frame_counts, 0)
+        self.last_seen = {}
+        return metrics
+
+    def merge_frame_metrics(self, metrics: Dict):
+        for channel, count in metrics['frames'].items():
+            self.frame_counts[channel] += count
+        self.decode_latency.merge(*metrics['decode'])
+        for channel, (counts, total) in metrics['handle'].items():
+            self.channel_latency[channel].merge(counts, total)
+        now = time.perf_counter()
+        for wallet, age in metrics['ages'].items():
+            if wallet in self.wallet_set:
+                self.last_seen[wallet] = now - age
+
+    @property
+    def is_connected(self) -> bool:
+        return self.connection_manager is not None and self.connection_manager.is_connected
 
     async def connect_and_monitor(self):
-        while True:
-            try:
-                logger.info("Connect to Hyperliquid WebSocket...")
-
-                async with websockets.connect(
-                        HYPERLIQUID_WS_URL,
-                        ping_interval=20,
-                        ping_timeout=10
-                ) as websocket:
-
-                    self.is_connected = True
-                    logger.info("Connected!")
-
-                    # پیام شروع مانیتورینگ
-                    start_message = f"""
+        # پیام شروع مانیتورینگ
+        start_message = f"""
 🚀 <b>Multi-Wallet Monitoring Started</b>
 
 📊 <b>Wallets:</b> {len(self.wallet_addresses)}
 🕐 <b>Time:</b> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 ✅ System is Ready.
-                    """.strip()
-
-                    # await self.telegram_sender.queue_message(start_message)
-
-                    await self.subscribe_to_wallets(websocket)
-
-                    async for message in websocket:
-                        await self.handle_message(message)
-
-            except websockets.exceptions.ConnectionClosed:
-                logger.warning("WebSocket Connection Closed. retry to connect...")
-                await asyncio.sleep(5)
-
-            except Exception as e:
-                logger.error(f"Connection Error: {e}")
-                await asyncio.sleep(10)
+        """.strip()
 
-            finally:
-                self.is_connected = False
+        # await self.telegram_sender.queue_message(start_message)
+
+        self.connection_manager = ConnectionManager(
+            self.ws_url,
+            self.wallet_addresses,
+            self.handle_message,
+            connections=WS_CONNECTIONS,
+            max_subscriptions=WS_MAX_SUBSCRIPTIONS,
+            subscribe_rate=WS_SUBSCRIBE_RATE
+        )
+        await self.connection_manager.run()
+
+
+def build_metrics(monitor: HyperliquidMonitor, telegram_sender: TelegramSender,
+                  fill_store: FillStore, hub: Optional[AlertHub] = None) -> MetricsRegistry:
+    registry = MetricsRegistry()
+
+    def shards():
+        return monitor.connection_manager.shards if monitor.connection_manager else []
+
+    def last_seen_age():
+        now = time.perf_counter()
+        return {wallet: now - seen for wallet, seen in monitor.last_seen.items()}
+
+    registry.register(
+        monitor.frames,
+        monitor.decode_latency,
+        monitor.handle_latency,
+        Gauge('hlmon_wallets', 'Tracked wallets', collect=lambda: len(monitor.wallet_set)),
+        Gauge('hlmon_wallet_last_seen_seconds', 'Seconds since the last frame of a wallet',
+              labels=('wallet',), collect=last_seen_age),
+        Gauge('hlmon_ws_connected', 'Shard websocket is connected', labels=('shard',),
+              collect=lambda: {str(s.shard_id): int(s.is_connected) for s in shards()}),
+        Counter('hlmon_ws_reconnects', 'Shard websocket reconnects', labels=('shard',),
+                collect=lambda: {str(s.shard_id): s.reconnects for s in shards()}),
+        Gauge('hlmon_telegram_queue_depth', 'Messages waiting to be sent', collect=telegram_sender.qsize),
+        Counter('hlmon_telegram_sent', 'Delivered messages', collect=lambda: telegram_sender.sent_count),
+        Counter('hlmon_telegram_failed', 'Messages given up on', collect=lambda: telegram_sender.failed_count),
+        telegram_sender.send_latency,
+        telegram_sender.delivery_lag,
+        Gauge('hlmon_coalescer_pending_fills', 'Fills waiting in the coalescing window',
+              collect=lambda: sum(len(fills) for fills in monitor.coalescer.pending.values())),
+        Gauge('hlmon_fill_store_pending', 'Fills waiting for the next flush', collect=lambda: len(fill_store.pending)),
+        fill_store.flush_seconds,
+    )
+    if monitor.archive:
+        archive = monitor.archive
+        registry.register(
+            Gauge('hlmon_archive_pending', 'Rows waiting for the next archive append',
+                  collect=lambda: sum(len(rows) for rows in archive.pending.values())),
+            Counter('hlmon_archive_rows', 'Rows appended to the archive', collect=lambda: archive.archived),
+            archive.flush_seconds,
+        )
+    if hub:
+        sinks = hub.sinks
+        registry.register(
+            Gauge('hlmon_sink_queue_depth', 'Alerts waiting in a sink queue (spilled ones included)',
+                  labels=('sink',), collect=lambda: {sink.name: sink.qsize() for sink in sinks}),
+            Counter('hlmon_sink_delivered', 'Alerts delivered by a sink', labels=('sink',),
+                    collect=lambda: {sink.name: sink.delivered for sink in sinks}),
+            Counter('hlmon_sink_dropped', 'Alerts dropped from a full sink queue', labels=('sink',),
+                    collect=lambda: {sink.name: sink.dropped for sink in sinks}),
+            Counter('hlmon_sink_spilled', 'Alerts spilled to disk by a sink', labels=('sink',),
+                    collect=lambda: {sink.name: sink.spilled for sink in sinks}),
+            Counter('hlmon_sink_failed', 'Alerts a sink failed to deliver', labels=('sink',),
+                    collect=lambda: {sink.name: sink.failed for sink in sinks}),
+            hub.delivery_lag,
+        )
+    if monitor.analytics:
+        analytics = monitor.analytics
+        cache = {'at': 0.0, 'stats': {}}
+
+        def flow_stats():
+            # One snapshot per scrape for all flow gauges
+            now = time.monotonic()
+            if now - cache['at'] > 1.0:
+                cache['at'] = now
+                cache['stats'] = analytics.snapshot(int(time.time() * 1000))
+            return cache['stats']
+
+        def flow(field):
+            return lambda: {(coin, str(window)): stats[field] for (coin, window), stats in flow_stats().items()}
+
+        def flow_sides(long_field, short_field):
+            def collect():
+                values = {}
+                for (coin, window), stats in flow_stats().items():
+                    values[(coin, str(window), 'long')] = stats[long_field]
+                    values[(coin, str(window), 'short')] = stats[short_field]
+                return values
+            return collect
+
+        registry.register(
+            Gauge('hlmon_flow_fills', 'Fills of tracked wallets in the window', labels=('coin', 'window'),
+                  collect=flow('fills')),
+            Gauge('hlmon_flow_net_notional', 'Bought minus sold notional (USD) in the window',
+                  labels=('coin', 'window'), collect=flow('net_flow')),
+            Gauge('hlmon_flow_realized_pnl', 'Closed PnL (USD) in the window', labels=('coin', 'window'),
+                  collect=flow('realized_pnl')),
+            Gauge('hlmon_flow_consensus', 'Net buying minus net selling wallets, over both (-1 .. 1)',
+                  labels=('coin', 'window'), collect=flow('consensus')),
+            Gauge('hlmon_flow_open_notional', 'Notional (USD) of opening fills in the window',
+                  labels=('coin', 'window', 'side'), collect=flow_sides('open_long', 'open_short')),
+            Gauge('hlmon_flow_open_wallets', 'Distinct wallets with opening fills in the window',
+                  labels=('coin', 'window', 'side'), collect=flow_sides('open_long_wallets', 'open_short_wallets')),
+        )
+    if monitor.pool:
+        registry.register(
+            Gauge('hlmon_worker_backlog', 'Frames submitted to worker processes and not yet processed',
+                  collect=lambda: monitor.pool.backlog),
+            Counter('hlmon_worker_frames', 'Frames processed by worker processes',
+                    collect=lambda: monitor.pool.processed),
+        )
+    return registry
 
 
 async def main():
     # ایجاد sender تلگرام
-    telegram_sender = TelegramSender()
+    telegram_sender = TelegramSender(
+        TELEGRAM_BOT_TOKEN,
+        TELEGRAM_CHAT_ID,
+        api_url=TELEGRAM_API_URL,
+        global_rate=TELEGRAM_GLOBAL_RATE,
+        chat_rate=TELEGRAM_CHAT_RATE,
+        chat_burst=TELEGRAM_CHAT_BURST
+    )
     await telegram_sender.start()
 
+    # هر هشدار به همه‌ی sinkها می‌رود؛ هر کدام صف و سیاست پر شدن خودش را دارد
+    hub = AlertHub([TelegramSink(telegram_sender, max_queue=TELEGRAM_SINK_QUEUE, policy=TELEGRAM_SINK_POLICY)] +
+                   [build_sink(config) for config in ALERT_SINKS])
+    await hub.start()
+
     # ایجاد مانیتور با لیست والت‌ها
-    monitor = HyperliquidMonitor(WALLET_ADDRESSES, telegram_sender)
+    fill_store = FillStore(
+        FILL_STORE_PATH,
+        flush_interval=FILL_STORE_FLUSH_INTERVAL,
+        retention_days=FILL_RETENTION_DAYS,
+        max_fills_per_wallet=MAX_FILLS_PER_WALLET
+    )
+    await fill_store.start()
+
+    # ضبط فریم‌های خام برای replay.py
+    recorder = FrameRecorder(WS_RECORD_PATH) if WS_RECORD_PATH else None
+
+    backfill = FillBackfill(HYPERLIQUID_INFO_URL, rate=FILL_BACKFILL_RATE) if FILL_BACKFILL else None
+    if backfill:
+        await backfill.start()
+
+    # با WORKER_PROCESSES هر پروسس در فایل‌های خودش می‌نویسد؛ این پروسس اکشن‌های Coinglass را
+    archive = Archive(ARCHIVE_PATH, flush_interval=FILL_STORE_FLUSH_INTERVAL) if ARCHIVE_PATH else None
+    if archive:
+        await archive.start()
+
+    monitor = HyperliquidMonitor(WALLET_ADDRESSES, hub, fill_store,
+                                 coalesce_window=ALERT_COALESCE_WINDOW, recorder=recorder, backfill=backfill,
+                                 archive=archive)
+    if WORKER_PROCESSES:
+        # این پروسس فقط وب‌سوکت، ارسال تلگرام و هشدارهای تجمیعی را انجام می‌دهد
+        monitor.pool = WorkerPool(
+            WORKER_PROCESSES, monitor.wallet_addresses, hub.publish, monitor.process_flow,
+            FILL_STORE_PATH, on_metrics=monitor.merge_frame_metrics,
+            flush_interval=FILL_STORE_FLUSH_INTERVAL,
+            retention_days=FILL_RETENTION_DAYS,
+            max_fills_per_wallet=MAX_FILLS_PER_WALLET,
+            coalesce_window=ALERT_COALESCE_WINDOW,
+            rules_reload_interval=ALERT_RULES_RELOAD_INTERVAL,
+            idle_evict=WALLET_IDLE_EVICT,
+            backfill_url=HYPERLIQUID_INFO_URL if FILL_BACKFILL else None,
+            backfill_rate=FILL_BACKFILL_RATE / WORKER_PROCESSES,
+            archive_path=ARCHIVE_PATH,
+            frame_decoder=FRAME_DECODER
+        )
+        await monitor.pool.start()
+    metrics_task = asyncio.create_task(monitor.coalescer.report(ALERT_METRICS_INTERVAL))
+    rules_task = asyncio.create_task(monitor.alert_rules.watch(ALERT_RULES_RELOAD_INTERVAL))
+    evict_task = asyncio.create_task(monitor.evict_idle_wallets(WALLET_IDLE_EVICT))
+
+    metrics_registry = build_metrics(monitor, telegram_sender, fill_store, hub)
+    loop_lag = Histogram('hlmon_event_loop_lag_seconds', 'Event loop wake-up delay')
+    metrics_registry.register(loop_lag)
+    lag_task = asyncio.create_task(watch_loop_lag(loop_lag))
+    if METRICS_PROFILE:
+        metrics_registry.profiler = LoopProfiler(METRICS_PROFILE_INTERVAL)
+        metrics_registry.profiler.start()
+    coinglass = None
+    if COINGLASS_POLL_INTERVAL:
+        coinglass = CoinglassSource(monitor.process_coinglass_actions, COINGLASS_POLL_INTERVAL,
+                                    api_url=COINGLASS_API_URL)
+        await coinglass.start()
+        metrics_registry.register(
+            Counter('hlmon_coinglass_actions', 'Decoded Coinglass topPosition actions',
+                    collect=lambda: coinglass.actions),
+            Counter('hlmon_coinglass_new_actions', 'Coinglass actions not seen in an earlier poll',
+                    collect=lambda: coinglass.new_actions),
+            Counter('hlmon_coinglass_errors', 'Failed Coinglass requests or decodes',
+                    collect=lambda: coinglass.errors),
+        )
+    coinglass_task = asyncio.create_task(coinglass.run()) if coinglass else None
+    if METRICS_PORT:
+        await metrics_registry.serve(port=METRICS_PORT)
+
+    # تغییرات wallets.json یا API بدون ری‌استارت اعمال می‌شوند
+    registry = WalletRegistry(WALLETS_PATH, on_add=monitor.add_wallets, on_remove=monitor.remove_wallets)
+    registry_task = asyncio.create_task(registry.watch(WALLETS_RELOAD_INTERVAL))
+    if WALLET_API_PORT:
+        await registry.serve(port=WALLET_API_PORT)
 
     try:
         await monitor.connect_and_monitor()
     finally:
-        telegram_sender.stop()
+        for task in (metrics_task, rules_task, evict_task, registry_task, lag_task, coinglass_task,
+                     *monitor.resume_tasks):
+            if task:
+                task.cancel()
+        await registry.close()
+        await metrics_registry.close()
+        if monitor.pool:
+            await monitor.pool.stop()
+        if backfill:
+            await backfill.close()
+        if coinglass:
+            await coinglass.close()
+        if recorder:
+            recorder.close()
+        await fill_store.close()
+        if archive:
+            await archive.close()
+        await hub.stop()
+        await telegram_sender.stop()
 
 
 if __name__ == "__main__":
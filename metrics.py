@@ -0,0 +1,266 @@
+"""Prometheus text-format metrics and an opt-in sampling profiler for the event loop.
+
+Hot paths only touch plain counters and histogram buckets; anything that can be
+read off existing state (queue depth, reconnects, last-seen ages) is a metric with a
+`collect` callback that runs at scrape time instead of on every frame.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DELIVERY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape_label(value) -> str:
+    # The text format escapes backslash, double quote and line feed in label values
+    text = str(value)
+    if '\\' in text or '"' in text or '\n' in text:
+        text = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return text
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+    suffix = ''
+
+    def __init__(self, name: str = '', help: str = '', labels: Iterable[str] = (),
+                 collect: Optional[Callable[[], Union[float, Dict]]] = None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.children: Dict[Tuple, 'Metric'] = {}
+        # Read at scrape time instead of being updated on the hot path: returns a
+        # number, or {label value(s): number} for a labelled metric
+        self.collect = collect
+        self.value = 0
+
+    def labels(self, *values) -> 'Metric':
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = type(self)()
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.collect is not None:
+            value = self.collect()
+            for values, series_value in (value.items() if self.label_names else [((), value)]):
+                values = values if isinstance(values, tuple) else (values,)
+                lines.append(f"{self.name}{self.suffix}{_format_labels(self.label_names, values)} "
+                             f"{_format_value(series_value)}")
+            return lines
+        series = self.children.items() if self.label_names else [((), self)]
+        for values, child in list(series):
+            lines.extend(child._render_series(self.name, self.label_names, values))
+        return lines
+
+    def _render_series(self, name: str, label_names: Tuple[str, ...], values: Tuple) -> List[str]:
+        return [f"{name}{self.suffix}{_format_labels(label_names, values)} {_format_value(self.value)}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+    suffix = '_total'
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str = '', help: str = '', labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot: above the largest bucket
+        self.sum = 0.0
+
+    def labels(self, *values) -> 'Histogram':
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = Histogram(buckets=self.buckets)
+        return child
+
+    def observe(self, value: float):
+        # Non-cumulative counts; the running totals are only built at scrape time
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def take(self) -> Tuple[List[int], float]:
+        """(counts, sum) observed since the last take, and start over."""
+        taken = self.counts, self.sum
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        return taken
+
+    def merge(self, counts: List[int], total: float):
+        """Add observations taken from a histogram with the same buckets (another process's)."""
+        for i, count in enumerate(counts):
+            self.counts[i] += count
+        self.sum += total
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the largest bucket if it overflows)."""
+        total = self.count
+        if not total:
+            return 0.0
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            if running >= q * total:
+                return bound
+        return self.buckets[-1]
+
+    def _render_series(self, name, label_names, values):
+        lines = []
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(label_names, values, le)} {running}")
+        lines.append(f"{name}_sum{_format_labels(label_names, values)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(label_names, values)} {running}")
+        return lines
+
+
+class LoopProfiler:
+    """Samples the event loop thread's stack from a background thread.
+
+    Stacks are aggregated in the collapsed format used by flamegraph.pl / speedscope
+    ("outer;inner;leaf count"). Samples landing in the selector are the loop idling.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 32):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: StackCounter = StackCounter()
+        self.samples = 0
+        self.thread_id: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+
+    def start(self, thread_id: Optional[int] = None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='loop-profiler', daemon=True)
+        self.thread.start()
+        logger.info(f"Loop profiler sampling every {self.interval * 1000:.0f}ms")
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self, limit: int = 200) -> str:
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common(limit))
+
+    def reset(self):
+        self.stacks.clear()
+        self.samples = 0
+
+
+async def watch_loop_lag(histogram: Histogram, interval: float = 0.25):
+    """How late the loop wakes up from a sleep: time other callbacks held it."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        histogram.observe(max(0.0, loop.time() - start - interval))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.profiler: Optional[LoopProfiler] = None
+        self.runner: Optional[web.AppRunner] = None
+
+    def register(self, *metrics: Metric):
+        self.metrics.extend(metrics)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error(f"Metric {metric.name} not collected: {e}")
+        return '\n'.join(lines) + '\n'
+
+    async def _get_metrics(self, request: web.Request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def _get_profile(self, request: web.Request):
+        if self.profiler is None:
+            return web.Response(status=404, text="profiler disabled (METRICS_PROFILE)\n")
+        text = self.profiler.collapsed(int(request.query.get('limit', 200)))
+        if 'reset' in request.query:
+            self.profiler.reset()
+        return web.Response(text=text + '\n')
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 9108):
+        app = web.Application()
+        app.router.add_get('/metrics', self._get_metrics)
+        app.router.add_get('/debug/profile', self._get_profile)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        logger.info(f"Metrics on http://{host}:{port}/metrics")
+
+    async def close(self):
+        if self.profiler:
+            self.profiler.stop()
+        if self.runner:
+            await self.runner.cleanup()
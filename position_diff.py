@@ -0,0 +1,82 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from records import PositionRecord
+
+POSITION_OPENED = "Opened"
+POSITION_CLOSED = "Closed"
+POSITION_RESIZED = "Resized"
+
+
+class PositionEvent(NamedTuple):
+    action: str
+    key: str  # "<coin>_<side>", same keys as HyperliquidMonitor.active_positions
+    position: PositionRecord
+    previous: Optional[PositionRecord] = None
+
+
+def position_side(position: Dict) -> str:
+    # szi is signed: negative size is a short
+    szi = position.get('szi')
+    if not szi:
+        return '-'
+    return 'short' if szi[0] == '-' else 'long'
+
+
+class PositionTracker:
+    """Diffs webData2 assetPositions snapshots per wallet.
+
+    Each snapshot is reduced to a fingerprint of (coin, szi, entryPx) per position;
+    pnl, liquidation price and margin move with the mark price on every push and are
+    ignored. An unchanged fingerprint returns None without building anything else.
+    """
+
+    def __init__(self):
+        self.fingerprints: Dict[str, Tuple] = {}
+        self.positions: Dict[str, Dict[str, PositionRecord]] = {}  # wallet -> position_key -> position
+
+    @staticmethod
+    def fingerprint(asset_positions: list) -> Tuple:
+        return tuple(
+            (pos.get('coin'), pos.get('szi'), pos.get('entryPx'))
+            for pos in (item.get('position') for item in asset_positions) if pos
+        )
+
+    def diff(self, wallet_address: str, asset_positions: list) -> Optional[List[PositionEvent]]:
+        """Events since the last snapshot, [] for the first snapshot of a wallet, None if unchanged."""
+        fingerprint = self.fingerprint(asset_positions)
+        if self.fingerprints.get(wallet_address) == fingerprint:
+            return None
+        self.fingerprints[wallet_address] = fingerprint
+
+        current = {}
+        for item in asset_positions:
+            pos = item.get('position')
+            if not pos or not pos.get('coin'):
+                continue
+            side = position_side(pos)
+            current[f"{pos['coin']}_{side}"] = PositionRecord.from_dict(pos, side)
+
+        previous = self.positions.get(wallet_address)
+        self.positions[wallet_address] = current
+        if previous is None:
+            # اولین snapshot فقط مبنا است؛ برای پوزیشن‌های موجود هشدار نمی‌دهیم
+            return []
+
+        events = []
+        for key, pos in current.items():
+            old = previous.get(key)
+            if old is None:
+                events.append(PositionEvent(POSITION_OPENED, key, pos))
+            elif old.szi != pos.szi:
+                events.append(PositionEvent(POSITION_RESIZED, key, pos, old))
+        for key, pos in previous.items():
+            if key not in current:
+                events.append(PositionEvent(POSITION_CLOSED, key, pos))
+        return events
+
+    def current(self, wallet_address: str) -> Dict[str, PositionRecord]:
+        return self.positions.get(wallet_address, {})
+
+    def forget(self, wallet_address: str):
+        self.fingerprints.pop(wallet_address, None)
+        self.positions.pop(wallet_address, None)
@@ -0,0 +1,125 @@
+"""Compact in-memory records for fills and positions.
+
+Raw userFills / webData2 entries are dicts of ~15 string-keyed string values
+(hash, feeToken, builderFee, cumFunding, ...) that the monitor never reads. The
+records below keep only the fields it uses, as numbers, in `__slots__` objects;
+coins are interned to small ints shared by every wallet.
+"""
+import sys
+from typing import Dict, List, Optional
+
+
+class Interner:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[Optional[str]] = []
+        self.free: List[int] = []  # ids of forgotten names, handed out again
+
+    def __call__(self, name: str) -> int:
+        index = self.ids.get(name)
+        if index is None:
+            if self.free:
+                index = self.free.pop()
+                self.names[index] = name
+            else:
+                index = len(self.names)
+                self.names.append(name)
+            self.ids[name] = index
+        return index
+
+    def forget(self, index: int):
+        """Release an id; the caller makes sure nothing refers to it any more."""
+        del self.ids[self.names[index]]
+        self.names[index] = None
+        self.free.append(index)
+
+    def __len__(self):
+        return len(self.names)
+
+
+COINS = Interner()
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class FillRecord:
+    __slots__ = ('coin', 'tid', 'time', 'oid', 'px', 'sz', 'start_position', 'closed_pnl', 'fee',
+                 'dir', 'side', 'crossed')
+
+    def __init__(self, coin: int, tid: int, time: int, oid: int, px: float, sz: float, start_position: float,
+                 closed_pnl: float, fee: float, dir: str, side: str, crossed: bool):
+        self.coin = coin
+        self.tid = tid
+        self.time = time
+        self.oid = oid
+        self.px = px
+        self.sz = sz
+        self.start_position = start_position
+        self.closed_pnl = closed_pnl
+        self.fee = fee
+        self.dir = dir
+        self.side = side
+        self.crossed = crossed
+
+    @classmethod
+    def from_dict(cls, fill: Dict) -> 'FillRecord':
+        return cls(
+            COINS(fill.get('coin', '')),
+            fill.get('tid', 0),
+            fill.get('time', 0),
+            fill.get('oid', 0),
+            _float(fill.get('px')),
+            _float(fill.get('sz')),
+            _float(fill.get('startPosition')),
+            _float(fill.get('closedPnl')),
+            _float(fill.get('fee')),
+            sys.intern(fill.get('dir') or ''),  # a handful of distinct values ("Open Long", ...)
+            sys.intern(fill.get('side') or ''),
+            bool(fill.get('crossed')),
+        )
+
+    @property
+    def coin_name(self) -> str:
+        return COINS.names[self.coin]
+
+    def __repr__(self):
+        return f"FillRecord({self.coin_name} {self.dir} {self.sz}@{self.px} tid={self.tid})"
+
+
+class PositionRecord:
+    __slots__ = ('coin', 'side', 'szi', 'entry_px', 'unrealized_pnl', 'leverage_type', 'leverage_value')
+
+    def __init__(self, coin: int, side: str, szi: float, entry_px: float, unrealized_pnl: float,
+                 leverage_type: str, leverage_value: int):
+        self.coin = coin
+        self.side = side
+        self.szi = szi
+        self.entry_px = entry_px
+        self.unrealized_pnl = unrealized_pnl
+        self.leverage_type = leverage_type
+        self.leverage_value = leverage_value
+
+    @classmethod
+    def from_dict(cls, position: Dict, side: str) -> 'PositionRecord':
+        leverage = position.get('leverage') or {}
+        return cls(
+            COINS(position.get('coin', '')),
+            side,
+            _float(position.get('szi')),
+            _float(position.get('entryPx')),
+            _float(position.get('unrealizedPnl')),
+            sys.intern(leverage.get('type') or ''),
+            leverage.get('value', 0),
+        )
+
+    @property
+    def coin_name(self) -> str:
+        return COINS.names[self.coin]
+
+    def __repr__(self):
+        return f"PositionRecord({self.coin_name} {self.side} {self.szi}@{self.entry_px})"
@@ -0,0 +1,365 @@
+"""Record-and-replay of Hyperliquid websocket traffic.
+
+Recordings are gzip text files with one frame per line: "<seconds since start>\\t<raw frame>".
+
+    python replay.py synth  --out storage/synthetic.rec.gz
+    python replay.py serve  --recording storage/live.rec.gz --speed 10
+    python replay.py bench  --recording storage/live.rec.gz --wallets 1000 --speed 0
+
+Set WS_RECORD_PATH to make the monitor capture live frames, and HYPERLIQUID_WS_URL
+to point it at `replay.py serve`.
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+import websockets
+
+from decoding import peek_channel
+from sinks import LocalSender
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRecorder:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = gzip.open(path, 'at', encoding='utf-8', compresslevel=6)
+        self.start = time.monotonic()
+        self.count = 0
+
+    def record(self, message):
+        if isinstance(message, bytes):
+            message = message.decode('utf-8', 'replace')
+        self.file.write(f"{time.monotonic() - self.start:.6f}\t{message}\n")
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+        logger.info(f"Recorded {self.count} frames")
+
+
+def load_recording(path: str) -> List[Tuple[float, str]]:
+    frames = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            offset, _, message = line.rstrip('\n').partition('\t')
+            frames.append((float(offset), message))
+    return frames
+
+
+def web_data2_frame(wallet: str, coins: List[str]) -> str:
+    positions = [{
+        "type": "oneWay",
+        "position": {
+            "coin": coin, "szi": f"{random.uniform(-500, 500):.4f}", "entryPx": f"{random.uniform(1, 100000):.2f}",
+            "liquidationPx": f"{random.uniform(1, 100000):.2f}", "positionValue": "154230.12",
+            "unrealizedPnl": "-1234.5", "returnOnEquity": "-0.12", "marginUsed": "15423.0",
+            "leverage": {"type": "cross", "value": 10}, "maxLeverage": 50,
+            "cumFunding": {"allTime": "123.4", "sinceOpen": "12.3", "sinceChange": "1.2"}
+        }
+    } for coin in coins[-6:]]
+    asset_ctxs = [{
+        "funding": "0.0000125", "openInterest": "123456.78", "prevDayPx": "104000.0", "dayNtlVlm": "987654321.0",
+        "premium": "0.0001", "oraclePx": "104250.0", "markPx": "104251.0", "midPx": "104250.5",
+        "impactPxs": ["104250.0", "104251.0"]
+    } for _ in coins]
+    return json.dumps({"channel": "webData2", "data": {
+        "user": wallet,
+        "clearinghouseState": {
+            "marginSummary": {"accountValue": "1543210.0", "totalNtlPos": "9876543.0", "totalMarginUsed": "987654.0"},
+            "assetPositions": positions, "withdrawable": "123456.0", "time": int(time.time() * 1000)
+        },
+        "openOrders": [{"coin": coins[i % len(coins)], "side": "B", "limitPx": "100.0", "sz": "1.0", "oid": i}
+                       for i in range(40)],
+        "assetCtxs": asset_ctxs, "serverTime": int(time.time() * 1000), "isVault": False,
+        "spotState": {"balances": [{"coin": "USDC", "total": "1234.5", "hold": "0.0"}] * 10}
+    }})
+
+
+def opening_fill(coins: List[str]) -> Dict:
+    """A fill that opens on a large position, so it passes the default alert rules (rules.DEFAULT_RULES)."""
+    coin = random.choice(coins)
+    long = random.random() < 0.5
+    px = random.uniform(1, 100000)
+    return {
+        "coin": coin, "px": f"{px:.2f}", "sz": f"{random.uniform(1, 50):.4f}", "side": "B" if long else "A",
+        "time": int(time.time() * 1000), "startPosition": f"{random.uniform(1000, 5000) * (1 if long else -1):.4f}",
+        "dir": "Open Long" if long else "Open Short", "closedPnl": "0.0", "hash": f"0x{random.getrandbits(256):064x}",
+        "oid": random.getrandbits(40), "crossed": True, "fee": f"{px * 0.00035:.6f}",
+        "tid": random.getrandbits(50), "feeToken": "USDC",
+    }
+
+
+def synthesize_frames(wallets: List[str], count: int, storage: str = 'storage') -> List[str]:
+    """Live-shaped frames: userFills from the fills recorded in storage/, full-size webData2.
+
+    One userFills frame in three also carries a fill that passes the default alert
+    rules, so the bench measures alerts even when the recorded fills never would.
+    """
+    recorded = []
+    for path in glob.glob(os.path.join(storage, 'active_fills_*.json')):
+        with open(path) as f:
+            fills = list(json.loads(f.read()).values())
+        if fills:
+            recorded.append(fills)
+    coins = sorted({fill['coin'] for fills in recorded for fill in fills}) + [f"COIN{i}" for i in range(180)]
+
+    frames = []
+    for i in range(count):
+        wallet = random.choice(wallets)
+        kind = i % 10
+        if kind < 6:
+            frames.append(web_data2_frame(wallet, coins))
+        elif kind < 9:
+            fills = []
+            if recorded:
+                fills = random.choice(recorded)
+                start = random.randrange(len(fills))
+                fills = fills[start:start + 5]
+            if kind == 6 or not fills:
+                fills = fills + [opening_fill(coins[:10])]
+            frames.append(json.dumps({"channel": "userFills", "data": {"user": wallet, "fills": fills}}))
+        else:
+            frames.append(json.dumps({"channel": "subscriptionResponse", "data": {"method": "subscribe"}}))
+    return frames
+
+
+class MockHyperliquidServer:
+    """Serves a recording to every client that subscribes.
+
+    Each subscribed wallet is mapped onto one of the recorded wallets and receives that
+    wallet's frames with the address rewritten, so any number of wallets can be driven
+    from a small recording. userFills get fresh `time`/`tid` values on every pass, which
+    keeps them inside the alert recency window and out of the tid dedup.
+    speed: 1 = real time, N = N times faster, 0 = as fast as possible.
+    """
+
+    def __init__(self, frames: List[Tuple[float, str]], speed: float = 1.0, loop: bool = False):
+        self.speed = speed
+        self.loop = loop
+        self.frames = []  # (offset, channel, recorded user, raw frame, decoded frame for userFills)
+        for offset, message in frames:
+            channel = peek_channel(message)
+            if channel not in ('userFills', 'webData2'):
+                continue
+            data = json.loads(message)
+            user = (data.get('data') or {}).get('user', '').lower()
+            self.frames.append((offset, channel, user, message, data if channel == 'userFills' else None))
+        self.recorded_users = sorted({frame[2] for frame in self.frames})
+        self.sent = 0
+
+    def _render(self, frame: tuple, wallet: str, pass_index: int) -> str:
+        _, channel, user, message, data = frame
+        if data is None:
+            return message.replace(user, wallet)
+
+        now = int(time.time() * 1000)
+        fills = [{**fill, 'time': now, 'tid': fill.get('tid', 0) + pass_index * 10 ** 15 + zlib.crc32(wallet.encode())}
+                 for fill in data['data'].get('fills', [])]
+        return json.dumps({"channel": channel, "data": {**data['data'], "user": wallet, "fills": fills}})
+
+    async def _playback(self, websocket, subscriptions: Dict[str, Set[str]]):
+        pass_index = 0
+        while True:
+            start = time.monotonic()
+            for frame in self.frames:
+                if self.speed:
+                    delay = frame[0] / self.speed - (time.monotonic() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    await asyncio.sleep(0)
+                for wallet in subscriptions[frame[1]].get(frame[2], ()):
+                    await websocket.send(self._render(frame, wallet, pass_index))
+                    self.sent += 1
+            if not self.loop:
+                return
+            pass_index += 1
+
+    async def handler(self, websocket):
+        # channel -> recorded user -> subscribed wallets replaying it
+        subscriptions: Dict[str, Dict[str, Set[str]]] = {'userFills': {}, 'webData2': {}}
+        playback: Optional[asyncio.Task] = None
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                subscription = request.get('subscription') or {}
+                channel, wallet = subscription.get('type'), subscription.get('user', '').lower()
+                if channel in subscriptions and self.recorded_users:
+                    recorded_user = self.recorded_users[zlib.crc32(wallet.encode()) % len(self.recorded_users)]
+                    wallets = subscriptions[channel].setdefault(recorded_user, set())
+                    if request.get('method') == 'unsubscribe':
+                        wallets.discard(wallet)
+                    else:
+                        wallets.add(wallet)
+                await websocket.send(json.dumps({"channel": "subscriptionResponse", "data": request}))
+                if playback is None:
+                    playback = asyncio.create_task(self._playback(websocket, subscriptions))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if playback:
+                playback.cancel()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765):
+        async with websockets.serve(self.handler, host, port, max_size=None):
+            logger.info(f"Mock Hyperliquid on ws://{host}:{port} ({len(self.frames)} frames, "
+                        f"{len(self.recorded_users)} recorded wallets, speed {self.speed or 'max'})")
+            await asyncio.Future()
+
+
+def _serve_process(recording: str, speed: float, loop: bool, port: int):
+    logging.basicConfig(level=logging.WARNING)
+    server = MockHyperliquidServer(load_recording(recording), speed=speed, loop=loop)
+    asyncio.run(server.serve(port=port))
+
+
+class LatencySink(LocalSender):
+    """Measures frame -> queued alert latency in place of TelegramSender."""
+
+    def __init__(self):
+        super().__init__()
+        self.alerts = 0
+        self.by_kind: Dict[str, List[float]] = {}  # template -> lags
+
+    def publish(self, message: str, chat_id: Optional[str] = None, created_at: Optional[float] = None):
+        self.alerts += 1
+        if created_at:
+            self.lag_samples.append(time.time() - created_at)
+            # Digests only come from the fill coalescer
+            self.by_kind.setdefault(getattr(message, 'template', 'fills'), []).append(self.lag_samples[-1])
+
+
+async def run_bench(args):
+    import main as monitor_main
+    from main import HyperliquidMonitor
+    from fill_store import FillStore
+    from rules import AlertRules
+
+    process = multiprocessing.Process(target=_serve_process, args=(args.recording, args.speed, True, args.port),
+                                      daemon=True)
+    process.start()
+    url = f"ws://127.0.0.1:{args.port}"
+    for _ in range(50):
+        try:
+            async with websockets.connect(url):
+                break
+        except OSError:
+            await asyncio.sleep(0.2)
+
+    wallets = [f"0x{random.getrandbits(160):040x}" for _ in range(args.wallets)]
+    sink = LatencySink()
+    with tempfile.TemporaryDirectory() as directory:
+        fill_store = FillStore(os.path.join(directory, 'fills.db'))
+        await fill_store.start()
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        monitor = HyperliquidMonitor(wallets, sink, fill_store, coalesce_window=0,
+                                     ws_url=url)
+        if args.rules:
+            monitor.alert_rules = monitor.coalescer.predicate = AlertRules(args.rules)
+
+        frames = 0
+        handle_message = monitor.handle_message
+
+        async def counting_handler(message):
+            nonlocal frames
+            frames += 1
+            await handle_message(message)
+
+        monitor.handle_message = counting_handler
+        # The mock has no rate limit; at the live 30/s a shard needs ~30 s before its userFills subscriptions go out
+        monitor_main.WS_SUBSCRIBE_RATE = args.subscribe_rate
+        task = asyncio.create_task(monitor.connect_and_monitor())
+        # Measure from the point every wallet is subscribed to both channels
+        deadline = time.monotonic() + 60
+        while monitor.frame_counts['other'] < 2 * args.wallets and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        frames = 0
+
+        usage_start = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.monotonic()
+        await asyncio.sleep(args.duration)
+        elapsed = time.monotonic() - start
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await fill_store.close()
+    process.terminate()
+
+    per_1k = args.wallets / 1000
+    cpu = (usage.ru_utime - usage_start.ru_utime + usage.ru_stime - usage_start.ru_stime) / elapsed
+    print(f"wallets:    {args.wallets}, {frames / elapsed:,.0f} frames/s over {elapsed:.0f}s")
+    for kind, lags in sorted(sink.by_kind.items()):
+        lags.sort()
+        print(f"latency:    frame -> queued {kind} alert p50 {statistics.median(lags) * 1e3:.1f} ms, "
+              f"p99 {lags[int(len(lags) * 0.99)] * 1e3:.1f} ms ({len(lags)} alerts)")
+    if 'fills' not in sink.by_kind:
+        print(f"latency:    no fill alerts ({sink.alerts} alerts in all): no fill in the recording passed the "
+              f"alert rules (see --rules)")
+    print(f"cpu:        {cpu * 100:.1f}% of a core ({cpu * 100 / per_1k:.1f}% per 1k wallets)")
+    print(f"memory:     max RSS {usage.ru_maxrss / 1024:.0f} MB "
+          f"(+{(usage.ru_maxrss - rss_before) / 1024 / per_1k:.1f} MB per 1k wallets)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay harness for Hyperliquid websocket traffic")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    synth = commands.add_parser('synth', help="write a recording synthesized from storage/ fills")
+    synth.add_argument('--out', default='storage/synthetic.rec.gz')
+    synth.add_argument('--frames', type=int, default=2000)
+    synth.add_argument('--wallets', type=int, default=13)
+    synth.add_argument('--rate', type=float, default=50, help="frames per second in the recording")
+
+    serve = commands.add_parser('serve', help="replay a recording as a mock websocket server")
+    serve.add_argument('--recording', required=True)
+    serve.add_argument('--speed', type=float, default=1.0, help="1 = real time, N = N x faster, 0 = max")
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--loop', action='store_true')
+
+    bench = commands.add_parser('bench', help="run the monitor against the mock server and report latency/CPU/RSS")
+    bench.add_argument('--recording', required=True)
+    bench.add_argument('--wallets', type=int, default=1000)
+    bench.add_argument('--speed', type=float, default=0)
+    bench.add_argument('--duration', type=float, default=20)
+    bench.add_argument('--port', type=int, default=8765)
+    bench.add_argument('--subscribe-rate', type=float, default=1000, help="subscriptions/s per connection")
+    bench.add_argument('--rules', help="alert rules file instead of ALERT_RULES_PATH, for recordings whose fills "
+                                       "the configured rules never match")
+
+    args = parser.parse_args()
+
+    if args.command == 'synth':
+        random.seed(1)
+        wallets = [f"0x{random.getrandbits(160):040x}" for _ in range(args.wallets)]
+        with gzip.open(args.out, 'wt', encoding='utf-8') as f:
+            for i, frame in enumerate(synthesize_frames(wallets, args.frames)):
+                f.write(f"{i / args.rate:.6f}\t{frame}\n")
+        print(f"Wrote {args.frames} frames to {args.out}")
+
+    elif args.command == 'serve':
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        server = MockHyperliquidServer(load_recording(args.recording), speed=args.speed, loop=args.loop)
+        asyncio.run(server.serve(port=args.port))
+
+    elif args.command == 'bench':
+        logging.disable(logging.INFO)
+        asyncio.run(run_bench(args))
+
+
+if __name__ == '__main__':
+    main()
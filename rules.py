@@ -0,0 +1,308 @@
+"""Alert rules loaded from a JSON file.
+
+    {
+      "groups": {"whales": ["0x...", "0x..."]},
+      "rules": [
+        {"name": "big-opens", "directions": ["Open"], "min_notional": 100000, "max_age": 3600},
+        {"name": "whales-btc", "groups": ["whales"], "coins": ["BTC"], "leverage": "cross"},
+        {"name": "no-spot", "directions": ["Buy", "Sell"], "action": "drop"}
+      ]
+    }
+
+A fill alerts when no "drop" rule matches it and at least one "alert" rule does.
+Every condition of a rule must hold; omitted conditions are not checked.
+
+    events                       "fills" (default) and/or "positions", what the rule applies to
+    coins / exclude_coins        coin names
+    directions                   substrings of the fill's `dir` ("Open", "Close Short", ...)
+    side                         "long" / "short"
+    leverage                     "cross" / "isolated"
+    wallets / groups             addresses, or group names from "groups"
+    min_notional / max_notional  px * sz in USD
+    min_start_position           abs(startPosition), the position size before the fill
+    max_age                      seconds since the fill time
+
+Position rules see the position changes found in webData2 snapshots, with `dir`
+"<Opened|Resized|Closed> <Long|Short>", the notional of the position after the
+change (of the closed position for "Closed") and, as min_start_position, the
+size before it. Resized alerts only when a rule names it:
+
+    {"name": "big-positions", "events": ["positions"], "directions": ["Opened", "Closed"], "min_notional": 100000}
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from records import PositionRecord
+
+logger = logging.getLogger(__name__)
+
+RULE_FIELDS = {
+    'name', 'action', 'events', 'coins', 'exclude_coins', 'directions', 'side', 'leverage',
+    'wallets', 'groups', 'min_notional', 'max_notional', 'min_start_position', 'max_age'
+}
+EVENTS = ('fills', 'positions')
+LIST_FIELDS = ('events', 'coins', 'exclude_coins', 'directions', 'wallets', 'groups')
+STRING_FIELDS = ('name', 'action', 'side', 'leverage')
+NUMBER_FIELDS = ('min_notional', 'max_notional', 'min_start_position', 'max_age')
+CHOICE_FIELDS = {'side': ('long', 'short'), 'leverage': ('cross', 'isolated')}  # matched case-insensitively
+
+# Used when the rules file cannot be loaded at startup: the filters the monitor had before rule files
+DEFAULT_RULES = {
+    'rules': [
+        {'name': 'opens-on-large-positions', 'directions': ['Open'], 'min_start_position': 1000, 'max_age': 3600},
+        {'name': 'large-positions-opened-or-closed', 'events': ['positions'], 'directions': ['Opened', 'Closed'],
+         'min_notional': 100000},
+    ]
+}
+
+
+class FillFacts(NamedTuple):
+    """The fields rules look at, parsed once per fill."""
+    coin: str
+    wallet: str
+    dir: str
+    crossed: bool
+    notional: float
+    start_position: float
+    age: float
+
+    @classmethod
+    def from_fill(cls, fill: Dict, wallet_address: str, now: Optional[float] = None) -> 'FillFacts':
+        try:
+            notional = float(fill.get('px', 0)) * float(fill.get('sz', 0))
+            start_position = abs(float(fill.get('startPosition', 0)))
+        except (ValueError, TypeError):
+            notional = start_position = 0.0
+        return cls(
+            fill.get('coin', ''),
+            wallet_address,
+            fill.get('dir') or '',
+            bool(fill.get('crossed')),
+            notional,
+            start_position,
+            (now or time.time()) - fill.get('time', 0) / 1e3,
+        )
+
+    @classmethod
+    def from_position(cls, action: str, position: PositionRecord, wallet_address: str,
+                      previous: Optional[PositionRecord] = None) -> 'FillFacts':
+        if previous is not None:
+            start_position = abs(previous.szi)
+        else:
+            start_position = abs(position.szi) if action == 'Closed' else 0.0
+        return cls(
+            position.coin_name,
+            wallet_address,
+            f"{action} {position.side.title()}",
+            position.leverage_type == 'cross',
+            abs(position.szi) * position.entry_px,
+            start_position,
+            0.0,
+        )
+
+
+class CompiledRule(NamedTuple):
+    name: str
+    action: str
+    coins: Optional[frozenset]  # index key; None = any coin
+    wallets: Optional[frozenset]  # index key; None = any wallet
+    predicate: Callable[[FillFacts], bool]
+
+
+def is_string_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def check_rule(spec, index: int):
+    """ValueError unless `spec` is a rule object whose fields have the right types."""
+    if not isinstance(spec, dict):
+        raise ValueError(f"rule {index}: must be an object, not {type(spec).__name__}")
+    unknown = set(spec) - RULE_FIELDS
+    if unknown:
+        raise ValueError(f"rule {spec.get('name', index)}: unknown fields {sorted(unknown)}")
+    for field in LIST_FIELDS:
+        if field in spec and not is_string_list(spec[field]):
+            raise ValueError(f"rule {spec.get('name', index)}: {field} must be a list of strings")
+    for field in STRING_FIELDS:
+        if field in spec and not isinstance(spec[field], str):
+            raise ValueError(f"rule {index}: {field} must be a string")
+    for field in NUMBER_FIELDS:
+        if field in spec and (isinstance(spec[field], bool) or not isinstance(spec[field], (int, float))):
+            raise ValueError(f"rule {spec.get('name', index)}: {field} must be a number")
+    for field, choices in CHOICE_FIELDS.items():
+        if field in spec and spec[field].lower() not in choices:
+            raise ValueError(f"rule {spec.get('name', index)}: {field} must be one of {list(choices)}")
+
+
+def compile_rule(spec: Dict, groups: Dict[str, List[str]], index: int) -> CompiledRule:
+    check_rule(spec, index)
+
+    # Conditions become one `and` expression evaluated by a single lambda; values are
+    # bound as names in the lambda's globals, never pasted into the source
+    conditions = []
+    env = {}
+
+    def bind(name, value):
+        env[name] = value
+        return name
+
+    if not set(spec.get('events', ('fills',))) <= set(EVENTS):
+        raise ValueError(f"rule {spec.get('name', index)}: events must be among {list(EVENTS)}")
+
+    coins = frozenset(spec['coins']) if spec.get('coins') else None
+    if spec.get('exclude_coins'):
+        conditions.append(f"f.coin not in {bind('exclude_coins', frozenset(spec['exclude_coins']))}")
+
+    wallets = set(address.lower() for address in spec.get('wallets', ()))
+    for group in spec.get('groups', ()):
+        if group not in groups:
+            raise ValueError(f"rule {spec.get('name', index)}: unknown group {group}")
+        wallets.update(address.lower() for address in groups[group])
+    wallets = frozenset(wallets) if wallets or spec.get('groups') else None
+
+    if spec.get('directions'):
+        directions = tuple(spec['directions'])
+        if len(directions) == 1:
+            conditions.append(f"{bind('direction', directions[0])} in f.dir")
+        else:
+            conditions.append(f"any(d in f.dir for d in {bind('directions', directions)})")
+    if spec.get('side'):
+        conditions.append(f"{bind('side', spec['side'].title())} in f.dir")
+    if spec.get('leverage'):
+        conditions.append("f.crossed" if spec['leverage'].lower() == 'cross' else "not f.crossed")
+    if 'min_notional' in spec:
+        conditions.append(f"f.notional >= {bind('min_notional', float(spec['min_notional']))}")
+    if 'max_notional' in spec:
+        conditions.append(f"f.notional <= {bind('max_notional', float(spec['max_notional']))}")
+    if 'min_start_position' in spec:
+        conditions.append(f"f.start_position >= {bind('min_start_position', float(spec['min_start_position']))}")
+    if 'max_age' in spec:
+        conditions.append(f"f.age <= {bind('max_age', float(spec['max_age']))}")
+
+    predicate = eval(f"lambda f: {' and '.join(conditions) or 'True'}", {'__builtins__': {'any': any}, **env})
+
+    action = spec.get('action', 'alert')
+    if action not in ('alert', 'drop'):
+        raise ValueError(f"rule {spec.get('name', index)}: action must be 'alert' or 'drop'")
+    return CompiledRule(spec.get('name', f'rule-{index}'), action, coins, wallets, predicate)
+
+
+class RuleSet:
+    """Compiled rules indexed by coin, so a fill only runs the rules that can apply to it."""
+
+    def __init__(self, rules: List[CompiledRule]):
+        self.rules = rules
+        self.by_coin: Dict[str, Tuple[List[CompiledRule], List[CompiledRule]]] = {}
+        self.any_coin: Tuple[List[CompiledRule], List[CompiledRule]] = ([], [])
+        self.any_wallet = False
+        self.wallets = set()
+
+        for rule in rules:
+            targets = [self.any_coin] if rule.coins is None else \
+                [self.by_coin.setdefault(coin, ([], [])) for coin in rule.coins]
+            for drops, alerts in targets:
+                (drops if rule.action == 'drop' else alerts).append(rule)
+            if rule.action == 'alert':
+                if rule.wallets is None:
+                    self.any_wallet = True
+                else:
+                    self.wallets.update(rule.wallets)
+
+        # coin -> (drop rules, alert rules), "any coin" rules included
+        for coin, (drops, alerts) in self.by_coin.items():
+            drops.extend(self.any_coin[0])
+            alerts.extend(self.any_coin[1])
+        self.alert_coins = None if self.any_coin[1] else {
+            coin for coin, (_, alerts) in self.by_coin.items() if alerts}
+
+    @classmethod
+    def from_config(cls, config: Dict, events: str = 'fills') -> 'RuleSet':
+        """The rules of the config that apply to `events` ("fills" or "positions")."""
+        if not isinstance(config, dict):
+            raise ValueError(f"rules config must be an object, not {type(config).__name__}")
+        groups = config.get('groups', {})
+        if not isinstance(groups, dict) or not all(is_string_list(members) for members in groups.values()):
+            raise ValueError("groups must map group names to lists of addresses")
+        specs = config.get('rules', [])
+        if not isinstance(specs, list):
+            raise ValueError("rules must be a list")
+        for i, spec in enumerate(specs):
+            check_rule(spec, i)
+        return cls([compile_rule(spec, groups, i) for i, spec in enumerate(specs)
+                    if events in spec.get('events', ('fills',))])
+
+    def may_match(self, wallet_address: str, coin: str) -> bool:
+        """Cheap pre-check on coin and wallet only, used before a fill is buffered."""
+        if self.alert_coins is not None and coin not in self.alert_coins:
+            return False
+        return self.any_wallet or wallet_address in self.wallets
+
+    def match(self, facts: FillFacts) -> Optional[str]:
+        """Name of the first alert rule matching the fill, or None."""
+        drops, alerts = self.by_coin.get(facts.coin, self.any_coin)
+        for rule in drops:
+            if (rule.wallets is None or facts.wallet in rule.wallets) and rule.predicate(facts):
+                return None
+        for rule in alerts:
+            if (rule.wallets is None or facts.wallet in rule.wallets) and rule.predicate(facts):
+                return rule.name
+        return None
+
+    def __call__(self, fill: Dict, wallet_address: str) -> bool:
+        return self.match(FillFacts.from_fill(fill, wallet_address)) is not None
+
+
+class AlertRules:
+    """A RuleSet backed by a JSON file, recompiled whenever the file changes.
+
+    A file that cannot be loaded at startup falls back to DEFAULT_RULES; a bad
+    edit later keeps the last rules that loaded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = None
+        self.rule_set = RuleSet.from_config(DEFAULT_RULES)
+        self.position_rules = RuleSet.from_config(DEFAULT_RULES, 'positions')
+        if not self.reload():
+            logger.warning(f"Using the default alert rules until {self.path} loads")
+
+    def reload(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self.mtime:
+                return False
+            with open(self.path, 'r') as f:
+                config = json.loads(f.read())
+            rule_set = RuleSet.from_config(config)
+            position_rules = RuleSet.from_config(config, 'positions')
+        except (OSError, ValueError, SyntaxError) as e:
+            logger.error(f"Alert rules not loaded ({self.path}): {e}")
+            return False
+
+        self.mtime = mtime
+        self.rule_set = rule_set
+        self.position_rules = position_rules
+        logger.info(f"Loaded {len(rule_set.rules)} fill and {len(position_rules.rules)} position alert rules "
+                    f"from {self.path}")
+        return True
+
+    async def watch(self, interval: float = 5.0):
+        while True:
+            await asyncio.sleep(interval)
+            self.reload()
+
+    def may_match(self, wallet_address: str, coin: str) -> bool:
+        return self.rule_set.may_match(wallet_address, coin)
+
+    def __call__(self, fill: Dict, wallet_address: str) -> bool:
+        return self.rule_set(fill, wallet_address)
+
+    def match_position(self, action: str, position: PositionRecord, wallet_address: str,
+                       previous: Optional[PositionRecord] = None) -> Optional[str]:
+        """Name of the position rule a position change alerts on, or None."""
+        return self.position_rules.match(FillFacts.from_position(action, position, wallet_address, previous))
@@ -0,0 +1,496 @@
+"""Alert fan-out to several destinations ("sinks").
+
+AlertHub takes the place of TelegramSender for the monitor, coalescer and
+worker pool (same queue_message/publish signatures) and hands every alert to each
+sink's own bounded queue. Each sink is drained by its own task, so a slow or dead
+sink only ever fills its own queue. What happens when a queue is full is the
+sink's policy:
+
+    drop_oldest  the oldest queued alert is dropped (counted)
+    block        queue_message waits for room in the full sinks (all at once, so one
+                 slow sink does not hold up the others' puts). publish, used on the
+                 websocket path, never waits: there a full block sink drops its
+                 oldest alert (counted), so the pending work stays bounded
+    spill        alerts go to a JSONL file next to the queue and are read back, in
+                 order, once the sink has caught up (Telegram's default)
+
+Sinks:
+
+    telegram  the TelegramSender, HTML text
+    webhook   POST of a JSON array of events, batched by size and linger time
+    jsonl     one JSON event per line to a file, or stdout with path "-"
+    pubsub    JSON lines to every client of a local socket (unix path or host:port);
+              a client can send "SUB fills flow" to pick event types
+
+Structured sinks get one event per alert, with the raw fields rather than the
+message text:
+
+    {"type": "fills", "created_at": 1750000000.1, "wallet": "0x...", "coin": "BTC", "px": "...", ...}
+
+Sinks are configured with ALERT_SINKS, a JSON list:
+
+    [{"type": "webhook", "url": "http://127.0.0.1:9000/alerts", "policy": "drop_oldest", "max_queue": 10000},
+     {"type": "jsonl", "path": "storage/alerts.jsonl"},
+     {"type": "pubsub", "path": "storage/alerts.sock", "policy": "spill"}]
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from coalescer import Digest
+from metrics import DELIVERY_BUCKETS, Histogram
+from telegram_sender import TelegramSender
+from templates import LazyMessage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+SPILL = 'spill'
+POLICIES = (DROP_OLDEST, BLOCK, SPILL)
+
+Item = Tuple[object, Optional[str], float]  # (message, chat_id, created_at)
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def event_records(message, created_at: float) -> List[Dict]:
+    """The structured events of one queued alert (a Digest holds several)."""
+    if isinstance(message, Digest):
+        return [record for m in message.messages for record in event_records(m, created_at)]
+    if isinstance(message, LazyMessage):
+        record = {'type': message.template, 'created_at': created_at}
+        record.update(message.data())
+        return [record]
+    return [{'type': 'text', 'created_at': created_at, 'text': str(message)}]
+
+
+def _encode_message(message):
+    if isinstance(message, Digest):
+        return {'digest': [_encode_message(m) for m in message.messages]}
+    if isinstance(message, LazyMessage):
+        return {'template': message.template, 'fields': message.fields, 'locale': message.locale}
+    return str(message)
+
+
+def _decode_message(value):
+    if isinstance(value, str):
+        return value
+    if 'digest' in value:
+        return Digest([_decode_message(m) for m in value['digest']])
+    return LazyMessage(value['template'], value['fields'], value['locale'])
+
+
+class Sink:
+    """A destination with its own bounded queue and delivery task. Subclasses implement deliver()."""
+
+    def __init__(self, name: str, max_queue: int = 10000, policy: str = DROP_OLDEST,
+                 batch_size: int = 1, linger: float = 0.0, spill_path: Optional[str] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown sink policy: {policy}")
+        if policy == SPILL and not spill_path:
+            raise ValueError(f"Sink {name}: the spill policy needs a spill_path")
+        self.name = name
+        self.max_queue = max_queue
+        self.policy = policy
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+        self.spill_path = spill_path
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.spill_writer = None
+        self.spill_reader = None
+        self.spill_pending = 0
+
+        self.delivered = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+        self.lag: Optional[Histogram] = None  # set by AlertHub
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.max_queue)
+        if self.policy == SPILL:
+            os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+            self.spill_writer = open(self.spill_path, 'ab')
+            self.spill_reader = open(self.spill_path, 'rb')
+            # Whatever an earlier run left behind is delivered first
+            self.spill_pending = sum(1 for _ in self.spill_reader)
+            self.spill_reader.seek(0)
+        self.task = asyncio.create_task(self._run())
+
+    def qsize(self) -> int:
+        return (self.queue.qsize() if self.queue else 0) + self.spill_pending
+
+    def put_nowait(self, item: Item):
+        if self.policy == SPILL and self.spill_pending:
+            # Once spilling, everything goes to the file until it is read back, to keep the order
+            self._spill(item)
+        elif self.queue.full():
+            if self.policy == DROP_OLDEST:
+                self.queue.get_nowait()
+                self.dropped += 1
+                self.queue.put_nowait(item)
+            elif self.policy == SPILL:
+                self._spill(item)
+            else:
+                raise asyncio.QueueFull
+        else:
+            self.queue.put_nowait(item)
+
+    async def put(self, item: Item):
+        if self.policy == BLOCK:
+            await self.queue.put(item)
+        else:
+            self.put_nowait(item)
+
+    def offer(self, item: Item):
+        """put_nowait for publishers that never wait: a full block sink drops its oldest alert."""
+        if self.policy == BLOCK and self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.put_nowait(item)
+
+    def _spill(self, item: Item):
+        message, chat_id, created_at = item
+        self.spill_writer.write(dumps([_encode_message(message), chat_id, created_at]) + b'\n')
+        self.spill_pending += 1
+        self.spilled += 1
+
+    def _read_spill(self, count: int) -> List[Item]:
+        self.spill_writer.flush()
+        items = []
+        while len(items) < count and self.spill_pending:
+            line = self.spill_reader.readline()
+            if not line:
+                self.spill_pending = 0
+                break
+            self.spill_pending -= 1
+            try:
+                message, chat_id, created_at = json.loads(line)
+                items.append((_decode_message(message), chat_id, created_at))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"Sink {self.name}: bad spill line: {e}")
+        if not self.spill_pending:
+            # Caught up: start the file over
+            self.spill_writer.truncate(0)
+            self.spill_reader.seek(0)
+        return items
+
+    async def _next_batch(self) -> List[Item]:
+        if self.queue.empty() and self.spill_pending:
+            return self._read_spill(self.batch_size)
+        batch = [await self.queue.get()]
+        if self.linger and self.batch_size > 1 and self.queue.qsize() < self.batch_size - 1:
+            await asyncio.sleep(self.linger)
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            try:
+                delivered = await self.deliver(batch)
+                delivered = len(batch) if delivered is None else delivered
+                self.delivered += delivered
+                self.failed += len(batch) - delivered
+                if self.lag and delivered:
+                    now = time.time()
+                    for _, _, created_at in batch:
+                        self.lag.observe(now - created_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Sink {self.name} error: {e}")
+
+    async def deliver(self, batch: List[Item]) -> Optional[int]:
+        """Send a batch; returns how many of its alerts were delivered, None for all of them."""
+        raise NotImplementedError
+
+    async def drain(self, timeout: float = 5.0):
+        """Wait (up to timeout) until everything queued so far was handed to deliver()."""
+        deadline = time.monotonic() + timeout
+        while self.qsize() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.spill_writer:
+            self.spill_writer.close()
+            self.spill_reader.close()
+            self.spill_writer = self.spill_reader = None
+
+
+class TelegramSink(Sink):
+    """Forwards to TelegramSender, one batch at a time, so a rate-limited chat backs up in this queue."""
+
+    def __init__(self, sender: TelegramSender, **options):
+        options.setdefault('policy', SPILL)
+        options.setdefault('batch_size', 30)
+        if options['policy'] == SPILL:
+            options.setdefault('spill_path', 'storage/spill-telegram.jsonl')
+        super().__init__('telegram', **options)
+        self.sender = sender
+
+    async def deliver(self, batch: List[Item]) -> int:
+        # The sender retries on its own and only counts what Telegram accepted
+        sent = self.sender.sent_count
+        for message, chat_id, created_at in batch:
+            await self.sender.queue_message(message, chat_id=chat_id, created_at=created_at)
+        await self.sender.join()
+        return self.sender.sent_count - sent
+
+
+class WebhookSink(Sink):
+    def __init__(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 5.0,
+                 max_retries: int = 3, name: str = 'webhook', **options):
+        options.setdefault('batch_size', 100)
+        options.setdefault('linger', 0.005)
+        super().__init__(name, **options)
+        self.url = url
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        await super().start()
+
+    async def deliver(self, batch: List[Item]):
+        body = dumps([record for message, _, created_at in batch for record in event_records(message, created_at)])
+        for attempt in range(self.max_retries):
+            try:
+                async with self.session.post(self.url, data=body, headers=self.headers) as response:
+                    if response.status < 300:
+                        return
+                    if response.status < 500:
+                        raise RuntimeError(f"{response.status} - {await response.text()}")
+                    logger.warning(f"Sink {self.name}: {response.status}, retrying")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Sink {self.name}: {e}, retrying")
+            await asyncio.sleep(min(2 ** attempt * 0.1, 5))
+        raise RuntimeError(f"gave up after {self.max_retries} attempts")
+
+    async def close(self):
+        await super().close()
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+
+class JsonlSink(Sink):
+    def __init__(self, path: str = '-', name: str = 'jsonl', **options):
+        options.setdefault('batch_size', 500)
+        super().__init__(name, **options)
+        self.path = path
+        self.file = None
+
+    async def start(self):
+        if self.path == '-':
+            self.file = sys.stdout.buffer
+        else:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.file = open(self.path, 'ab')
+        await super().start()
+
+    async def deliver(self, batch: List[Item]):
+        self.file.write(b''.join(dumps(record) + b'\n' for message, _, created_at in batch
+                                 for record in event_records(message, created_at)))
+        self.file.flush()
+
+    async def close(self):
+        await super().close()
+        if self.file and self.path != '-':
+            self.file.close()
+        self.file = None
+
+
+class PubSubSink(Sink):
+    """Publishes JSON lines to the clients of a local socket. Clients too slow to read are disconnected."""
+
+    def __init__(self, path: str, max_client_buffer: int = 1 << 20, client_timeout: float = 1.0,
+                 name: str = 'pubsub', **options):
+        options.setdefault('batch_size', 500)
+        super().__init__(name, **options)
+        self.path = path
+        self.max_client_buffer = max_client_buffer
+        self.client_timeout = client_timeout
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.clients: Dict[asyncio.StreamWriter, Optional[frozenset]] = {}  # writer -> subscribed types
+
+        self.disconnected = 0
+
+    async def start(self):
+        host, _, port = self.path.rpartition(':')
+        if host and port.isdigit():
+            self.server = await asyncio.start_server(self._client, host, int(port))
+        else:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.server = await asyncio.start_unix_server(self._client, self.path)
+        logger.info(f"Alert pubsub on {self.path}")
+        await super().start()
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients[writer] = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, topics = line.decode(errors='replace').strip().partition(' ')
+                if command.upper() == 'SUB':
+                    self.clients[writer] = frozenset(topics.replace(',', ' ').split()) or None
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    async def deliver(self, batch: List[Item]):
+        if not self.clients:
+            return
+        records = [record for message, _, created_at in batch for record in event_records(message, created_at)]
+        lines = [(record['type'], dumps(record) + b'\n') for record in records]
+        everything = b''.join(line for _, line in lines)
+        for writer, topics in list(self.clients.items()):
+            writer.write(everything if topics is None else b''.join(line for kind, line in lines if kind in topics))
+        behind = [writer for writer in self.clients if writer.transport.get_write_buffer_size() > self.max_client_buffer]
+        if behind:
+            # Give slow readers a moment (this only holds up this sink's queue), then drop the ones still behind
+            drains = [asyncio.ensure_future(writer.drain()) for writer in behind]
+            _, pending = await asyncio.wait(drains, timeout=self.client_timeout)
+            for drain in pending:
+                drain.cancel()
+            for drain in drains:
+                if drain.done() and not drain.cancelled():
+                    drain.exception()  # a client that went away; _client removes it
+            for writer in behind:
+                if writer in self.clients and writer.transport.get_write_buffer_size() > self.max_client_buffer:
+                    self.disconnected += 1
+                    logger.warning(f"Sink {self.name}: dropping a client that stopped reading")
+                    self.clients.pop(writer, None)
+                    writer.close()
+
+    async def close(self):
+        await super().close()
+        for writer in list(self.clients):
+            writer.close()
+        self.clients.clear()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+SINK_TYPES = {'webhook': WebhookSink, 'jsonl': JsonlSink, 'pubsub': PubSubSink}
+
+
+def build_sink(config: Dict) -> Sink:
+    options = dict(config)
+    kind = options.pop('type')
+    if kind not in SINK_TYPES:
+        raise ValueError(f"Unknown sink type: {kind}")
+    if options.get('policy') == SPILL:
+        options.setdefault('spill_path', f"storage/spill-{options.get('name', kind)}.jsonl")
+    return SINK_TYPES[kind](**options)
+
+
+class LocalSender:
+    """Stands in for TelegramSender/AlertHub where alerts stay in the process (worker processes,
+    replay, tests, benchmarks): every alert goes to `on_publish(message, chat_id, created_at)`,
+    and is kept in `messages` with keep=True. Nothing is queued."""
+
+    def __init__(self, on_publish: Optional[Callable[[object, Optional[str], Optional[float]], None]] = None,
+                 keep: bool = False):
+        self.on_publish = on_publish
+        self.messages: Optional[list] = [] if keep else None
+        self.lag_samples: List[float] = []
+
+    def qsize(self) -> int:
+        return 0
+
+    def publish(self, message, chat_id: Optional[str] = None, created_at: Optional[float] = None):
+        if self.messages is not None:
+            self.messages.append(message)
+        if self.on_publish is not None:
+            self.on_publish(message, chat_id, created_at)
+
+    async def queue_message(self, message, chat_id: Optional[str] = None, created_at: Optional[float] = None):
+        self.publish(message, chat_id, created_at)
+
+
+class AlertHub:
+    """Fans alerts out to every sink. Has TelegramSender's queue_message/publish/qsize/lag_samples."""
+
+    def __init__(self, sinks: List[Sink]):
+        self.sinks = sinks
+        self.published = 0
+        self.delivery_lag = Histogram('hlmon_sink_delivery_seconds', 'Time from the event to its delivery by a sink',
+                                      labels=('sink',), buckets=DELIVERY_BUCKETS)
+        for sink in sinks:
+            sink.lag = self.delivery_lag.labels(sink.name)
+
+    @property
+    def lag_samples(self):
+        for sink in self.sinks:
+            if isinstance(sink, TelegramSink):
+                return sink.sender.lag_samples
+        return deque()
+
+    def qsize(self) -> int:
+        return sum(sink.qsize() for sink in self.sinks)
+
+    async def start(self):
+        for sink in self.sinks:
+            await sink.start()
+
+    async def queue_message(self, message, chat_id: Optional[str] = None, created_at: Optional[float] = None):
+        """Queue an alert, waiting for room in full block sinks."""
+        item = (message, chat_id, created_at or time.time())
+        self.published += 1
+        full = []
+        for sink in self.sinks:
+            try:
+                sink.put_nowait(item)
+            except asyncio.QueueFull:
+                full.append(sink.put(item))
+        if full:
+            await asyncio.gather(*full)
+
+    def publish(self, message, chat_id: Optional[str] = None, created_at: Optional[float] = None):
+        """Queue an alert without waiting (see the block policy above)."""
+        item = (message, chat_id, created_at or time.time())
+        self.published += 1
+        for sink in self.sinks:
+            sink.offer(item)
+
+    async def stop(self, timeout: float = 5.0):
+        await asyncio.gather(*(sink.drain(timeout) for sink in self.sinks))
+        for sink in self.sinks:
+            await sink.close()
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import aiohttp
+
+from metrics import DELIVERY_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        # Telegram's retry_after: nothing leaves this bucket until it expires
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self):
+        # The lock keeps waiters FIFO so messages leave in the order they were queued
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+class TelegramSender:
+    def __init__(self, bot_token: str, chat_id: str, api_url: str = TELEGRAM_API_URL,
+                 global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 1.0,
+                 max_retries: int = 5, timeout: float = 10.0, pool_size: int = 32, backoff: float = 1.0):
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.url = f"{api_url.rstrip('/')}/bot{bot_token}/sendMessage"
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.backoff = backoff  # first 5xx/network retry delay, doubled per attempt
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self.chat_queues: Dict[str, asyncio.Queue] = {}
+        self.workers: Dict[str, asyncio.Task] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.is_running = False
+
+        self.sent_count = 0
+        self.failed_count = 0
+        self.lag_samples = deque(maxlen=1000)  # seconds from event to delivery
+        self.delivery_lag = Histogram('hlmon_alert_delivery_seconds', 'Time from the event to a delivered alert',
+                                      buckets=DELIVERY_BUCKETS)
+        self.send_latency = Histogram('hlmon_telegram_send_seconds', 'Duration of sendMessage requests')
+
+    async def start(self):
+        # One keep-alive pool for every send instead of a new TCP/TLS handshake per message
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self.is_running = True
+
+    def _get_queue(self, chat_id: str) -> asyncio.Queue:
+        queue = self.chat_queues.get(chat_id)
+        if queue is None:
+            queue = self.chat_queues[chat_id] = asyncio.Queue()
+            self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            self.workers[chat_id] = asyncio.create_task(self._process_queue(chat_id))
+        return queue
+
+    def qsize(self) -> int:
+        return sum(queue.qsize() for queue in self.chat_queues.values())
+
+    async def _process_queue(self, chat_id: str):
+        # One worker per chat, so a chat under a retry_after never blocks the others
+        queue = self.chat_queues[chat_id]
+        while self.is_running:
+            message, created_at = await queue.get()
+            try:
+                # templates.LazyMessage is rendered here, when it is about to be sent
+                if await self._deliver(chat_id, str(message)):
+                    lag = time.time() - created_at
+                    self.lag_samples.append(lag)
+                    self.delivery_lag.observe(lag)
+            except Exception as e:
+                logger.error(f"Error in message queue processor: {e}")
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, chat_id: str, message: str) -> bool:
+        bucket = self.chat_buckets[chat_id]
+
+        for attempt in range(self.max_retries):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+
+            start = time.perf_counter()
+            status, body = await self._send_message(chat_id, message)
+            self.send_latency.observe(time.perf_counter() - start)
+            if status == 200:
+                self.sent_count += 1
+                return True
+
+            if status == 429:
+                retry_after = self._retry_after(body)
+                logger.warning(f"TG rate limited, retry after {retry_after}s")
+                # The flood limit is per bot token: every chat waits, not only this one
+                bucket.pause(retry_after)
+                self.global_bucket.pause(retry_after)
+                continue
+
+            if status is None or status >= 500:
+                await asyncio.sleep(min(self.backoff * 2 ** attempt, 30))
+                continue
+
+            logger.error(f"Send TG Message Error: {status} - {body}")
+            break
+
+        self.failed_count += 1
+        return False
+
+    @staticmethod
+    def _retry_after(body: Dict) -> float:
+        parameters = body.get('parameters')
+        retry_after = parameters.get('retry_after') if isinstance(parameters, dict) else None
+        if isinstance(retry_after, bool) or not isinstance(retry_after, (int, float)) or retry_after < 0:
+            return 1.0
+        return retry_after
+
+    async def _send_message(self, chat_id: str, message: str):
+        payload = {
+            "chat_id": chat_id,
+            "text": message,
+            "parse_mode": "HTML"
+        }
+
+        try:
+            async with self.session.post(self.url, json=payload) as response:
+                try:
+                    body = await response.json(content_type=None)
+                except ValueError:
+                    body = {"description": await response.text()}
+                if not isinstance(body, dict):
+                    body = {"description": body}
+                return response.status, body
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"TG Error: {e}")
+            return None, {}
+
+    async def queue_message(self, message, chat_id: Optional[str] = None,
+                            created_at: Optional[float] = None):
+        """`message` is HTML text or a templates.LazyMessage, which is rendered when it is sent."""
+        queue = self._get_queue(chat_id or self.chat_id)
+        await queue.put((message, created_at or time.time()))
+        logger.debug(f"Message queued. Queue size: {self.qsize()}")
+
+    def publish(self, message, chat_id: Optional[str] = None, created_at: Optional[float] = None):
+        """queue_message without waiting; the per-chat queues are unbounded, so it never has to."""
+        self._get_queue(chat_id or self.chat_id).put_nowait((message, created_at or time.time()))
+
+    async def join(self):
+        for queue in list(self.chat_queues.values()):
+            await queue.join()
+
+    async def stop(self):
+        self.is_running = False
+        for worker in self.workers.values():
+            worker.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
+        self.workers.clear()
+        if self.session:
+            await self.session.close()
+            self.session = None
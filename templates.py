@@ -0,0 +1,310 @@
+"""Alert message templates, compiled once per (template, format, locale).
+
+A template is split into literal text and `{field:converter}` slots when it is
+first used; rendering is a join over those parts. Alerts are queued as
+LazyMessage (template name + raw field values) and only rendered when the
+sender takes them off its queue. Alerts that are dropped first are never
+formatted (the coalescer still renders digests of several alerts, because it
+splits them by length). Number and timestamp fragments repeat a lot (prices,
+sizes, the same second), so they are cached.
+
+Formats: "html" (Telegram parse_mode HTML; text values are escaped) and "text"
+(tags stripped, links reduced to their text).
+"""
+import datetime
+import html
+import re
+import string
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from analytics import FlowAlert
+from position_diff import POSITION_OPENED, POSITION_RESIZED
+from records import PositionRecord
+
+
+class Locale(NamedTuple):
+    thousands: str
+    decimal: str
+
+
+LOCALES: Dict[str, Locale] = {
+    'en': Locale(',', '.'),
+    'de': Locale('.', ','),
+}
+
+TEMPLATES: Dict[str, str] = {
+    'fills': """
+{emoji} <b>{dir} ({leverage})</b>
+
+🆔 <b>id:</b> <code>{tid}</code>
+💎 <b>Symbol:</b> {coin}
+📊 <b>Type:</b> {side_text}  
+📏 <b>Margin:</b> {sz:amount} (${startPosition:abs_money}){fill_count}
+💵 <b>Entry:</b> {px:amount}
+{closedPnl:pnl_emoji} <b>Pnl:</b> {closedPnl:money}
+🕐 <b>Time:</b> {time:ms_clock}
+🔗 <b>Wallet:</b> <a href="https://www.coinglass.com/hyperliquid/{wallet}">{wallet}</a>
+""",
+    'position': """
+{emoji} <b>Position {action} {leverage_value}x {leverage_type}</b>
+
+💎 <b>Coin:</b> {coin}
+📊 <b>Type:</b> {side_text}  
+📏 <b>Margin:</b> {szi:amount}
+💵 <b>Entry:</b> ${entry_px:amount}
+{unrealized_pnl:pnl_emoji} <b>Pnl:</b> ${unrealized_pnl:money}
+
+🕐 <b>Time:</b> {created:clock}
+🔗 <b>Wallet:</b> <code>{wallet_short}</code>
+""",
+    'flow': """
+🐋 <b>Whale Flow: {coin} {side_title}</b>
+
+{emoji} <b>{wallets}</b> tracked wallets opened <b>${notional:whole}</b> {side} in {window}
+{net_flow:flow_emoji} <b>Net flow:</b> ${net_flow:whole}
+🕐 <b>Time:</b> {time:ms_clock}
+""",
+}
+
+_LINK_RE = re.compile(r'<a href="[^"]*">(.*?)</a>')
+_TAG_RE = re.compile(r'</?[a-z]+>')
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+FRAGMENT_CACHE_SIZE = 16384
+_CACHES: List[Dict[object, str]] = []
+
+
+def _cached(convert: Callable[[object], str]) -> Callable[[object], str]:
+    """Memoizes a one-argument fragment formatter in a plain dict (cheaper per hit than lru_cache)."""
+    cache: Dict[object, str] = {}
+    _CACHES.append(cache)
+
+    def cached(value) -> str:
+        text = cache.get(value)
+        if text is None:
+            if len(cache) >= FRAGMENT_CACHE_SIZE:
+                cache.clear()
+            text = cache[value] = convert(value)
+        return text
+    return cached
+
+
+def clear_fragment_caches():
+    for cache in _CACHES:
+        cache.clear()
+
+
+@lru_cache(maxsize=None)
+def _number_formatter(decimals: int, strip: bool, locale: str) -> Callable[[object], str]:
+    spec = f",.{decimals}f"
+    separators = LOCALES[locale]
+    table = None if separators == LOCALES['en'] else str.maketrans({',': separators.thousands,
+                                                                     '.': separators.decimal})
+
+    def convert(value) -> str:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return '0' if value is None else str(value)
+        text = format(number, spec)
+        if strip and decimals:
+            text = text.rstrip('0').rstrip('.')
+        return text.translate(table) if table else text
+    return convert
+
+
+def format_number(value, decimals: int, strip: bool = False, locale: str = 'en') -> str:
+    """`value` (a number or numeric string) with thousands separators; unparseable values as they are."""
+    return _number_formatter(decimals, strip, locale)(value)
+
+
+def format_clock(seconds: float) -> str:
+    return datetime.datetime.fromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _sign(value) -> int:
+    number = _float(value) or 0.0
+    return 1 if number > 0 else -1 if number < 0 else 0
+
+
+def _seconds(value, scale: int):
+    if type(value) is int:
+        return value // scale
+    number = _float(value)
+    return value if number is None else int(number // scale)
+
+
+def _escape(value) -> str:
+    if value is None:
+        return 'N/A'
+    if type(value) is not str:
+        return str(value)
+    # Most values (coins, directions, addresses) have nothing to escape
+    if '<' in value or '>' in value or '&' in value:
+        return html.escape(value, quote=False)
+    return value
+
+
+@lru_cache(maxsize=None)
+def _converter(spec: str, fmt: str, locale: str) -> Callable[[object], str]:
+    """The formatter of a `{field:spec}` slot, shared by every template of a (format, locale)."""
+    if spec in ('amount', 'money', 'whole'):
+        decimals, strip = {'amount': (4, True), 'money': (2, False), 'whole': (0, False)}[spec]
+        return _cached(_number_formatter(decimals, strip, locale))
+    if spec == 'abs_money':
+        money = _converter('money', fmt, locale)
+        return lambda value: money(abs(_float(value) or 0.0))
+    if spec == 'pnl_emoji':
+        return lambda value: ("💱", "💰", "💸")[_sign(value)]
+    if spec == 'flow_emoji':
+        return lambda value: "📉" if _sign(value) < 0 else "📈"
+    if spec in ('clock', 'ms_clock'):
+        # One cache entry per second, whatever the precision of the timestamp
+        scale = 1000 if spec == 'ms_clock' else 1
+        clock = _cached(lambda seconds: format_clock(seconds) if isinstance(seconds, int) else str(seconds))
+        return lambda value: clock(_seconds(value, scale))
+    if spec:
+        raise ValueError(f"Unknown template converter: {spec}")
+    if fmt == 'html':
+        return _escape
+    return lambda value: 'N/A' if value is None else str(value)
+
+
+class Template:
+    """A template compiled to one join over its literals and slot formatters."""
+    __slots__ = ('render',)
+
+    def __init__(self, source: str, fmt: str = 'html', locale: str = 'en'):
+        if fmt not in ('html', 'text'):
+            raise ValueError(f"Unknown message format: {fmt}")
+        if locale not in LOCALES:
+            raise ValueError(f"Unknown locale: {locale}")
+        source = source.strip()
+        if fmt == 'text':
+            source = _TAG_RE.sub('', _LINK_RE.sub(r'\1', source))
+
+        namespace = {}
+        items = []
+        for i, (literal, field, spec, _) in enumerate(string.Formatter().parse(source)):
+            if fmt == 'text':
+                literal = html.unescape(literal)
+            if literal:
+                namespace[f'l{i}'] = literal
+                items.append(f'l{i}')
+            if field is not None:
+                namespace[f'c{i}'] = _converter(spec or '', fmt, locale)
+                items.append(f'c{i}(get({field!r}))')
+        code = f"def render(fields):\n    get = fields.get\n    return ''.join(({', '.join(items)},))\n"
+        exec(code, namespace)
+        self.render: Callable[[Dict], str] = namespace['render']
+
+
+@lru_cache(maxsize=None)
+def get_template(name: str, fmt: str = 'html', locale: str = 'en') -> Template:
+    return Template(TEMPLATES[name], fmt, locale)
+
+
+# Fields that only decorate the text; structured consumers (sinks.py) get the rest
+PRESENTATION_FIELDS = frozenset({'emoji', 'side_text', 'fill_count', 'leverage', 'side_title', 'wallet_short'})
+
+
+class LazyMessage:
+    """An alert that is rendered when it is sent. Picklable, so worker processes can hand it over."""
+    __slots__ = ('template', 'fields', 'locale', '_html')
+
+    def __init__(self, template: str, fields: Dict, locale: str = 'en'):
+        self.template = template
+        self.fields = fields
+        self.locale = locale
+        self._html: Optional[str] = None
+
+    def render(self, fmt: str = 'html') -> str:
+        if fmt == 'html':
+            # Rendered once even when a digest measures it before the sender sends it
+            if self._html is None:
+                self._html = get_template(self.template, fmt, self.locale).render(self.fields)
+            return self._html
+        return get_template(self.template, fmt, self.locale).render(self.fields)
+
+    def data(self) -> Dict:
+        return {key: value for key, value in self.fields.items() if key not in PRESENTATION_FIELDS}
+
+    def __str__(self):
+        return self.render()
+
+    def __reduce__(self):
+        return LazyMessage, (self.template, self.fields, self.locale)
+
+
+def fills_message(fill: Dict, wallet_address: str, locale: str = 'en') -> LazyMessage:
+    dir = fill.get('dir') or 'N/A'
+    if 'Long' in dir:
+        side_text = "🟢 Buy (Long)"
+    elif 'Short' in dir:
+        side_text = "🔴 Sell (Short)"
+    else:
+        side_text = 'N/A'
+    # تعداد فیل‌های تجمیع‌شده توسط coalescer
+    fill_count = fill.get('fillCount', 1)
+
+    fields = dict(fill)
+    fields.update(
+        dir=dir,
+        emoji="🔵" if "Open" in dir else "⚪",
+        leverage='Cross' if fill.get('crossed') else 'Isolate',
+        side_text=side_text,
+        fill_count=f" ×{fill_count} fills" if fill_count > 1 else "",
+        wallet=wallet_address,
+    )
+    return LazyMessage('fills', fields, locale)
+
+
+def position_message(position: PositionRecord, action: str, wallet_address: str,
+                     locale: str = 'en') -> LazyMessage:
+    side = position.side
+    is_long = side in ("A", "long")  # A = Long (خرید), B = Short (فروش)
+    if action == POSITION_OPENED:
+        emoji = "🟢" if is_long else "🔴"
+    elif action == POSITION_RESIZED:
+        emoji = "🟡"
+    else:
+        emoji = "⚪"
+
+    return LazyMessage('position', {
+        'emoji': emoji,
+        'action': action,
+        'leverage_value': position.leverage_value,
+        'leverage_type': position.leverage_type,
+        'coin': position.coin_name,
+        'side_text': "Buy (Long)" if is_long else "Sell (Short)" if side in ("B", "short") else side,
+        'szi': position.szi,
+        'entry_px': position.entry_px,
+        'unrealized_pnl': position.unrealized_pnl,
+        'created': time.time(),
+        'wallet': wallet_address,
+        'wallet_short': wallet_address[-8:],
+    }, locale)
+
+
+def flow_message(alert: FlowAlert, locale: str = 'en') -> LazyMessage:
+    window = alert.rule.window
+    return LazyMessage('flow', {
+        'coin': alert.coin,
+        'side': alert.rule.side,
+        'side_title': alert.rule.side.title(),
+        'emoji': "🟢" if alert.rule.side == "long" else "🔴",
+        'wallets': alert.wallets,
+        'notional': alert.notional,
+        'net_flow': alert.net_flow,
+        'window': f"{window // 60}m" if window >= 60 else f"{window}s",
+        'time': alert.time,
+    }, locale)
@@ -0,0 +1,9 @@
+import pytest
+
+from sinks import LocalSender
+
+
+@pytest.fixture
+def sender():
+    """Stands in for TelegramSender/AlertHub and keeps what was published (sender.messages)."""
+    return LocalSender(keep=True)
@@ -0,0 +1,165 @@
+import random
+
+import numpy as np
+import pytest
+
+import archive
+from archive import (ACTIONS, DAY_MS, DIRECTIONS, FILLS, POSITIONS, Archive, ArchiveReader, aggregate, build_filter,
+                     label_codes, newest, parse_time, selection_size, wallet_key)
+from records import FillRecord, PositionRecord, COINS
+
+WALLETS = ["0x3e051c89cd06e6867ce98c758fcc665d2148e1bb", "0x00000000000000000000000000000000000000aa",
+           "0x1111111111111111111111111111111111111111"]
+DAY0 = parse_time('2026-01-05')
+
+
+def random_fills(count: int, start: int):
+    fills = []
+    for i in range(count):
+        fills.append({
+            'coin': random.choice(['BTC', 'ETH', 'PURR/USDC']), 'tid': start + i, 'oid': i,
+            'time': DAY0 + random.randrange(2 * DAY_MS), 'px': f"{random.uniform(1, 100):.2f}",
+            'sz': f"{random.uniform(1, 5000):.2f}", 'startPosition': '0', 'closedPnl': '1', 'fee': '0.5',
+            'dir': random.choice(DIRECTIONS[1:5]), 'side': 'B', 'crossed': True,
+        })
+    return fills
+
+
+@pytest.fixture
+def archive_rows(tmp_path):
+    """An archive over two days, with indexed segments plus rows appended after the index (a second time run),
+    and the (wallet, fill) rows written to it."""
+    random.seed(3)
+    archive = Archive(str(tmp_path), writer='test')
+    rows = []
+
+    def add(fills):
+        for fill in fills:
+            wallet = random.choice(WALLETS)
+            archive.add_fills(wallet, [FillRecord.from_dict(fill)])
+            rows.append((wallet, fill))
+
+    add(random_fills(300, 0))
+    archive._flush_batch(archive.pending, archive.pending_wallets)  # the days have ended: segments get indexed
+    archive.pending = {name: [] for name in archive.pending}
+    add(random_fills(200, 1000))
+    archive._append(FILLS, archive.pending['fills'])  # not indexed yet
+    archive.executor.shutdown()
+    return str(tmp_path), rows
+
+
+def scanned_tids(reader, **conditions):
+    tids = []
+    for segment, selection in reader.scan(FILLS, **conditions):
+        tids.extend(segment.column('tid')[selection].tolist())
+    return sorted(tids)
+
+
+def expected_tids(rows, coins=None, wallets=None, since=None, until=None, dirs=None, min_notional=None):
+    return sorted(
+        fill['tid'] for wallet, fill in rows
+        if (coins is None or fill['coin'] in coins) and (wallets is None or wallet in wallets)
+        and (since is None or fill['time'] >= since) and (until is None or fill['time'] < until)
+        and (dirs is None or fill['dir'] in dirs)
+        and (min_notional is None or float(fill['px']) * float(fill['sz']) >= min_notional)
+    )
+
+
+@pytest.mark.parametrize('conditions', [
+    {},
+    {'coins': ['BTC']},
+    {'coins': ['PURR/USDC', 'ETH']},
+    {'wallets': [WALLETS[0]]},
+    {'wallets': [WALLETS[0].upper().replace('0X', '0x'), WALLETS[2]]},
+    {'since': DAY0 + DAY_MS // 2},
+    {'until': DAY0 + DAY_MS + 1},
+    {'coins': ['ETH'], 'wallets': [WALLETS[1]], 'since': DAY0 + 3600_000, 'until': DAY0 + DAY_MS + 7200_000},
+])
+def test_scan_matches_brute_force(archive_rows, conditions):
+    root, rows = archive_rows
+    expected = dict(conditions)
+    if 'wallets' in expected:
+        expected['wallets'] = [wallet.lower() for wallet in expected['wallets']]
+    assert scanned_tids(ArchiveReader(root), **conditions) == expected_tids(rows, **expected)
+
+
+def test_scan_where_filters(archive_rows):
+    root, rows = archive_rows
+    codes = {'dir': label_codes(DIRECTIONS, 'open')}
+    where = build_filter(codes, min_notional=50_000)
+    assert scanned_tids(ArchiveReader(root), where=where, wallets=[WALLETS[1]]) == expected_tids(
+        rows, wallets=[WALLETS[1]], dirs={'Open Long', 'Open Short'}, min_notional=50_000)
+    assert build_filter() is None
+
+
+def test_label_codes():
+    assert label_codes(DIRECTIONS, 'open') == [1, 3]
+    assert label_codes(DIRECTIONS, ' close short, BUY ') == [4, 7]
+    assert label_codes(ACTIONS, 'opened,closed') == [1, 3]
+    assert label_codes(ACTIONS, ',') == []
+
+
+def test_newest_and_totals(archive_rows):
+    root, rows = archive_rows
+    reader = ArchiveReader(root)
+    scan = reader.scan(FILLS, coins=['BTC'], newest_first=True)
+    records, count, totals = newest(scan, FILLS, 5, reader.wallets())
+
+    btc = sorted((fill['time'], wallet, fill) for wallet, fill in rows if fill['coin'] == 'BTC')
+    assert count == len(btc)
+    assert totals['fee'] == pytest.approx(0.5 * len(btc))
+    assert [r['time'] for r in records] == sorted((t for t, _, _ in btc), reverse=True)[:5]
+    top = max(btc, key=lambda row: (row[0], row[2]['tid']))
+    assert records[0]['wallet'] == top[1] and records[0]['dir'] == top[2]['dir'] and records[0]['crossed'] is True
+
+
+def test_aggregate_by_wallet_and_code(archive_rows):
+    root, rows = archive_rows
+    reader = ArchiveReader(root)
+    by_wallet = aggregate(reader.scan(FILLS), FILLS, 'wallet', list(reader.wallets()))
+    for wallet in WALLETS:
+        notional = [float(f['px']) * float(f['sz']) for w, f in rows if w == wallet]
+        count, total, *_ = by_wallet[wallet_key(wallet)]
+        assert count == len(notional) and total == pytest.approx(sum(notional))
+
+    by_dir = aggregate(reader.scan(FILLS), FILLS, 'dir')
+    assert {DIRECTIONS[code]: group[0] for code, group in by_dir.items()} == {
+        name: sum(f['dir'] == name for _, f in rows) for name in DIRECTIONS[1:5]}
+    by_day = aggregate(reader.scan(FILLS, since=DAY0 + DAY_MS), FILLS, 'day')
+    assert list(by_day) == [DAY0 // DAY_MS + 1]
+
+
+def test_positions_table(tmp_path):
+    archive = Archive(str(tmp_path))
+    position = PositionRecord(COINS('ETH'), 'short', -10.0, 2500.0, 0.0, 'cross', 5)
+    archive.add_position(WALLETS[0], 'Opened', position, DAY0)
+    archive.add_position(WALLETS[1], 'Closed', position, DAY0 + 1)
+    archive._flush_batch(archive.pending, archive.pending_wallets)
+    archive.executor.shutdown()
+
+    reader = ArchiveReader(str(tmp_path))
+    where = build_filter({'action': label_codes(ACTIONS, 'closed')})
+    scan = list(reader.scan(POSITIONS, where=where))
+    assert sum(selection_size(selection) for _, selection in scan) == 1
+    records, count, totals = newest(iter(scan), POSITIONS, 10, reader.wallets())
+    assert records[0]['wallet'] == WALLETS[1] and records[0]['action'] == 'Closed' and records[0]['side'] == 'short'
+    assert records[0]['notional'] == 25_000.0 and records[0]['cross'] is True
+    assert isinstance(scan[0][1], np.ndarray)
+
+
+@pytest.mark.parametrize('argv, error', [
+    (['agg', '--action', 'opened'], '--action does not apply to fills'),
+    (['agg', '--table', 'positions', '--dir', 'open'], '--dir does not apply to positions'),
+    (['agg', '--side', 'long'], '--side does not apply to fills'),
+])
+def test_agg_rejects_filters_of_the_other_table(tmp_path, monkeypatch, argv, error):
+    monkeypatch.setattr('sys.argv', ['archive.py', '--root', str(tmp_path)] + argv)
+    with pytest.raises(SystemExit, match=error):
+        archive.main()
+
+
+def test_agg_accepts_filters_of_its_table(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr('sys.argv', ['archive.py', '--root', str(tmp_path), 'agg', '--table', 'positions',
+                                     '--action', 'opened', '--side', 'long'])
+    archive.main()
+    assert '0 groups, 0 rows' in capsys.readouterr().out
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+import backfill as backfill_module
+from backfill import FillBackfill
+from fill_store import FillStore
+from main import HyperliquidMonitor
+
+WALLET = '0x' + 'e' * 40
+T0 = 1_700_000_000_000
+
+
+def fill(tid, time_ms, coin='BTC'):
+    return {'coin': coin, 'px': '100.0', 'sz': '1', 'side': 'B', 'time': time_ms, 'startPosition': '0.0',
+            'dir': 'Open Long', 'closedPnl': '0.0', 'crossed': True, 'tid': tid}
+
+
+class UserFillsByTimeStub:
+    """Local info endpoint: pages of one wallet's fills by time, optionally held until `release` is set."""
+
+    def __init__(self, fills: list, status: int = 200):
+        self.fills = fills
+        self.status = status
+        self.requests = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def handle(self, request: web.Request):
+        body = await request.json()
+        self.requests.append(body)
+        await self.release.wait()
+        if self.status != 200:
+            return web.Response(status=self.status, text='boom')
+        page = [fill for fill in self.fills if body['startTime'] <= fill['time'] <= body['endTime']]
+        return web.json_response(page[:backfill_module.FILLS_PAGE_SIZE])
+
+
+async def serve(stub: UserFillsByTimeStub):
+    app = web.Application()
+    app.router.add_post('/info', stub.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    backfill = FillBackfill(f"http://127.0.0.1:{runner.addresses[0][1]}/info", rate=1000, max_pages=10)
+    await backfill.start()
+    return runner, backfill
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(backfill_module, 'FILLS_PAGE_SIZE', 3)
+
+
+@pytest.fixture
+def store(tmp_path):
+    fill_store = FillStore(str(tmp_path / 'fills.db'))
+    yield fill_store
+    fill_store.executor.shutdown()
+    fill_store.reader.close()
+    fill_store.db.close()
+
+
+def pending_tids(fill_store):
+    return [int(key.rsplit('_', 1)[1]) for _, key, _, _ in fill_store.pending]
+
+
+def test_fetch_pages_by_time_and_dedups_the_boundary(small_pages):
+    fills = [fill(tid, T0 + tid // 2) for tid in range(1, 8)]
+
+    async def run():
+        stub = UserFillsByTimeStub(fills)
+        runner, backfill = await serve(stub)
+        try:
+            return await backfill.fetch(WALLET, T0, T0 + 100), stub
+        finally:
+            await backfill.close()
+            await runner.cleanup()
+
+    fetched, stub = asyncio.run(run())
+    assert [f['tid'] for f in fetched] == list(range(1, 8))
+    assert [body['startTime'] for body in stub.requests] == [T0, T0 + 1, T0 + 2, T0 + 3]
+
+
+def test_full_page_in_one_millisecond_moves_on(small_pages):
+    fills = [fill(tid, T0) for tid in range(1, 6)] + [fill(9, T0 + 1)]
+
+    async def run():
+        stub = UserFillsByTimeStub(fills)
+        runner, backfill = await serve(stub)
+        try:
+            return await backfill.fetch(WALLET, T0, T0 + 100), stub
+        finally:
+            await backfill.close()
+            await runner.cleanup()
+
+    fetched, stub = asyncio.run(run())
+    assert len(stub.requests) == 2
+    assert [f['tid'] for f in fetched] == [1, 2, 3, 9]
+
+
+def test_frames_are_held_and_replayed_in_order(store, sender):
+    history = [fill(1, T0), fill(2, T0 + 1)]
+    missed = [fill(3, T0 + 2), fill(4, T0 + 3)]
+    snapshot = [fill(5, T0 + 4), fill(6, T0 + 5)]
+    live = [fill(7, T0 + 6)]
+
+    async def run():
+        stub = UserFillsByTimeStub(history + missed + snapshot)
+        stub.release.clear()
+        runner, backfill = await serve(stub)
+        try:
+            monitor = HyperliquidMonitor([WALLET], sender, store, backfill=backfill)
+            monitor.process_fills_update(history, WALLET, is_snapshot=True)
+            store.pending.clear()
+
+            # The reconnect snapshot does not reach back to the mark: backfill from it
+            monitor.process_fills_update(snapshot, WALLET, is_snapshot=True)
+            assert WALLET in monitor.resuming and len(monitor.resume_tasks) == 1
+            while not stub.requests:
+                await asyncio.sleep(0.001)
+            monitor.process_fills_update(live, WALLET)
+            assert monitor.resuming[WALLET] == [live] and store.pending == []
+
+            stub.release.set()
+            await asyncio.gather(*monitor.resume_tasks)
+            monitor.coalescer.flush_all()
+            assert stub.requests[0]['startTime'] == T0 + 1 and stub.requests[0]['endTime'] == T0 + 4
+            return monitor
+        finally:
+            await backfill.close()
+            await runner.cleanup()
+
+    monitor = asyncio.run(run())
+    assert WALLET not in monitor.resuming and not monitor.resume_tasks
+    assert pending_tids(store) == [3, 4, 5, 6, 7]
+    assert monitor.fill_mark(WALLET) == (T0 + 6, {7})
+
+
+def test_failed_backfill_resumes_from_the_snapshot(store, sender):
+    history = [fill(1, T0)]
+    snapshot = [fill(5, T0 + 4)]
+
+    async def run():
+        stub = UserFillsByTimeStub([], status=500)
+        runner, backfill = await serve(stub)
+        try:
+            monitor = HyperliquidMonitor([WALLET], sender, store, backfill=backfill)
+            monitor.process_fills_update(history, WALLET, is_snapshot=True)
+            store.pending.clear()
+            monitor.process_fills_update(snapshot, WALLET, is_snapshot=True)
+            monitor.process_fills_update([fill(6, T0 + 5)], WALLET)
+            await asyncio.gather(*monitor.resume_tasks)
+            monitor.coalescer.flush_all()
+            return monitor, stub
+        finally:
+            await backfill.close()
+            await runner.cleanup()
+
+    monitor, stub = asyncio.run(run())
+    assert len(stub.requests) == 1
+    assert WALLET not in monitor.resuming
+    assert pending_tids(store) == [5, 6]
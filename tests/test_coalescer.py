@@ -0,0 +1,67 @@
+import asyncio
+
+from coalescer import DIGEST_SEPARATOR, Digest, FillCoalescer, build_digests, merge_fills
+
+WALLET = "0x3e051c89cd06e6867ce98c758fcc665d2148e1bb"
+
+
+def fill(tid, oid=1, px='100', sz='1', time=1000, dir='Open Long', **fields):
+    return {'coin': 'BTC', 'tid': tid, 'oid': oid, 'px': px, 'sz': sz, 'time': time, 'dir': dir,
+            'closedPnl': '0', 'fee': '0.1', 'startPosition': '0', **fields}
+
+
+def test_merge_fills_sums_partial_fills_of_an_order():
+    merged = merge_fills([
+        fill(1, px='100', sz='1', startPosition='5'),
+        fill(2, px='110', sz='3', time=1002, closedPnl='2'),
+        fill(3, oid=2),
+    ])
+    assert len(merged) == 2
+    order = merged[0]
+    assert float(order['sz']) == 4 and float(order['px']) == 107.5
+    assert float(order['closedPnl']) == 2 and abs(float(order['fee']) - 0.2) < 1e-9
+    # startPosition stays from the first fill, time and tid come from the last one
+    assert (order['startPosition'], order['time'], order['tid'], order['fillCount']) == ('5', 1002, 2, 2)
+    assert merged[1]['tid'] == 3 and 'fillCount' not in merged[1]
+
+
+def test_merge_fills_skips_repeated_tids_and_splits_directions():
+    fills = [fill(1), fill(1), fill(2, dir='Close Long')]
+    merged = merge_fills(fills)
+    assert [(m['tid'], m['dir']) for m in merged] == [(1, 'Open Long'), (2, 'Close Long')]
+    assert fills[0]['sz'] == '1'  # inputs are not modified
+
+
+def test_merge_fills_keeps_unparsable_sizes():
+    merged = merge_fills([fill(1, sz='x'), fill(2)])
+    assert len(merged) == 1 and merged[0]['sz'] == 'x' and merged[0]['fillCount'] == 2
+
+
+def test_build_digests_packs_up_to_max_length():
+    messages = ['a' * 10, 'b' * 10, 'c' * 10, 'd' * 40]
+    limit = 20 + len(DIGEST_SEPARATOR)
+    digests = build_digests(messages, max_length=limit)
+
+    assert isinstance(digests[0], Digest) and digests[0].messages == messages[:2]
+    assert digests[1:] == ['c' * 10, 'd' * 40]
+    assert str(digests[0]) == 'a' * 10 + DIGEST_SEPARATOR + 'b' * 10
+    assert all(len(str(d)) <= limit for d in digests[:2])
+
+
+def test_build_digests_single_message_stays_as_is():
+    assert build_digests(['only']) == ['only']
+    assert build_digests([]) == []
+
+
+def test_coalescer_flush_merges_and_digests(sender):
+    async def run():
+        coalescer = FillCoalescer(sender, lambda f, w: f"{f['tid']}:{f['sz']}", window=60)
+        for tid, oid in ((1, 1), (2, 1), (3, 2)):
+            coalescer.add(WALLET, fill(tid, oid=oid))
+        coalescer.flush_all()
+        return coalescer
+
+    coalescer = asyncio.run(run())
+    assert [str(m) for m in sender.messages] == [f"2:2.0{DIGEST_SEPARATOR}3:1"]
+    assert (coalescer.fills_in, coalescer.alerts_out, coalescer.messages_out) == (3, 2, 1)
+    assert not coalescer.pending and not coalescer.timers
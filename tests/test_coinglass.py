@@ -0,0 +1,100 @@
+import base64
+import json
+import time
+import zlib
+
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+from coinglass import CoinglassDecodeError, CoinglassDecoder, CoinglassSource, TOP_POSITION_ACTION_PATH, parse_action
+from fill_store import FillStore
+from main import HyperliquidMonitor
+
+KEY = b'0123456789abcdef'
+URL = "https://capi.coinglass.com" + TOP_POSITION_ACTION_PATH
+TRACKED = "0x3e051c89cd06e6867ce98c758fcc665d2148e1bb"
+OTHER = "0x00000000000000000000000000000000000000aa"
+
+
+def encrypt(raw: bytes, key: bytes = KEY) -> str:
+    return base64.b64encode(AES.new(key, AES.MODE_ECB).encrypt(pad(raw, AES.block_size))).decode()
+
+
+def deflate(data: bytes, wbits: int) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+    return compressor.compress(data) + compressor.flush()
+
+
+@pytest.fixture
+def decoder():
+    decoder = CoinglassDecoder(workers=1)
+    yield decoder
+    decoder.close()
+
+
+@pytest.mark.parametrize('wbits', [16 + zlib.MAX_WBITS, zlib.MAX_WBITS, -zlib.MAX_WBITS],
+                         ids=['gzip', 'zlib', 'raw'])
+def test_decrypt_detects_framing(decoder, wbits):
+    text = json.dumps([{'symbol': 'BTC', 'n': i} for i in range(50)])
+    assert decoder.decrypt(encrypt(deflate(text.encode(), wbits)), KEY) == text
+
+
+def test_decrypt_strips_quotes_and_padding(decoder):
+    payload = encrypt(deflate(b'"abc"', -zlib.MAX_WBITS)).rstrip('=')
+    assert decoder.decrypt(payload, KEY) == 'abc'
+
+
+def test_decrypt_wrong_key_raises(decoder):
+    with pytest.raises(CoinglassDecodeError):
+        decoder.decrypt(encrypt(deflate(b'[]', -zlib.MAX_WBITS)), b'fedcba9876543210')
+
+
+def test_key_from_user_header(decoder):
+    path_key = base64.b64encode(f"coinglass{TOP_POSITION_ACTION_PATH}coinglass".encode())[:16]
+    user_header = encrypt(deflate(KEY, 16 + zlib.MAX_WBITS), path_key)
+    payload = encrypt(deflate(b'[{"a": 1}]', 16 + zlib.MAX_WBITS))
+    assert decoder.decode(payload, URL + "?size=10", user_header) == [{'a': 1}]
+
+
+def item(wallet=OTHER, side=1, action=1, value=500_000.0, at=None):
+    return {'userAddress': wallet, 'symbol': 'ETH', 'side': side, 'positionAction': action,
+            'positionValueUsd': value, 'entryPrice': 2500.0, 'leverage': 10,
+            'time': at or int(time.time() * 1000)}
+
+
+def test_parse_action():
+    action = parse_action(item(side=2, action=2, at=1_750_000_000_000))
+    assert (action.wallet, action.action, action.time) == (OTHER, 'Closed', 1_750_000_000_000)
+    assert (action.position.coin_name, action.position.side, action.position.szi) == ('ETH', 'short', -200.0)
+    assert action.fill()['dir'] == 'Close Short' and action.fill()['side'] == 'B'
+
+    assert parse_action({**item(), 'positionSize': 3}).position.szi == 3.0
+    assert parse_action({'symbol': 'ETH'}) is None
+    assert parse_action({**item(), 'side': 'x'}) is None
+
+
+def test_source_skips_baseline_and_seen_actions():
+    received = []
+    source = CoinglassSource(received.extend, max_seen=3)
+    first, second, third = item(at=1000), item(at=2000), item(at=3000)
+
+    assert source.new([first, second]) == []
+    assert [a.time for a in source.new({'list': [third, second, first]})] == [3000]
+    assert source.new([third]) == []
+    assert (source.actions, source.new_actions) == (6, 1)
+    source.decoder.close()
+
+
+def test_actions_reach_rules_sinks_and_flow(tmp_path, sender):
+    store = FillStore(str(tmp_path / 'fills.db'))
+    try:
+        monitor = HyperliquidMonitor([TRACKED], sender, store)
+        actions = [parse_action(item()), parse_action(item(value=1000.0)), parse_action(item(wallet=TRACKED))]
+        monitor.process_coinglass_actions(actions)
+
+        # The small position does not pass the default position rule; the tracked wallet has its own frames
+        assert [m.template for m in sender.messages] == ['position']
+        assert monitor.analytics.stats('ETH', 60)['fills'] == 2
+    finally:
+        store.executor.shutdown()
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from decoding import FrameDecoder, peek_channel, peek_user, msgspec, orjson
+
+BACKENDS = ['json'] + (['orjson'] if orjson else []) + (['msgspec'] if msgspec else [])
+WALLET = '0x' + 'Ab' * 20
+
+FILL = {'coin': 'ETH', 'px': '3000.5', 'sz': '2.0', 'side': 'B', 'time': 1700000000000,
+        'startPosition': '0.0', 'dir': 'Open Long', 'closedPnl': '0.0', 'hash': '0x00',
+        'oid': 7, 'crossed': True, 'fee': '1.2', 'tid': 123456789, 'feeToken': 'USDC'}
+POSITION = {'type': 'oneWay', 'position': {'coin': 'BTC', 'szi': '-0.5', 'entryPx': '100000.0'}}
+
+
+def fills_frame(**data):
+    return json.dumps({'channel': 'userFills', 'data': {'user': WALLET, 'fills': [FILL], **data}})
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_user_fills(backend):
+    frame = FrameDecoder(backend).decode(fills_frame(isSnapshot=True))
+    assert frame.channel == 'userFills'
+    assert frame.user == WALLET.lower()
+    assert frame.items == [FILL]
+    assert frame.is_snapshot
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_web_data2_skips_unread_fields(backend):
+    message = json.dumps({'channel': 'webData2', 'data': {
+        'user': WALLET, 'openOrders': [{'oid': 1}],
+        'clearinghouseState': {'assetPositions': [POSITION], 'marginSummary': {}}}})
+    frame = FrameDecoder(backend).decode(message)
+    assert (frame.channel, frame.user, frame.items, frame.is_snapshot) == ('webData2', WALLET.lower(),
+                                                                          [POSITION], False)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_ignored_channels(backend):
+    decoder = FrameDecoder(backend)
+    assert decoder.decode('{"channel":"pong"}') is None
+    assert decoder.decode('{"channel":"subscriptionResponse","data":{"method":"subscribe"}}') is None
+    assert decoder.decode('{"channel":"userFills"}') is None
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_invalid_frame_raises_value_error(backend):
+    with pytest.raises(ValueError):
+        FrameDecoder(backend).decode('{"channel":"userFills","data":')
+
+
+def test_peek():
+    message = fills_frame().encode()
+    assert peek_channel(message) == 'userFills'
+    assert peek_user(message) == WALLET.lower()
+    assert peek_channel('{"data":{}}') is None
+
+
+@pytest.mark.parametrize('message', [
+    fills_frame(isSnapshot=True),
+    fills_frame(fills=[]),
+    '{"channel":"userFills","data":{}}',
+    '{"channel":"userFills","data":null}',
+    json.dumps({'channel': 'webData2', 'data': {'user': WALLET, 'clearinghouseState': {'assetPositions': [POSITION]}}}),
+    json.dumps({'channel': 'webData2', 'data': {'user': WALLET}}),
+    json.dumps({'channel': 'webData2', 'data': {'user': WALLET, 'clearinghouseState': None}}),
+    json.dumps({'channel': 'webData2', 'data': {'user': WALLET, 'clearinghouseState': {}}}),
+    '{"channel":"webData2","data":{}}',
+    '{"channel":"webData2"}',
+])
+def test_backends_agree(message):
+    frames = {backend: FrameDecoder(backend).decode(message) for backend in BACKENDS}
+    assert all(frame == frames['json'] for frame in frames.values()), frames
+
+
+def test_web_data2_without_clearinghouse_state_is_an_empty_frame():
+    message = json.dumps({'channel': 'webData2', 'data': {'user': WALLET}})
+    for backend in BACKENDS:
+        assert FrameDecoder(backend).decode(message) == ('webData2', WALLET.lower(), [], False)
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+from analytics import FillAnalytics, FlowRule
+from fill_store import FillStore
+from main import HyperliquidMonitor
+from rules import DEFAULT_RULES, RuleSet
+
+WALLETS = ['0x' + str(i) * 40 for i in range(1, 4)]
+T0 = 1_700_000_000_000
+
+
+def fill(tid, time_ms, coin='BTC', side='B', dir='Open Long', px='100.0', sz='10'):
+    return {'coin': coin, 'px': px, 'sz': sz, 'side': side, 'time': time_ms, 'startPosition': '0.0',
+            'dir': dir, 'closedPnl': '0.0', 'crossed': True, 'tid': tid}
+
+
+def asset(coin, szi):
+    return {'position': {'coin': coin, 'szi': szi, 'entryPx': '100.0', 'leverage': {'type': 'cross', 'value': 5}}}
+
+
+def test_analytics_forgets_wallets_that_left_every_window():
+    analytics = FillAnalytics(windows=(60,), rules=[FlowRule('long', 60, 2, 0)])
+    analytics.add_fill(WALLETS[0], fill(1, T0))
+    analytics.add_fill(WALLETS[1], fill(2, T0 + 1000))
+    assert analytics.forget_idle_wallets() == 0
+
+    analytics.add_fill(WALLETS[1], fill(3, T0 + 61_000, side='A', dir='Close Long'))
+    assert analytics.forget_idle_wallets() == 1
+    assert WALLETS[0] not in analytics.wallets.ids and WALLETS[1] in analytics.wallets.ids
+    window = analytics.windows[60]
+    assert all(key[1] == analytics.wallets.ids[WALLETS[1]] for key in window.wallet_net)
+
+    # The freed id is reused; the window counts the new wallet's open and not the forgotten one's
+    analytics.add_fill(WALLETS[2], fill(4, T0 + 61_500))
+    assert analytics.wallets.ids[WALLETS[2]] == 0 and len(analytics.wallets.names) == 2
+    stats = analytics.stats('BTC', 60)
+    assert (stats['fills'], stats['open_long_wallets']) == (2, 1)
+
+
+async def evict_idle(monitor, wallet):
+    monitor.last_active[wallet] -= 7200
+    task = asyncio.create_task(monitor.evict_idle_wallets(3600, interval=0))
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+
+def test_evict_wallet_drops_fill_state_and_keeps_positions(tmp_path, sender):
+    store = FillStore(str(tmp_path / 'fills.db'))
+    try:
+        async def run():
+            monitor = HyperliquidMonitor(WALLETS[:2], sender, store)
+            now_ms = int(time.time() * 1000)
+            for wallet in WALLETS[:2]:
+                monitor.process_position_update([asset('ETH', '1.0')], wallet)
+                monitor.process_fills_update([fill(7, now_ms)], wallet)
+            monitor.coalescer.flush_all()
+            await evict_idle(monitor, WALLETS[0])
+            return monitor
+
+        monitor = asyncio.run(run())
+        idle, busy = WALLETS[:2]
+        for state in (monitor.active_fills, monitor.fill_marks, monitor.last_active):
+            assert idle not in state and busy in state
+        # The wallet is still subscribed: its positions stay to diff the next snapshot against
+        for state in (monitor.active_positions, monitor.position_tracker.positions,
+                      monitor.position_tracker.fingerprints):
+            assert idle in state and busy in state
+        assert monitor.fill_mark(idle)[1] == {7}
+
+        monitor.remove_wallets([busy])
+        for state in (monitor.active_positions, monitor.active_fills, monitor.fill_marks, monitor.last_active,
+                      monitor.position_tracker.positions, monitor.position_tracker.fingerprints):
+            assert busy not in state
+    finally:
+        store.executor.shutdown()
+        store.reader.close()
+        store.db.close()
+
+
+def test_position_opened_after_eviction_alerts(tmp_path, sender):
+    store = FillStore(str(tmp_path / 'fills.db'))
+    wallet = WALLETS[0]
+    try:
+        async def run():
+            monitor = HyperliquidMonitor([wallet], sender, store)
+            monitor.alert_rules.position_rules = RuleSet.from_config(DEFAULT_RULES, 'positions')
+            monitor.process_position_update([asset('ETH', '1.0')], wallet)
+            monitor.process_position_update([asset('ETH', '1.0'), asset('BTC', '2000')], wallet)
+            assert len(sender.messages) == 1
+            await evict_idle(monitor, wallet)
+
+            # The first snapshot after the eviction is diffed, not taken as a baseline
+            monitor.process_position_update([asset('ETH', '1.0'), asset('BTC', '2000'), asset('SOL', '-3000')],
+                                            wallet)
+            assert len(sender.messages) == 2
+            # A fill on a position opened before the eviction is not a fresh open
+            monitor.process_fills_update([fill(8, int(time.time() * 1000))], wallet)
+            assert monitor.coalescer.pending == {}
+
+        asyncio.run(run())
+    finally:
+        store.executor.shutdown()
+        store.reader.close()
+        store.db.close()
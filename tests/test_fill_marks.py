@@ -0,0 +1,124 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from fill_store import FillStore
+from main import HyperliquidMonitor
+
+WALLET = '0x' + 'c' * 40
+T0 = 1_700_000_000_000
+
+
+def fill(tid, time_ms, coin='BTC', dir='Open Long'):
+    return {'coin': coin, 'px': '100000.0', 'sz': '0.1', 'side': 'B', 'time': time_ms, 'startPosition': '0.0',
+            'dir': dir, 'closedPnl': '0.0', 'hash': '0x00', 'oid': 1, 'crossed': True, 'fee': '0.1',
+            'tid': tid, 'feeToken': 'USDC'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    fill_store = FillStore(str(tmp_path / 'fills.db'))
+    yield fill_store
+    fill_store.executor.shutdown()
+    fill_store.reader.close()
+    fill_store.db.close()
+
+
+def processed(fill_store):
+    tids = [int(key.rsplit('_', 1)[1]) for _, key, _, _ in fill_store.pending]
+    fill_store._flush_batch(fill_store.pending, fill_store.pending_marks)
+    fill_store.pending, fill_store.pending_marks = [], {}
+    return tids
+
+
+def run(monitor, fills, is_snapshot=False):
+    async def process():
+        monitor.process_fills_update(fills, WALLET, is_snapshot=is_snapshot)
+        monitor.coalescer.flush_all()
+    asyncio.run(process())
+
+
+def test_same_millisecond_fills_with_lower_tids_are_not_dropped(store, sender):
+    monitor = HyperliquidMonitor([WALLET], sender, store)
+    run(monitor, [fill(500, T0), fill(900, T0 + 1)])
+    assert monitor.fill_mark(WALLET) == (T0 + 1, {900})
+    processed(store)
+
+    # A later frame brings more fills of the mark's millisecond, with lower tids
+    run(monitor, [fill(900, T0 + 1), fill(100, T0 + 1), fill(800, T0 + 1), fill(50, T0)])
+    assert sorted(processed(store)) == [100, 800]
+    assert monitor.fill_mark(WALLET) == (T0 + 1, {100, 800, 900})
+
+    run(monitor, [fill(7, T0 + 2)])
+    assert monitor.fill_mark(WALLET) == (T0 + 2, {7})
+
+
+def test_resume_from_the_persisted_mark(store, sender):
+    monitor = HyperliquidMonitor([WALLET], sender, store)
+    run(monitor, [fill(30, T0), fill(20, T0 + 5), fill(10, T0 + 5)], is_snapshot=True)
+    assert processed(store) == [30, 20, 10]
+
+    # Restart: the snapshot repeats everything and adds fills at and after the mark's millisecond
+    restarted = HyperliquidMonitor([WALLET], sender, store)
+    assert restarted.fill_mark(WALLET) == (T0 + 5, {10, 20})
+    snapshot = [fill(30, T0), fill(20, T0 + 5), fill(10, T0 + 5), fill(5, T0 + 5), fill(1, T0 + 6)]
+    run(restarted, snapshot, is_snapshot=True)
+    assert sorted(processed(store)) == [1, 5]
+
+
+def test_first_snapshot_is_a_baseline(store, sender):
+    # Fills the default rules alert on: recent opens on a large position
+    now_ms = int(time.time() * 1000)
+    monitor = HyperliquidMonitor([WALLET], sender, store)
+    run(monitor, [{**fill(1, now_ms), 'startPosition': '2000'}], is_snapshot=True)
+    assert sender.messages == []
+    run(monitor, [{**fill(2, now_ms + 1, coin='ETH'), 'startPosition': '2000'}])
+    assert len(sender.messages) == 1
+
+
+def test_mark_of_a_store_without_marks(store):
+    store._write([(WALLET, f"BTC_{tid}", time_ms, json.dumps(fill(tid, time_ms)))
+                  for tid, time_ms in [(9, T0), (3, T0 + 1), (8, T0 + 1)]])
+    assert store.load_mark(WALLET) == (T0 + 1, {3, 8})
+    assert store.load_mark('0x' + 'd' * 40) is None
+
+
+def test_legacy_fills_are_imported_by_the_flush(store, tmp_path):
+    legacy = {f"BTC_{tid}": fill(tid, time_ms) for tid, time_ms in [(9, T0), (3, T0 + 1), (8, T0 + 1)]}
+    (tmp_path / f'active_fills_{WALLET[-8:]}.json').write_text(json.dumps(legacy))
+
+    assert store.load_mark(WALLET) == (T0 + 1, {3, 8})
+    # Nothing is written on the calling thread: the rows and the mark wait for the flush
+    assert store.reader.execute("SELECT COUNT(*) FROM fills").fetchone()[0] == 0
+    assert sorted(processed(store)) == [3, 8, 9]
+    assert store.reader.execute("SELECT COUNT(*) FROM fills").fetchone()[0] == 3
+    assert store.load_mark(WALLET) == (T0 + 1, {3, 8})
+
+
+def test_mark_lookup_while_a_flush_commits(store):
+    committing, release = threading.Event(), threading.Event()
+    flush_batch = store._flush_batch
+
+    def slow_flush_batch(rows, marks):
+        committing.set()
+        release.wait(5)
+        flush_batch(rows, marks)
+
+    store._flush_batch = slow_flush_batch
+
+    async def scenario():
+        store.add(WALLET, {1: fill(1, T0)})
+        store.set_mark(WALLET, T0, frozenset({1}))
+        flush = asyncio.create_task(store.flush())
+        await asyncio.get_running_loop().run_in_executor(None, committing.wait, 5)
+        # The mark left pending_marks but is not committed yet
+        assert store.load_mark(WALLET) == (T0, {1})
+        release.set()
+        await flush
+
+    asyncio.run(scenario())
+    assert store.flushing_marks == []
+    assert store.load_mark(WALLET) == (T0, {1})
@@ -0,0 +1,51 @@
+import time
+
+from analytics import FillAnalytics
+from fill_store import FillStore
+from main import HyperliquidMonitor, build_metrics
+from metrics import Histogram
+
+WALLETS = ['0x' + str(i) * 40 for i in range(1, 4)]
+
+
+def fill(time_ms, coin='BTC', side='B', dir='Open Long', px='100.0', sz='10', closed_pnl='0'):
+    return {'coin': coin, 'px': px, 'sz': sz, 'side': side, 'time': time_ms, 'dir': dir, 'closedPnl': closed_pnl}
+
+
+def test_snapshot_per_coin_and_window():
+    analytics = FillAnalytics(windows=(60, 3600))
+    t0 = 1_700_000_000_000
+    analytics.add_fill(WALLETS[0], fill(t0))
+    analytics.add_fill(WALLETS[1], fill(t0 + 1000, side='A', dir='Open Short', px='100', sz='4'))
+    analytics.add_fill(WALLETS[2], fill(t0 + 2000, coin='ETH', side='A', dir='Close Long', closed_pnl='50'))
+
+    snapshot = analytics.snapshot(t0 + 30_000)
+    assert set(snapshot) == {('BTC', 60), ('BTC', 3600), ('ETH', 60), ('ETH', 3600)}
+    btc = snapshot[('BTC', 60)]
+    assert (btc['fills'], btc['net_flow'], btc['open_long'], btc['open_short']) == (2, 600.0, 1000.0, 400.0)
+    assert btc['consensus'] == 0.0
+    assert snapshot[('ETH', 60)]['realized_pnl'] == 50.0
+
+    # Later, the 60 s window is empty and only the hour is reported
+    assert set(analytics.snapshot(t0 + 120_000)) == {('BTC', 3600), ('ETH', 3600)}
+
+
+def test_flow_gauges_are_scraped(tmp_path, sender):
+    store = FillStore(str(tmp_path / 'fills.db'))
+    try:
+        monitor = HyperliquidMonitor(WALLETS, sender, store)
+        monitor.process_flow([fill(int(time.time() * 1000))], WALLETS[0])
+        text = build_metrics(monitor, sender_with_counts(sender), store).render()
+        assert 'hlmon_flow_net_notional{coin="BTC",window="60"} 1000.0' in text
+        assert 'hlmon_flow_open_wallets{coin="BTC",window="600",side="long"} 1' in text
+    finally:
+        store.executor.shutdown()
+        store.db.close()
+
+
+def sender_with_counts(sender):
+    # build_metrics also reads the TelegramSender counters
+    sender.sent_count = sender.failed_count = 0
+    sender.send_latency = Histogram('hlmon_telegram_send_seconds', '')
+    sender.delivery_lag = Histogram('hlmon_alert_delivery_seconds', '')
+    return sender
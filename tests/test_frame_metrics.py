@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import main
+from fill_store import FillStore
+from main import HyperliquidMonitor
+from metrics import Counter, Gauge, Histogram
+from workers import WorkerPool
+
+WALLET = '0x' + 'e' * 40
+
+
+def test_histogram_take_and_merge():
+    worker, front = Histogram('a', ''), Histogram('b', '')
+    for value in (0.001, 0.002, 5.0):
+        worker.observe(value)
+    counts, total = worker.take()
+    assert worker.count == 0 and worker.sum == 0.0
+    front.observe(0.001)
+    front.merge(counts, total)
+    assert front.count == 4 and abs(front.sum - 5.004) < 1e-9
+
+
+def test_label_values_are_escaped():
+    counter = Counter('hlmon_x', 'x', labels=('coin',))
+    counter.labels('a"b\\c\nd').inc()
+    assert counter.render()[-1] == 'hlmon_x_total{coin="a\\"b\\\\c\\nd"} 1'
+
+    gauge = Gauge('hlmon_y', 'y', labels=('coin', 'wallet'), collect=lambda: {('BTC', '0x"\n'): 2.0})
+    assert gauge.render()[-1] == 'hlmon_y{coin="BTC",wallet="0x\\"\\n"} 2.0'
+
+    histogram = Histogram('hlmon_z', 'z', labels=('coin',), buckets=(1.0,))
+    histogram.labels('\\').observe(0.5)
+    assert histogram.render()[2] == 'hlmon_z_bucket{coin="\\\\",le="1.0"} 1'
+
+
+def test_worker_metrics_reach_the_front_end(tmp_path, sender):
+    store = FillStore(str(tmp_path / 'fills.db'))
+    try:
+        worker = HyperliquidMonitor([WALLET], sender, store)
+        front = HyperliquidMonitor([WALLET], sender, store)
+        frame = json.dumps({'channel': 'webData2', 'data': {'user': WALLET, 'clearinghouseState': {
+            'assetPositions': []}}})
+
+        async def run():
+            for _ in range(main.TIMING_SAMPLE * 2):
+                await worker.handle_message(frame)
+            await worker.handle_message('{"channel":"pong"}')
+        asyncio.run(run())
+
+        front.merge_frame_metrics(worker.take_frame_metrics())
+        assert front.frame_counts == {'userFills': 0, 'webData2': 32, 'other': 1}
+        assert front.decode_latency.count == 2  # timed on one frame in TIMING_SAMPLE
+        assert WALLET in front.last_seen
+        # Taken metrics start over in the worker
+        assert worker.take_frame_metrics()['frames'] == {'userFills': 0, 'webData2': 0, 'other': 0}
+        assert 'hlmon_frames_total{channel="webData2"} 32' in '\n'.join(front.frames.render())
+    finally:
+        store.executor.shutdown()
+        store.db.close()
+
+
+def test_frames_the_pool_does_not_route_are_counted_in_front(tmp_path, sender):
+    store = FillStore(str(tmp_path / 'fills.db'))
+    try:
+        front = HyperliquidMonitor([WALLET], sender, store)
+        front.pool = WorkerPool(1, [WALLET], sender.publish, front.process_flow, str(tmp_path / 'fills.db'))
+
+        async def run():
+            await front.handle_message('{"channel":"pong"}')
+            await front.handle_message(json.dumps({'channel': 'userFills', 'data': {'user': WALLET, 'fills': []}}))
+        asyncio.run(run())
+
+        # The routed frame is counted by its worker, with the metrics of its batch
+        assert front.frame_counts == {'userFills': 0, 'webData2': 0, 'other': 1}
+        assert front.pool.submitted == 1
+    finally:
+        store.executor.shutdown()
+        store.db.close()
@@ -0,0 +1,69 @@
+from position_diff import POSITION_CLOSED, POSITION_OPENED, POSITION_RESIZED, PositionTracker
+from rules import FillFacts, RuleSet
+
+WALLET = '0x' + '1' * 40
+
+
+def asset(coin, szi, entry_px='100.0', pnl='0.0', leverage='cross'):
+    return {'type': 'oneWay', 'position': {'coin': coin, 'szi': szi, 'entryPx': entry_px, 'unrealizedPnl': pnl,
+                                           'leverage': {'type': leverage, 'value': 10}}}
+
+
+def test_first_snapshot_is_a_baseline():
+    tracker = PositionTracker()
+    assert tracker.diff(WALLET, [asset('BTC', '1.0')]) == []
+    assert set(tracker.current(WALLET)) == {'BTC_long'}
+
+
+def test_unchanged_fingerprint_ignores_pnl():
+    tracker = PositionTracker()
+    tracker.diff(WALLET, [asset('BTC', '1.0')])
+    assert tracker.diff(WALLET, [asset('BTC', '1.0', pnl='123.4')]) is None
+
+
+def test_opened_resized_closed():
+    tracker = PositionTracker()
+    tracker.diff(WALLET, [asset('BTC', '1.0'), asset('ETH', '-5.0')])
+    events = tracker.diff(WALLET, [asset('BTC', '2.0'), asset('SOL', '10.0')])
+    assert [(e.action, e.key) for e in events] == [
+        (POSITION_RESIZED, 'BTC_long'), (POSITION_OPENED, 'SOL_long'), (POSITION_CLOSED, 'ETH_short')]
+    resized = events[0]
+    assert resized.previous.szi == 1.0 and resized.position.szi == 2.0
+    assert events[2].position.szi == -5.0
+
+
+def test_side_flip_is_a_close_and_an_open():
+    tracker = PositionTracker()
+    tracker.diff(WALLET, [asset('BTC', '1.0')])
+    events = tracker.diff(WALLET, [asset('BTC', '-1.0')])
+    assert sorted((e.action, e.key) for e in events) == [(POSITION_CLOSED, 'BTC_long'), (POSITION_OPENED, 'BTC_short')]
+
+
+def test_forget_starts_a_new_baseline():
+    tracker = PositionTracker()
+    tracker.diff(WALLET, [asset('BTC', '1.0')])
+    tracker.forget(WALLET)
+    assert tracker.current(WALLET) == {}
+    assert tracker.diff(WALLET, [asset('BTC', '2.0')]) == []
+
+
+def test_position_rules():
+    config = {'rules': [
+        {'name': 'fills-only', 'directions': ['Open']},
+        {'name': 'big', 'events': ['positions'], 'directions': ['Opened', 'Closed'], 'min_notional': 100000},
+        {'name': 'btc-resizes', 'events': ['positions'], 'coins': ['BTC'], 'directions': ['Resized'],
+         'min_start_position': 1},
+    ]}
+    rules = RuleSet.from_config(config, 'positions')
+    assert [rule.name for rule in rules.rules] == ['big', 'btc-resizes']
+    assert [rule.name for rule in RuleSet.from_config(config).rules] == ['fills-only']
+
+    tracker = PositionTracker()
+    tracker.diff(WALLET, [asset('BTC', '1.0', '100000'), asset('ETH', '1.0', '3000')])
+    events = tracker.diff(WALLET, [asset('BTC', '3.0', '100000'), asset('SOL', '-2000', '150')])
+    matched = {e.key: rules.match(FillFacts.from_position(e.action, e.position, WALLET, e.previous)) for e in events}
+    # ETH closed at $3k is below min_notional; SOL short opened at $300k
+    assert matched == {'BTC_long': 'btc-resizes', 'SOL_short': 'big', 'ETH_long': None}
+
+    facts = FillFacts.from_position(events[0].action, events[0].position, WALLET, events[0].previous)
+    assert (facts.dir, facts.crossed, facts.notional, facts.start_position) == ('Resized Long', True, 300000.0, 1.0)
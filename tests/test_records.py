@@ -0,0 +1,66 @@
+from position_diff import PositionTracker, position_side
+from records import COINS, FillRecord, Interner, PositionRecord
+
+WALLET = '0x' + 'a' * 40
+
+
+def test_fill_record_fields():
+    raw = {'coin': 'BTC', 'px': '100000.5', 'sz': '0.25', 'side': 'B', 'time': 1_700_000_000_000,
+           'startPosition': '-1.5', 'dir': 'Open Long', 'closedPnl': '12.5', 'hash': '0xabc', 'oid': 77,
+           'crossed': True, 'fee': '0.01', 'tid': 123456789, 'feeToken': 'USDC'}
+    record = FillRecord.from_dict(raw)
+    assert (record.coin_name, record.tid, record.time, record.oid) == ('BTC', 123456789, 1_700_000_000_000, 77)
+    assert (record.px, record.sz, record.start_position, record.closed_pnl, record.fee) == \
+        (100000.5, 0.25, -1.5, 12.5, 0.01)
+    assert (record.dir, record.side, record.crossed) == ('Open Long', 'B', True)
+    assert not hasattr(record, '__dict__')
+
+    # Missing or unparseable values become zeros and empty strings
+    empty = FillRecord.from_dict({'coin': 'BTC', 'px': 'n/a', 'dir': None})
+    assert (empty.tid, empty.px, empty.sz, empty.dir, empty.side, empty.crossed) == (0, 0.0, 0.0, '', '', False)
+
+
+def test_position_record_fields():
+    raw = {'coin': 'ETH', 'szi': '-2.5', 'entryPx': '3000.1', 'unrealizedPnl': '-40.25',
+           'leverage': {'type': 'isolated', 'value': 10, 'rawUsd': '123'}, 'liquidationPx': '3500'}
+    record = PositionRecord.from_dict(raw, position_side(raw))
+    assert (record.coin_name, record.side, record.szi, record.entry_px, record.unrealized_pnl) == \
+        ('ETH', 'short', -2.5, 3000.1, -40.25)
+    assert (record.leverage_type, record.leverage_value) == ('isolated', 10)
+
+    bare = PositionRecord.from_dict({'coin': 'ETH', 'leverage': None}, 'long')
+    assert (bare.szi, bare.leverage_type, bare.leverage_value) == (0.0, '', 0)
+
+
+def test_side_follows_the_sign_of_szi():
+    assert [position_side({'szi': szi}) for szi in ('1.5', '-1.5', '', None)] == ['long', 'short', '-', '-']
+    assert position_side({}) == '-'
+
+    tracker = PositionTracker()
+    tracker.diff(WALLET, [{'position': {'coin': 'BTC', 'szi': '-3', 'entryPx': '1'}},
+                          {'position': {'coin': 'ETH', 'szi': '2', 'entryPx': '1'}}])
+    current = tracker.current(WALLET)
+    assert {key: record.side for key, record in current.items()} == {'BTC_short': 'short', 'ETH_long': 'long'}
+
+
+def test_coins_are_interned_once():
+    first = FillRecord.from_dict({'coin': 'kPEPE'})
+    second = FillRecord.from_dict({'coin': 'kPEPE'})
+    position = PositionRecord.from_dict({'coin': 'kPEPE'}, 'long')
+    assert first.coin == second.coin == position.coin == COINS.ids['kPEPE']
+    assert COINS.names[first.coin] is COINS.names[position.coin]
+    assert FillRecord.from_dict({'coin': 'DOGE'}).coin != first.coin
+
+
+def test_interner_reuses_forgotten_ids():
+    names = Interner()
+    assert [names(name) for name in ('a', 'b', 'c', 'a')] == [0, 1, 2, 0]
+    names.forget(1)
+    assert 'b' not in names.ids and names.names[1] is None
+
+    # The freed id goes to the next new name; known names keep theirs
+    assert names('a') == 0
+    assert names('d') == 1 and names.names[1] == 'd'
+    assert names('b') == 3
+    assert len(names) == 4
+    assert names.ids == {'a': 0, 'd': 1, 'c': 2, 'b': 3}
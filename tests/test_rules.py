@@ -0,0 +1,176 @@
+import json
+import os
+import time
+
+import pytest
+
+from rules import AlertRules, DEFAULT_RULES, FillFacts, RuleSet, compile_rule
+
+WALLET = '0x' + 'a' * 40
+OTHER = '0x' + 'b' * 40
+
+
+def facts(**fields):
+    values = dict(coin='BTC', wallet=WALLET, dir='Open Long', crossed=True, notional=50_000.0,
+                  start_position=0.0, age=10.0)
+    values.update(fields)
+    return FillFacts(**values)
+
+
+def test_empty_rule_matches_everything():
+    rule = compile_rule({}, {}, 0)
+    assert rule.name == 'rule-0' and rule.action == 'alert'
+    assert rule.coins is None and rule.wallets is None
+    assert rule.predicate(facts())
+
+
+@pytest.mark.parametrize('spec, matching, failing', [
+    ({'directions': ['Open']}, {'dir': 'Open Short'}, {'dir': 'Close Long'}),
+    ({'directions': ['Close', 'Liquidat']}, {'dir': 'Liquidated Cross Long'}, {'dir': 'Open Long'}),
+    ({'side': 'short'}, {'dir': 'Close Short'}, {'dir': 'Open Long'}),
+    ({'leverage': 'cross'}, {'crossed': True}, {'crossed': False}),
+    ({'leverage': 'isolated'}, {'crossed': False}, {'crossed': True}),
+    ({'leverage': 'Cross', 'side': 'Long'}, {'crossed': True}, {'crossed': False}),
+    ({'min_notional': 100_000}, {'notional': 100_000.0}, {'notional': 99_999.0}),
+    ({'max_notional': 1000}, {'notional': 1000.0}, {'notional': 1001.0}),
+    ({'min_start_position': 1000}, {'start_position': 1000.0}, {'start_position': 999.0}),
+    ({'max_age': 3600}, {'age': 3600.0}, {'age': 3601.0}),
+    ({'exclude_coins': ['BTC']}, {'coin': 'ETH'}, {'coin': 'BTC'}),
+])
+def test_conditions(spec, matching, failing):
+    predicate = compile_rule(spec, {}, 0).predicate
+    assert predicate(facts(**matching))
+    assert not predicate(facts(**failing))
+
+
+def test_values_are_bound_not_pasted():
+    # A direction that is not a valid Python literal still compiles and compares as a string
+    predicate = compile_rule({'directions': ["') or True or ('"]}, {}, 0).predicate
+    assert not predicate(facts())
+
+
+def test_wallets_and_groups():
+    rule = compile_rule({'wallets': [WALLET.upper()], 'groups': ['whales']}, {'whales': [OTHER]}, 0)
+    assert rule.wallets == {WALLET, OTHER}
+    assert compile_rule({'groups': ['empty']}, {'empty': []}, 0).wallets == frozenset()
+
+
+@pytest.mark.parametrize('spec', [
+    {'min_notionl': 1},
+    {'groups': ['missing']},
+    {'action': 'mute'},
+    {'events': ['orders']},
+    {'side': 'buy'},
+    {'side': ''},
+    {'leverage': 'crossed'},
+])
+def test_invalid_rules(spec):
+    with pytest.raises(ValueError):
+        compile_rule(spec, {}, 0)
+
+
+def test_rule_set_drops_and_coin_index():
+    rules = RuleSet.from_config({'rules': [
+        {'name': 'btc', 'coins': ['BTC'], 'min_notional': 10_000},
+        {'name': 'whale', 'wallets': [OTHER]},
+        {'name': 'no-small', 'action': 'drop', 'max_notional': 1000},
+    ]})
+    assert rules.match(facts()) == 'btc'
+    assert rules.match(facts(coin='ETH')) is None
+    assert rules.match(facts(coin='ETH', wallet=OTHER)) == 'whale'
+    assert rules.match(facts(wallet=OTHER, notional=10.0)) is None
+
+
+def test_may_match_prechecks_coin_and_wallet():
+    rules = RuleSet.from_config({'rules': [{'coins': ['BTC'], 'wallets': [OTHER]}]})
+    assert rules.may_match(OTHER, 'BTC')
+    assert not rules.may_match(OTHER, 'ETH')
+    assert not rules.may_match(WALLET, 'BTC')
+    # Any coin from any wallet: the pre-check cannot rule anything out
+    assert RuleSet.from_config({'rules': [{'min_notional': 1}]}).may_match(WALLET, 'ETH')
+
+
+def test_default_rules_match_the_old_filters():
+    rules = RuleSet.from_config(DEFAULT_RULES)
+    now = time.time()
+    fill = {'coin': 'ETH', 'px': '3000', 'sz': '1', 'dir': 'Open Long', 'startPosition': '1500',
+            'time': int(now * 1000)}
+    assert rules(fill, WALLET)
+    assert not rules({**fill, 'startPosition': '-999'}, WALLET)
+    assert not rules({**fill, 'dir': 'Close Long'}, WALLET)
+    assert not rules({**fill, 'time': int((now - 3601) * 1000)}, WALLET)
+
+
+def write(path, config):
+    path.write_text(json.dumps(config))
+    os.utime(path, (time.time(), time.time() + 1))  # a new mtime even within the same second
+
+
+def test_missing_file_at_startup_uses_defaults(tmp_path):
+    rules = AlertRules(str(tmp_path / 'missing.json'))
+    assert [rule.name for rule in rules.rule_set.rules] == ['opens-on-large-positions']
+    assert [rule.name for rule in rules.position_rules.rules] == ['large-positions-opened-or-closed']
+
+
+def test_invalid_file_at_startup_uses_defaults(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text('{"rules": [{"min_notionl": 1}]}')
+    assert [rule.name for rule in AlertRules(str(path)).rule_set.rules] == ['opens-on-large-positions']
+
+
+def test_bad_reload_keeps_the_last_good_rules(tmp_path):
+    path = tmp_path / 'rules.json'
+    write(path, {'rules': [{'name': 'mine'}]})
+    rules = AlertRules(str(path))
+    assert [rule.name for rule in rules.rule_set.rules] == ['mine']
+    assert rules.position_rules.rules == []
+
+    path.write_text('{"rules": [')
+    os.utime(path, (time.time(), time.time() + 2))
+    assert not rules.reload()
+    assert [rule.name for rule in rules.rule_set.rules] == ['mine']
+
+    write(path, {'rules': [{'name': 'fixed'}]})
+    os.utime(path, (time.time(), time.time() + 3))
+    assert rules.reload()
+    assert [rule.name for rule in rules.rule_set.rules] == ['fixed']
+
+
+@pytest.mark.parametrize('config', [
+    [],
+    ['x'],
+    {'rules': {'name': 'x'}},
+    {'rules': ['x']},
+    {'groups': ['whales'], 'rules': []},
+    {'rules': [{'coins': 5}]},
+    {'rules': [{'directions': 'Open Long'}]},
+    {'rules': [{'min_notional': None}]},
+    {'rules': [{'max_age': '3600'}]},
+    {'rules': [{'side': ['long']}]},
+    {'rules': [{'events': 'positions'}]},
+])
+def test_wrongly_shaped_config_is_a_value_error(config):
+    with pytest.raises(ValueError):
+        RuleSet.from_config(config)
+
+
+@pytest.mark.parametrize('text', ['[]', '["x"]', '{"rules": [{"coins": 5}]}', '{"rules": [{"min_notional": null}]}'])
+def test_wrongly_shaped_file_at_startup_uses_defaults(tmp_path, text):
+    path = tmp_path / 'rules.json'
+    path.write_text(text)
+    rules = AlertRules(str(path))
+    assert [rule.name for rule in rules.rule_set.rules] == ['opens-on-large-positions']
+    assert [rule.name for rule in rules.position_rules.rules] == ['large-positions-opened-or-closed']
+
+
+@pytest.mark.parametrize('config', [[], {'rules': [{'directions': 'Open Long'}]}, {'rules': [{'coins': 5}]},
+                                    {'rules': [{'leverage': 'crossed'}]}, {'rules': [{'side': 'buy'}]}])
+def test_wrongly_shaped_reload_keeps_the_last_good_rules(tmp_path, config):
+    path = tmp_path / 'rules.json'
+    write(path, {'rules': [{'name': 'mine'}]})
+    rules = AlertRules(str(path))
+
+    path.write_text(json.dumps(config))
+    os.utime(path, (time.time(), time.time() + 2))
+    assert not rules.reload()
+    assert [rule.name for rule in rules.rule_set.rules] == ['mine']
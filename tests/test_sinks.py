@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.bench_telegram import FakeTelegram, serve
+from sinks import AlertHub, BLOCK, DROP_OLDEST, SPILL, LocalSender, Sink, TelegramSink
+from telegram_sender import TelegramSender
+
+
+class ListSink(Sink):
+    def __init__(self, name='list', **options):
+        super().__init__(name, **options)
+        self.messages = []
+
+    async def deliver(self, batch):
+        self.messages += [message for message, _, _ in batch]
+
+
+async def paused(sink: Sink) -> Sink:
+    """A started sink whose delivery task is stopped, so its queue only fills."""
+    await sink.start()
+    sink.task.cancel()
+    await asyncio.gather(sink.task, return_exceptions=True)
+    return sink
+
+
+async def resume(sink: Sink):
+    sink.task = asyncio.create_task(sink._run())
+    await sink.drain()
+    await sink.close()
+
+
+def queued(sink: Sink):
+    return [message for message, _, _ in sink.queue._queue]
+
+
+def test_drop_oldest():
+    async def run():
+        sink = await paused(ListSink(max_queue=2, policy=DROP_OLDEST))
+        for i in range(4):
+            sink.put_nowait((i, None, 0.0))
+        assert queued(sink) == [2, 3]
+        assert sink.dropped == 2
+        await resume(sink)
+        assert sink.messages == [2, 3]
+    asyncio.run(run())
+
+
+def test_block_put_nowait_raises_and_put_waits():
+    async def run():
+        sink = await paused(ListSink(max_queue=1, policy=BLOCK))
+        sink.put_nowait((0, None, 0.0))
+        with pytest.raises(asyncio.QueueFull):
+            sink.put_nowait((1, None, 0.0))
+        put = asyncio.create_task(sink.put((1, None, 0.0)))
+        await asyncio.sleep(0)
+        assert not put.done()
+        await resume(sink)
+        await put
+        assert sink.messages == [0, 1]
+    asyncio.run(run())
+
+
+def test_block_offer_drops_oldest():
+    async def run():
+        sink = await paused(ListSink(max_queue=2, policy=BLOCK))
+        for i in range(3):
+            sink.offer((i, None, 0.0))
+        assert queued(sink) == [1, 2]
+        assert sink.dropped == 1
+        await sink.close()
+    asyncio.run(run())
+
+
+def test_spill_keeps_order(tmp_path):
+    async def run():
+        sink = await paused(ListSink(max_queue=2, policy=SPILL, batch_size=2, spill_path=str(tmp_path / 'spill.jsonl')))
+        for i in range(6):
+            sink.put_nowait((f"alert {i}", 'chat', float(i)))
+        assert sink.spilled == 4 and sink.qsize() == 6
+        await resume(sink)
+        assert sink.messages == [f"alert {i}" for i in range(6)]
+        assert (tmp_path / 'spill.jsonl').stat().st_size == 0
+    asyncio.run(run())
+
+
+def test_spill_left_by_an_earlier_run_is_delivered(tmp_path):
+    async def run():
+        path = str(tmp_path / 'spill.jsonl')
+        sink = await paused(ListSink(max_queue=1, policy=SPILL, spill_path=path))
+        for i in range(3):
+            sink.put_nowait((f"alert {i}", None, 0.0))
+        await sink.close()
+
+        restarted = ListSink(max_queue=1, policy=SPILL, spill_path=path)
+        await restarted.start()
+        await restarted.drain()
+        await restarted.close()
+        assert restarted.messages == ["alert 1", "alert 2"]
+    asyncio.run(run())
+
+
+def test_hub_waits_only_for_full_block_sinks():
+    async def run():
+        full = await paused(ListSink('full', max_queue=1, policy=BLOCK))
+        free = await paused(ListSink('free', max_queue=10, policy=BLOCK))
+        lossy = await paused(ListSink('lossy', max_queue=1, policy=DROP_OLDEST))
+        hub = AlertHub([full, free, lossy])
+        await hub.queue_message('first')
+        queued_second = asyncio.create_task(hub.queue_message('second'))
+        await asyncio.sleep(0)
+        # The put into the full sink is pending; the others already have the alert
+        assert not queued_second.done()
+        assert queued(free) == ['first', 'second']
+        assert queued(lossy) == ['second']
+        await resume(full)
+        await queued_second
+        assert full.messages == ['first', 'second']
+        await free.close()
+        await lossy.close()
+    asyncio.run(run())
+
+
+def test_hub_publish_never_waits():
+    async def run():
+        block = await paused(ListSink('block', max_queue=1, policy=BLOCK))
+        hub = AlertHub([block])
+        for i in range(5):
+            hub.publish(i)
+        assert hub.published == 5
+        assert queued(block) == [4] and block.dropped == 4
+        await block.close()
+    asyncio.run(run())
+
+
+def test_telegram_sink_counts_only_confirmed_sends():
+    async def run():
+        fake = FakeTelegram(responses=[(400, '{"ok": false, "description": "chat not found"}')])
+        runner, api_url = await serve(fake)
+        sender = TelegramSender('token', 'chat', api_url=api_url, global_rate=1000, chat_rate=1000, chat_burst=1000)
+        await sender.start()
+        sink = TelegramSink(sender, policy=DROP_OLDEST, batch_size=2)
+        await sink.start()
+        try:
+            for _ in range(2):
+                sink.put_nowait((repr(time.perf_counter()), None, time.time()))
+            await sink.drain()
+            for _ in range(100):
+                if sink.delivered + sink.failed == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await sink.close()
+            await sender.stop()
+            await runner.cleanup()
+        return sink
+
+    sink = asyncio.run(run())
+    assert (sink.delivered, sink.failed) == (1, 1)
+
+
+def test_local_sender_keeps_and_forwards():
+    forwarded = []
+    sender = LocalSender(lambda *alert: forwarded.append(alert), keep=True)
+    asyncio.run(sender.queue_message('a', 'chat', 1.0))
+    sender.publish('b')
+    assert sender.messages == ['a', 'b']
+    assert forwarded == [('a', 'chat', 1.0), ('b', None, None)]
+    assert sender.qsize() == 0 and LocalSender().messages is None
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from benchmarks.bench_telegram import FakeTelegram, serve
+from telegram_sender import TelegramSender, TokenBucket
+
+
+def test_bucket_refills_at_rate_up_to_capacity():
+    bucket = TokenBucket(rate=2.0, capacity=3.0)
+    bucket.tokens, bucket.updated = 0.0, 100.0
+    bucket._refill(100.5)
+    assert bucket.tokens == pytest.approx(1.0)
+    bucket._refill(110.0)
+    assert bucket.tokens == 3.0
+
+
+def test_bucket_waits_for_tokens_and_pauses():
+    async def run():
+        bucket = TokenBucket(rate=50.0, capacity=2.0)
+        start = time.perf_counter()
+        for _ in range(3):
+            await bucket.acquire()
+        refilled = time.perf_counter() - start
+
+        bucket.pause(0.05)
+        assert bucket.tokens == 0.0
+        start = time.perf_counter()
+        await bucket.acquire()
+        return refilled, time.perf_counter() - start
+
+    refilled, paused = asyncio.run(run())
+    assert 0.015 <= refilled < 0.2
+    assert 0.05 <= paused < 0.2
+
+
+def deliver(fake, messages, **config):
+    """Send (chat_id, text, delay) through a TelegramSender talking to `fake`, each after waiting `delay`."""
+    async def run():
+        runner, api_url = await serve(fake)
+        sender = TelegramSender('token', 'chat-0', api_url=api_url, global_rate=1000, chat_rate=1000,
+                                chat_burst=1000, **config)
+        await sender.start()
+        try:
+            for chat_id, text, delay in messages:
+                await asyncio.sleep(delay)
+                sender.publish(text, chat_id=chat_id)
+            await asyncio.wait_for(sender.join(), 5)
+        finally:
+            await sender.stop()
+            await runner.cleanup()
+        return sender
+
+    return asyncio.run(run())
+
+
+def test_429_pauses_every_chat_for_retry_after():
+    throttled = json.dumps({'ok': False, 'error_code': 429, 'parameters': {'retry_after': 0.1}})
+    fake = FakeTelegram(responses=[(429, throttled)])
+    # chat-1's message is queued after the 429 came back for chat-0
+    sender = deliver(fake, [('chat-0', repr(time.perf_counter()), 0), ('chat-1', repr(time.perf_counter()), 0.03)])
+
+    assert (sender.sent_count, sender.failed_count, fake.requests) == (2, 0, 3)
+    (throttled_at, _), *later = fake.received
+    assert {chat_id for _, chat_id in later} == {'chat-0', 'chat-1'}
+    assert all(at - throttled_at >= 0.1 for at, _ in later)
+
+
+def test_5xx_and_network_errors_back_off_and_retry():
+    fake = FakeTelegram(responses=[(502, 'bad gateway'), (500, '{"ok": false}')])
+    sender = deliver(fake, [('chat-0', repr(time.perf_counter()), 0)], backoff=0.05)
+    assert (sender.sent_count, sender.failed_count, fake.requests) == (1, 0, 3)
+    (first, _), (second, _), (third, _) = fake.received
+    assert second - first >= 0.05 and third - second >= 0.1
+
+
+def test_retries_are_bounded():
+    fake = FakeTelegram(responses=[(503, '')] * 3)
+    sender = deliver(fake, [('chat-0', repr(time.perf_counter()), 0)], backoff=0.001, max_retries=3)
+    assert (sender.sent_count, sender.failed_count, fake.requests) == (0, 1, 3)
+
+
+@pytest.mark.parametrize('text', ['[1, 2]', '"Bad Request"', 'null', 'not json'])
+def test_error_bodies_that_are_not_objects(text):
+    fake = FakeTelegram(responses=[(400, text)])
+    sender = deliver(fake, [('chat-0', repr(time.perf_counter()), 0)])
+    assert (sender.sent_count, sender.failed_count, fake.requests) == (0, 1, 1)
+
+
+@pytest.mark.parametrize('body, retry_after', [
+    ({'parameters': {'retry_after': 3}}, 3),
+    ({'parameters': {'retry_after': 'soon'}}, 1.0),
+    ({'parameters': [3]}, 1.0),
+    ({'description': [1, 2]}, 1.0),
+])
+def test_retry_after(body, retry_after):
+    assert TelegramSender._retry_after(body) == retry_after
@@ -0,0 +1,106 @@
+import pickle
+import random
+import time
+
+import pytest
+
+import templates
+from benchmarks.bench_templates import (legacy_fills_message, legacy_flow_message, legacy_position_message,
+                                        random_fill, random_flow, random_position)
+from position_diff import POSITION_CLOSED, POSITION_OPENED, POSITION_RESIZED
+from records import PositionRecord
+from templates import LazyMessage, Template, fills_message, flow_message, position_message
+
+WALLET = '0x3e051c89cd06e6867ce98c758fcc665d2148e1bb'
+T0 = 1_700_000_000_000
+
+
+def fill(**fields):
+    raw = {'coin': 'BTC', 'px': '100000.5', 'sz': '1234.5', 'side': 'B', 'dir': 'Open Long',
+           'startPosition': '-2500.25', 'closedPnl': '-1234.5', 'crossed': True, 'tid': 42, 'time': T0}
+    raw.update(fields)
+    return raw
+
+
+def without_clock(message: str) -> str:
+    return '\n'.join(line for line in message.split('\n') if not line.startswith('🕐'))
+
+
+def test_templates_match_the_legacy_formatters():
+    random.seed(1)
+    now_ms = int(time.time() * 1000)
+    for _ in range(500):
+        raw = random_fill(now_ms)
+        assert fills_message(raw, WALLET).render() == legacy_fills_message(raw, WALLET)
+        alert = random_flow(now_ms)
+        assert flow_message(alert).render() == legacy_flow_message(alert)
+        # The legacy position message stamps datetime.now(), the template its creation time
+        position, action = random_position(), random.choice([POSITION_OPENED, POSITION_RESIZED, POSITION_CLOSED])
+        assert (without_clock(position_message(position, action, WALLET).render())
+                == without_clock(legacy_position_message(position, action, WALLET)))
+
+
+def test_template_slots():
+    template = Template('{a} & {b:money} {{literal}} {missing}', fmt='text')
+    assert template.render({'a': 'x', 'b': '1234.5'}) == 'x & 1,234.50 {literal} N/A'
+    assert Template('{a:amount}').render({'a': 'not a number'}) == 'not a number'
+    with pytest.raises(ValueError):
+        Template('{a:bogus}')
+    with pytest.raises(ValueError):
+        Template('{a}', fmt='markdown')
+    with pytest.raises(ValueError):
+        Template('{a}', locale='fr')
+
+
+def test_html_escapes_coin_and_wallet():
+    wallet = '0x<b>&'
+    message = fills_message(fill(coin='A<B>&C'), wallet).render()
+    assert '💎 <b>Symbol:</b> A&lt;B&gt;&amp;C' in message
+    assert '<a href="https://www.coinglass.com/hyperliquid/0x&lt;b&gt;&amp;">0x&lt;b&gt;&amp;</a>' in message
+    assert 'A<B>' not in message and '0x<b>' not in message
+
+    position = PositionRecord.from_dict({'coin': 'X&Y', 'szi': '1', 'entryPx': '1',
+                                         'leverage': {'type': 'cross', 'value': 3}}, 'long')
+    assert '💎 <b>Coin:</b> X&amp;Y' in position_message(position, POSITION_OPENED, WALLET).render()
+
+
+def test_text_variant():
+    message = fills_message(fill(coin='A<B>&C'), WALLET)
+    text = message.render('text')
+    assert '<' not in text.replace('A<B>', '') and '&amp;' not in text
+    assert text.split('\n')[0] == '🔵 Open Long (Cross)'
+    assert '💎 Symbol: A<B>&C' in text
+    # The link is reduced to its text
+    assert text.endswith(f'🔗 Wallet: {WALLET}')
+    assert message.render() != text
+
+
+def test_de_locale():
+    message = fills_message(fill(), WALLET, locale='de')
+    text = message.render('text')
+    assert '📏 Margin: 1.234,5 ($2.500,25)' in text
+    assert '💵 Entry: 100.000,5' in text
+    assert '💸 Pnl: -1.234,50' in text
+    assert '💵 Entry: 100,000.5' in fills_message(fill(), WALLET).render('text')
+
+
+def test_lazy_message_renders_once_per_format(monkeypatch):
+    renders = []
+    get_template = templates.get_template
+
+    def counting(name, fmt='html', locale='en'):
+        renders.append(fmt)
+        return get_template(name, fmt, locale)
+    monkeypatch.setattr(templates, 'get_template', counting)
+
+    message = fills_message(fill(), WALLET)
+    assert renders == []
+    html = message.render()
+    assert str(message) == message.render() == html
+    assert renders == ['html']
+    assert message.render('text') != html
+    assert renders == ['html', 'text']
+
+    # Worker processes hand messages over pickled; the copy renders the same text
+    copy = pickle.loads(pickle.dumps(message))
+    assert isinstance(copy, LazyMessage) and copy.render() == html
@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+
+from wallet_registry import WalletRegistry
+
+WALLET = '0x' + 'a' * 40
+OTHER = '0x' + 'b' * 40
+
+
+@pytest.mark.parametrize('body, status', [
+    ('[]', 400),
+    ('"0x"', 400),
+    ('{"add": 5}', 400),
+    ('{"remove": "0x"}', 400),
+    ('not json', 400),
+    (json.dumps({'add': [OTHER], 'remove': [WALLET]}), 200),
+])
+def test_post_wallets(tmp_path, body, status):
+    path = tmp_path / 'wallets.json'
+    path.write_text(json.dumps([WALLET]))
+    added, removed = [], []
+    registry = WalletRegistry(str(path), on_add=added.extend, on_remove=removed.extend)
+
+    async def run():
+        await registry.serve(port=0)
+        try:
+            port = registry.runner.addresses[0][1]
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"http://127.0.0.1:{port}/wallets", data=body) as response:
+                    return response.status
+        finally:
+            await registry.close()
+
+    assert asyncio.run(run()) == status
+    expected = [OTHER] if status == 200 else [WALLET]
+    assert registry.wallets == expected and json.loads(path.read_text()) == expected
+    assert (added, removed) == (([OTHER], [WALLET]) if status == 200 else ([], []))
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import zlib
+
+from workers import WorkerPool, wallet_worker, worker_store_path
+
+WALLETS = [f"0x{i:040x}" for i in range(1, 7)]
+
+
+def fills_frame(wallet, tid, time_ms):
+    fill = {'coin': 'BTC', 'px': '100000.0', 'sz': '0.1', 'side': 'B', 'time': time_ms, 'startPosition': '2000',
+            'dir': 'Open Long', 'closedPnl': '0.0', 'crossed': True, 'tid': tid}
+    return json.dumps({'channel': 'userFills', 'data': {'user': wallet, 'fills': [fill]}})
+
+
+def test_wallets_are_partitioned_by_crc32():
+    assert [wallet_worker(wallet, 3) for wallet in WALLETS] == [zlib.crc32(w.encode()) % 3 for w in WALLETS]
+    assert worker_store_path('storage/fills.db', 2) == 'storage/fills.worker-2.db'
+
+
+def test_submit_routes_by_wallet(tmp_path):
+    async def run():
+        pool = WorkerPool(3, WALLETS, print, print, str(tmp_path / 'fills.db'))
+        routed = [pool.submit(fills_frame(wallet, 1, 0)) for wallet in WALLETS]
+        skipped = [pool.submit('{"channel":"pong"}'), pool.submit('{"channel":"userFills","data":{}}')]
+        # Batches go to the workers' inboxes on the next loop iteration
+        return pool, routed, skipped, [list(batch) for batch in pool.batches]
+
+    pool, routed, skipped, batches = asyncio.run(run())
+    assert all(routed) and skipped == [False, False]
+    assert pool.submitted == len(WALLETS)
+    for index, batch in enumerate(batches):
+        assert batch == [fills_frame(w, 1, 0) for w in WALLETS if wallet_worker(w, 3) == index]
+
+
+def test_submit_decodes_frames_the_peek_cannot_route(tmp_path):
+    late = json.dumps({'data': {'user': WALLETS[0], 'fills': [], 'isSnapshot': True}, 'channel': 'userFills'})
+    other = json.dumps({'data': {'user': WALLETS[0], 'padding': 'x' * 64}, 'channel': 'pong'})
+
+    async def run():
+        pool = WorkerPool(3, WALLETS, print, print, str(tmp_path / 'fills.db'))
+        results = [pool.submit(late), pool.submit(other), pool.submit('{"data": ' + 'x' * 64)]
+        return results, [list(batch) for batch in pool.batches]
+
+    assert late.index('"channel"') > 64
+    results, batches = asyncio.run(run())
+    assert results == [True, False, False]
+    assert batches[wallet_worker(WALLETS[0], 3)] == [late]
+
+
+def test_pool_keeps_wallet_order_and_returns_results(tmp_path):
+    alerts, flows, metrics = [], [], []
+    now_ms = int(time.time() * 1000)
+
+    async def run():
+        pool = WorkerPool(2, WALLETS, lambda message, chat_id=None, created_at=None: alerts.append(str(message)),
+                          lambda fills, wallet: flows.append((wallet, [fill['tid'] for fill in fills])),
+                          str(tmp_path / 'fills.db'), on_metrics=metrics.append, coalesce_window=0,
+                          log_level=logging.INFO)
+        await pool.start()
+        try:
+            for tid in range(1, 6):
+                for wallet in WALLETS:
+                    pool.submit(fills_frame(wallet, tid, now_ms + tid))
+                await asyncio.sleep(0)
+            await asyncio.wait_for(pool.drain(), 30)
+            for _ in range(500):
+                if len(alerts) == len(WALLETS):
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
+    for wallet in WALLETS:
+        assert [tids for w, tids in flows if w == wallet] == [[1], [2], [3], [4], [5]]
+    # One opened position per wallet, alerted through the worker's LocalSender
+    assert len(alerts) == len(WALLETS) and all('BTC' in alert for alert in alerts)
+    assert sum(m['frames']['userFills'] for m in metrics) == 5 * len(WALLETS)
+    # Every worker has its own store; the parent's path is not written by them
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith('.db')) == ['fills.worker-0.db', 'fills.worker-1.db']
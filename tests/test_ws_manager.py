@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import pytest
+import websockets
+
+from ws_manager import ConnectionManager, Shard
+
+WALLETS = [f"0x{i:040x}" for i in range(1, 8)]
+
+
+async def ignore(message):
+    pass
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def subscriptions(websocket):
+    return [(message['method'], message['subscription']['type'], message['subscription']['user'])
+            for message in websocket.sent]
+
+
+def test_wallets_are_spread_within_the_subscription_limit():
+    # 4 subscriptions per connection: 2 wallets (webData2 + userFills each)
+    manager = ConnectionManager('ws://unused', WALLETS[:5], ignore, connections=1, max_subscriptions=4)
+    assert [shard.wallets for shard in manager.shards] == [WALLETS[0:4:3], WALLETS[1:5:3], WALLETS[2:3]]
+    assert manager.assign(WALLETS[0]) is manager.shards[0]
+
+    # The least loaded shard takes the next wallet; a new shard only opens when all are full
+    assert manager.assign(WALLETS[5]) is manager.shards[2]
+    assert len(manager.assign(WALLETS[6]).wallets) == 1 and len(manager.shards) == 4
+
+
+def test_connections_sets_a_minimum_shard_count():
+    manager = ConnectionManager('ws://unused', WALLETS[:4], ignore, connections=3)
+    assert [len(shard.wallets) for shard in manager.shards] == [2, 1, 1]
+
+
+def test_add_and_remove_go_to_live_shards_only():
+    async def run():
+        manager = ConnectionManager('ws://unused', WALLETS[:3], ignore, max_subscriptions=4, subscribe_rate=1000)
+        live = FakeWebsocket()
+        manager.shards[0].websocket = live
+
+        await manager.add_wallets([WALLETS[3], WALLETS[0]])
+        await manager.remove_wallets([WALLETS[2], WALLETS[0]])
+        return manager, live
+
+    manager, live = asyncio.run(run())
+    # WALLETS[3] went to shard 1, which is reconnecting: it subscribes its current list when it is back
+    assert subscriptions(live) == [('unsubscribe', 'webData2', WALLETS[2]), ('unsubscribe', 'webData2', WALLETS[0]),
+                                   ('unsubscribe', 'userFills', WALLETS[2]), ('unsubscribe', 'userFills', WALLETS[0])]
+    assert [shard.wallets for shard in manager.shards] == [[], [WALLETS[1], WALLETS[3]]]
+    assert set(manager.wallet_shards) == {WALLETS[1], WALLETS[3]}
+
+
+def test_a_dropped_connection_resubscribes_only_its_own_wallets():
+    async def run():
+        connections = []  # (websocket, subscribed users)
+
+        async def handler(websocket):
+            users = []
+            connections.append((websocket, users))
+            try:
+                async for message in websocket:
+                    users.append(json.loads(message)['subscription']['user'])
+            except websockets.exceptions.ConnectionClosed:
+                pass
+
+        async with websockets.serve(handler, '127.0.0.1', 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            manager = ConnectionManager(f'ws://127.0.0.1:{port}', WALLETS[:4], ignore, max_subscriptions=4,
+                                        subscribe_rate=1000, retry_delay=0.01)
+            task = asyncio.create_task(manager.run())
+
+            async def wait_for(condition):
+                for _ in range(500):
+                    if condition():
+                        return
+                    await asyncio.sleep(0.01)
+                raise AssertionError('timed out')
+
+            await wait_for(lambda: sum(len(users) for _, users in connections) == 8)
+            dropped = next(ws for ws, users in connections if users[0] == WALLETS[0])
+            await dropped.close()
+            await wait_for(lambda: len(connections) == 3 and len(connections[2][1]) == 4)
+            await asyncio.sleep(0.05)
+
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return manager, connections
+
+    manager, connections = asyncio.run(run())
+    assert sorted(connections[2][1]) == sorted(WALLETS[0:4:2] * 2)
+    assert [len(users) for _, users in connections] == [4, 4, 4]
+    assert [shard.reconnects for shard in manager.shards] == [1, 0]
+    assert not manager.tasks
+
+
+def test_shards_opened_while_running_are_supervised():
+    class FailingShard(Shard):
+        async def run(self):
+            if self.shard_id == 0:
+                await asyncio.Event().wait()
+            raise RuntimeError(f"shard {self.shard_id} broke")
+
+    class Manager(ConnectionManager):
+        def _new_shard(self, shard_id):
+            return FailingShard(shard_id, self.url, self.handler, self.subscribe_rate)
+
+    async def run():
+        manager = Manager('ws://unused', WALLETS[:1], ignore, max_subscriptions=2)
+        task = asyncio.create_task(manager.run())
+        await asyncio.sleep(0.01)
+        assert len(manager.tasks) == 1
+
+        await manager.add_wallets([WALLETS[1]])
+        assert len(manager.shards) == 2 and len(manager.tasks) == 2
+        with pytest.raises(RuntimeError, match='shard 1 broke'):
+            await asyncio.wait_for(task, 1)
+        return manager
+
+    manager = asyncio.run(run())
+    assert not manager.tasks
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Callable, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WALLET_RE = re.compile(r'^0x[0-9a-f]{40}$')
+
+
+def load_wallets(path: str) -> List[str]:
+    with open(path, 'r') as f:
+        return normalize_wallets(json.loads(f.read()))
+
+
+def normalize_wallets(wallets) -> List[str]:
+    result = []
+    seen = set()
+    for wallet in wallets:
+        wallet = str(wallet).strip().lower()
+        if not WALLET_RE.match(wallet):
+            logger.error(f"Invalid wallet address ignored: {wallet}")
+            continue
+        if wallet not in seen:
+            seen.add(wallet)
+            result.append(wallet)
+    return result
+
+
+class WalletRegistry:
+    """The tracked wallet list, kept in sync with wallets.json and a local control API.
+
+    Changes from either side are diffed against the current list and only the
+    added/removed wallets are passed to `on_add` / `on_remove`.
+    """
+
+    def __init__(self, path: str, on_add: Optional[Callable[[List[str]], None]] = None,
+                 on_remove: Optional[Callable[[List[str]], None]] = None):
+        self.path = path
+        self.on_add = on_add
+        self.on_remove = on_remove
+        self.wallets = load_wallets(path)
+        self.mtime = os.stat(path).st_mtime
+        self.runner: Optional[web.AppRunner] = None
+
+    def apply(self, wallets: List[str]):
+        current = set(self.wallets)
+        target = set(wallets)
+        added = [wallet for wallet in wallets if wallet not in current]
+        removed = [wallet for wallet in self.wallets if wallet not in target]
+        self.wallets = list(wallets)
+
+        if added:
+            logger.info(f"Wallets added: {', '.join(w[-8:] for w in added)}")
+            if self.on_add:
+                self.on_add(added)
+        if removed:
+            logger.info(f"Wallets removed: {', '.join(w[-8:] for w in removed)}")
+            if self.on_remove:
+                self.on_remove(removed)
+
+    def reload(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self.mtime:
+                return False
+            wallets = load_wallets(self.path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Wallets not reloaded ({self.path}): {e}")
+            return False
+
+        self.mtime = mtime
+        self.apply(wallets)
+        return True
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(self.wallets, indent=4))
+        os.replace(tmp_path, self.path)
+        self.mtime = os.stat(self.path).st_mtime
+
+    async def watch(self, interval: float = 5.0):
+        while True:
+            await asyncio.sleep(interval)
+            self.reload()
+
+    # Control API -----------------------------------------------------------
+
+    async def _get_wallets(self, request: web.Request):
+        return web.json_response({"wallets": self.wallets})
+
+    async def _post_wallets(self, request: web.Request):
+        """{"add": [...], "remove": [...]}; the result is written back to wallets.json."""
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"error": "invalid JSON"}, status=400)
+        if not isinstance(body, dict) or not all(isinstance(body.get(key, []), list) for key in ('add', 'remove')):
+            return web.json_response({"error": 'expected {"add": [...], "remove": [...]}'}, status=400)
+
+        remove = set(normalize_wallets(body.get('remove', [])))
+        wallets = [wallet for wallet in self.wallets if wallet not in remove]
+        wallets += [wallet for wallet in normalize_wallets(body.get('add', [])) if wallet not in wallets]
+
+        self.apply(wallets)
+        self.save()
+        return web.json_response({"wallets": self.wallets})
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8780):
+        app = web.Application()
+        app.router.add_get('/wallets', self._get_wallets)
+        app.router.add_post('/wallets', self._post_wallets)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        logger.info(f"Wallet control API on http://{host}:{port}/wallets")
+
+    async def close(self):
+        if self.runner:
+            await self.runner.cleanup()
@@ -0,0 +1,260 @@
+"""Process pool that decodes and processes frames away from the websocket event loop.
+
+In pool mode the front end (ConnectionManager -> HyperliquidMonitor.handle_message)
+only peeks the wallet of each frame (decoding it only when the peek cannot tell) and
+forwards the raw frame to the worker that owns that wallet (crc32(wallet) % workers),
+so every wallet is handled by one process and its frames keep their order. Each worker runs a regular
+HyperliquidMonitor; what it would send comes back on a single result queue:
+
+    ('ready', worker)                          worker started
+    ('done', worker, frames)                   a batch of frames was processed
+    ('alert', message, chat_id, created_at)    a message for the front end's sender
+    ('fills', wallet, fills)                   new fills for the cross-wallet flow analytics
+
+Each worker keeps its fills and marks in its own SQLite file (worker_store_path), so the
+workers never wait on each other for the write lock. A wallet's mark is in the file of the
+worker that owns it: changing the number of workers starts the moved wallets over from a
+baseline snapshot.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from decoding import ROUTED_CHANNELS, FrameDecoder, peek_channel, peek_user
+
+logger = logging.getLogger(__name__)
+
+
+def wallet_worker(wallet: str, workers: int) -> int:
+    return zlib.crc32(wallet.encode()) % workers
+
+
+def worker_store_path(path: str, index: int) -> str:
+    """storage/fills.db -> storage/fills.worker-0.db"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker-{index}{ext}"
+
+
+async def _worker_loop(index: int, wallets: List[str], inbox, outbox, config: Dict):
+    # main imports this module, so the monitor is only imported inside the worker process
+    from archive import Archive
+    from backfill import FillBackfill
+    from fill_store import FillStore
+    from main import HyperliquidMonitor
+    from sinks import LocalSender
+
+    class WorkerMonitor(HyperliquidMonitor):
+        def create_analytics(self):
+            # Flow analytics live in the front end; no ring buffer per worker
+            return None
+
+        def process_flow(self, fills: list, wallet_address: str):
+            # Flow rules aggregate over all wallets, so they run in the front end
+            outbox.put(('fills', wallet_address, fills))
+
+    fill_store = FillStore(
+        worker_store_path(config['fill_store_path'], index),
+        flush_interval=config.get('flush_interval', 1.0),
+        retention_days=config.get('retention_days', 30),
+        max_fills_per_wallet=config.get('max_fills_per_wallet', 5000)
+    )
+    await fill_store.start()
+    # The pool's share of the info endpoint budget, so N workers do not multiply the request rate
+    backfill = FillBackfill(config['backfill_url'], rate=config.get('backfill_rate', 2.0)) \
+        if config.get('backfill_url') else None
+    if backfill:
+        await backfill.start()
+    # Every worker appends to its own archive segments
+    archive = Archive(config['archive_path'], writer=f'worker-{index}',
+                      flush_interval=config.get('flush_interval', 1.0)) if config.get('archive_path') else None
+    if archive:
+        await archive.start()
+    # Alerts go to the front end's sender
+    sender = LocalSender(lambda message, chat_id, created_at: outbox.put(('alert', message, chat_id, created_at)))
+    monitor = WorkerMonitor(wallets, sender, fill_store,
+                            coalesce_window=config.get('coalesce_window', 2.0), backfill=backfill, archive=archive)
+    tasks = [asyncio.create_task(monitor.alert_rules.watch(config.get('rules_reload_interval', 5.0)))]
+    if config.get('idle_evict'):
+        tasks.append(asyncio.create_task(monitor.evict_idle_wallets(config['idle_evict'])))
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'worker-{index}-inbox')
+    outbox.put(('ready', index))
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, inbox.get)
+            if item is None:
+                break
+            kind, payload = item
+            if kind == 'frames':
+                for message in payload:
+                    await monitor.handle_message(message)
+                outbox.put(('done', index, len(payload), monitor.take_frame_metrics()))
+            elif kind == 'add':
+                monitor.add_wallets(payload)
+            elif kind == 'remove':
+                monitor.remove_wallets(payload)
+    finally:
+        monitor.coalescer.flush_all()
+        await asyncio.sleep(0)  # let the queued alert tasks run
+        for task in tasks + list(monitor.resume_tasks):
+            task.cancel()
+        await fill_store.close()
+        if archive:
+            await archive.close()
+        if backfill:
+            await backfill.close()
+        executor.shutdown(wait=False)
+
+
+def _worker_main(index: int, wallets: List[str], inbox, outbox, config: Dict):
+    if 'log_level' in config:
+        logging.disable(config['log_level'])
+    try:
+        asyncio.run(_worker_loop(index, wallets, inbox, outbox, config))
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    """Front end of the worker processes: routes frames by wallet and collects their results."""
+
+    def __init__(self, workers: int, wallets: List[str],
+                 on_alert: Callable[..., None], on_fills: Callable[[list, str], None],
+                 fill_store_path: str, on_metrics: Optional[Callable[[Dict], None]] = None, **config):
+        self.workers = max(1, workers)
+        self.on_alert = on_alert
+        self.on_fills = on_fills
+        self.on_metrics = on_metrics  # frame metrics of each processed batch (HyperliquidMonitor.take_frame_metrics)
+
+        # spawn, not fork: the parent already runs an event loop and executor threads
+        context = multiprocessing.get_context('spawn')
+        self.inboxes = [context.Queue() for _ in range(self.workers)]
+        self.outbox = context.Queue()
+        partitions: List[List[str]] = [[] for _ in range(self.workers)]
+        for wallet in wallets:
+            partitions[wallet_worker(wallet, self.workers)].append(wallet)
+        config['fill_store_path'] = fill_store_path
+        self.processes = [
+            context.Process(target=_worker_main, args=(i, partitions[i], self.inboxes[i], self.outbox, config),
+                            name=f'monitor-worker-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+
+        # Frames are buffered per worker and sent once per loop iteration, one put per batch
+        self.batches: List[List[str]] = [[] for _ in range(self.workers)]
+        self.flush_handle: Optional[asyncio.Handle] = None
+        self.reader: Optional[asyncio.Task] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='worker-results')
+        self.ready = 0
+        self.ready_event: Optional[asyncio.Event] = None
+
+        self.submitted = 0
+        self.processed = 0
+        # Only for frames the peek cannot route, as HyperliquidMonitor.handle_message does
+        self.decoder = FrameDecoder(config.get('frame_decoder', 'auto'))
+
+    async def start(self, timeout: float = 60.0):
+        self.ready_event = asyncio.Event()
+        for process in self.processes:
+            process.start()
+        self.reader = asyncio.create_task(self._read_results())
+        await asyncio.wait_for(self.ready_event.wait(), timeout)
+        logger.info(f"{self.workers} worker processes ready")
+
+    def submit(self, message: str) -> bool:
+        channel = peek_channel(message)
+        if channel is not None and channel not in ROUTED_CHANNELS:
+            return False
+        wallet = peek_user(message) if channel is not None else None
+        if wallet is None:
+            # "channel" past the peeked prefix, or a user the pattern does not match: decode the frame
+            try:
+                frame = self.decoder.decode(message)
+            except ValueError:
+                return False
+            if frame is None or not frame.user:
+                return False
+            wallet = frame.user
+
+        self.batches[wallet_worker(wallet, self.workers)].append(message)
+        self.submitted += 1
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_soon(self._flush)
+        return True
+
+    def _flush(self):
+        self.flush_handle = None
+        for inbox, batch in zip(self.inboxes, self.batches):
+            if batch:
+                inbox.put(('frames', batch))
+        self.batches = [[] for _ in range(self.workers)]
+
+    def _by_worker(self, wallets: List[str]) -> Dict[int, List[str]]:
+        groups: Dict[int, List[str]] = {}
+        for wallet in wallets:
+            groups.setdefault(wallet_worker(wallet, self.workers), []).append(wallet)
+        return groups
+
+    def add_wallets(self, wallets: List[str]):
+        for index, group in self._by_worker(wallets).items():
+            self.inboxes[index].put(('add', group))
+
+    def remove_wallets(self, wallets: List[str]):
+        for index, group in self._by_worker(wallets).items():
+            self.inboxes[index].put(('remove', group))
+
+    @property
+    def backlog(self) -> int:
+        return self.submitted - self.processed
+
+    async def drain(self, poll: float = 0.005):
+        """Wait until every submitted frame has been processed."""
+        while self.backlog:
+            await asyncio.sleep(poll)
+
+    async def _read_results(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(self.executor, self.outbox.get)
+            if item is None:
+                return
+            kind = item[0]
+            try:
+                if kind == 'done':
+                    self.processed += item[2]
+                    if self.on_metrics:
+                        self.on_metrics(item[3])
+                elif kind == 'alert':
+                    _, message, chat_id, created_at = item
+                    self.on_alert(message, chat_id=chat_id, created_at=created_at)
+                elif kind == 'fills':
+                    self.on_fills(item[2], item[1])
+                elif kind == 'ready':
+                    self.ready += 1
+                    if self.ready == self.workers:
+                        self.ready_event.set()
+            except Exception as e:
+                logger.error(f"Worker result error: {e}")
+
+    async def stop(self, timeout: float = 10.0):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self._flush()
+        for inbox in self.inboxes:
+            inbox.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            if process.is_alive():
+                await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+        # Unblocks the result reader thread
+        self.outbox.put(None)
+        if self.reader:
+            await asyncio.gather(self.reader, return_exceptions=True)
+        self.executor.shutdown(wait=False)
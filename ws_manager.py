@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import math
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+import websockets
+
+from telegram_sender import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_TYPES = ("webData2", "userFills")
+
+
+def subscription_message(method: str, sub_type: str, wallet: str) -> str:
+    return json.dumps({
+        "method": method,
+        "subscription": {
+            "type": sub_type,
+            "user": wallet
+        }
+    })
+
+
+class Shard:
+    """One websocket connection and the wallets subscribed on it."""
+
+    def __init__(self, shard_id: int, url: str, handler: Callable[[str], Awaitable[None]],
+                 subscribe_rate: float = 30.0, retry_delay: float = 5.0):
+        self.shard_id = shard_id
+        self.url = url
+        self.handler = handler
+        self.retry_delay = retry_delay  # after a closed connection; twice that after other errors
+        self.wallets: List[str] = []
+        # Hyperliquid allows ~2000 messages/min per connection; subscribes are pipelined under that budget
+        self.bucket = TokenBucket(subscribe_rate, subscribe_rate)
+        self.websocket = None
+        self.is_connected = False
+        self.reconnects = 0
+
+    async def send_subscriptions(self, websocket, wallets: Iterable[str], method: str = "subscribe"):
+        wallets = list(wallets)
+        for sub_type in SUBSCRIPTION_TYPES:
+            for wallet in wallets:
+                await self.bucket.acquire()
+                await websocket.send(subscription_message(method, sub_type, wallet))
+        logger.info(f"Shard {self.shard_id}: {method}d {len(wallets)} wallets")
+
+    def _subscribe_done(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error and not isinstance(error, websockets.exceptions.ConnectionClosed):
+            logger.error(f"Shard {self.shard_id}: Subscribe failed: {error!r}")
+
+    async def run(self):
+        first = True
+        while True:
+            subscribe_task: Optional[asyncio.Task] = None
+            if not first:
+                self.reconnects += 1
+            first = False
+            try:
+                logger.info(f"Shard {self.shard_id}: Connect to Hyperliquid WebSocket...")
+
+                async with websockets.connect(
+                        self.url,
+                        ping_interval=20,
+                        ping_timeout=10
+                ) as websocket:
+
+                    self.websocket = websocket
+                    self.is_connected = True
+                    logger.info(f"Shard {self.shard_id}: Connected!")
+
+                    # Responses are read while subscriptions are still going out
+                    subscribe_task = asyncio.create_task(self.send_subscriptions(websocket, self.wallets))
+                    subscribe_task.add_done_callback(self._subscribe_done)
+
+                    async for message in websocket:
+                        await self.handler(message)
+
+            except websockets.exceptions.ConnectionClosed:
+                logger.warning(f"Shard {self.shard_id}: WebSocket Connection Closed. retry to connect...")
+                await asyncio.sleep(self.retry_delay)
+
+            except Exception as e:
+                logger.error(f"Shard {self.shard_id}: Connection Error: {e}")
+                await asyncio.sleep(self.retry_delay * 2)
+
+            finally:
+                self.websocket = None
+                self.is_connected = False
+                if subscribe_task:
+                    # Retrieve the result so a failed subscribe is logged (by the done callback), not lost
+                    subscribe_task.cancel()
+                    await asyncio.gather(subscribe_task, return_exceptions=True)
+
+
+class ConnectionManager:
+    """Spreads wallets over several websocket connections.
+
+    Each shard reconnects and resubscribes on its own, so a dropped connection
+    only affects the wallets assigned to it.
+    """
+
+    def __init__(self, url: str, wallets: List[str], handler: Callable[[str], Awaitable[None]],
+                 connections: int = 1, max_subscriptions: int = 1000, subscribe_rate: float = 30.0,
+                 retry_delay: float = 5.0):
+        self.url = url
+        self.handler = handler
+        self.max_wallets_per_shard = max(1, max_subscriptions // len(SUBSCRIPTION_TYPES))
+        self.subscribe_rate = subscribe_rate
+        self.retry_delay = retry_delay
+
+        shard_count = max(connections, math.ceil(len(wallets) / self.max_wallets_per_shard), 1)
+        self.shards: List[Shard] = [self._new_shard(i) for i in range(shard_count)]
+        self.wallet_shards: Dict[str, Shard] = {}
+        for wallet in wallets:
+            self.assign(wallet)
+
+        # Shard tasks, including those of shards opened while running; run() waits on all of them
+        self.tasks: Set[asyncio.Task] = set()
+        self.tasks_changed: Optional[asyncio.Event] = None  # set while run() is running
+
+    def _new_shard(self, shard_id: int) -> Shard:
+        return Shard(shard_id, self.url, self.handler, self.subscribe_rate, self.retry_delay)
+
+    def _start(self, shard: Shard):
+        self.tasks.add(asyncio.create_task(shard.run(), name=f"shard-{shard.shard_id}"))
+        self.tasks_changed.set()
+
+    def assign(self, wallet: str) -> Shard:
+        """Put a wallet on the least loaded shard, opening a new shard when all are full."""
+        shard = self.wallet_shards.get(wallet)
+        if shard:
+            return shard
+
+        shard = min(self.shards, key=lambda s: len(s.wallets))
+        if len(shard.wallets) >= self.max_wallets_per_shard:
+            shard = self._new_shard(len(self.shards))
+            self.shards.append(shard)
+            if self.tasks_changed is not None:
+                self._start(shard)
+
+        shard.wallets.append(wallet)
+        self.wallet_shards[wallet] = shard
+        return shard
+
+    async def add_wallets(self, wallets: List[str]):
+        by_shard: Dict[Shard, List[str]] = {}
+        for wallet in wallets:
+            if wallet not in self.wallet_shards:
+                by_shard.setdefault(self.assign(wallet), []).append(wallet)
+        await self._send(by_shard, "subscribe")
+
+    async def remove_wallets(self, wallets: List[str]):
+        by_shard: Dict[Shard, List[str]] = {}
+        for wallet in wallets:
+            shard = self.wallet_shards.pop(wallet, None)
+            if shard:
+                shard.wallets.remove(wallet)
+                by_shard.setdefault(shard, []).append(wallet)
+        await self._send(by_shard, "unsubscribe")
+
+    async def _send(self, by_shard: Dict[Shard, List[str]], method: str):
+        # Only live connections get the message; a shard that is reconnecting
+        # subscribes its current wallet list once it is back
+        async def send(shard: Shard, wallets: List[str]):
+            websocket = shard.websocket
+            if websocket is None:
+                return
+            try:
+                await shard.send_subscriptions(websocket, wallets, method)
+            except websockets.exceptions.ConnectionClosed:
+                pass
+
+        await asyncio.gather(*(send(shard, wallets) for shard, wallets in by_shard.items()))
+
+    @property
+    def is_connected(self) -> bool:
+        return any(shard.is_connected for shard in self.shards)
+
+    async def run(self):
+        logger.info(f"Monitoring {len(self.wallet_shards)} wallets over {len(self.shards)} connections")
+        self.tasks_changed = asyncio.Event()
+        for shard in self.shards:
+            self._start(shard)
+        try:
+            while True:
+                # Woken by a finished shard or by a shard opened since the last wait
+                self.tasks_changed.clear()
+                changed = asyncio.create_task(self.tasks_changed.wait())
+                try:
+                    done, _ = await asyncio.wait(self.tasks | {changed}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    changed.cancel()
+                for task in done - {changed}:
+                    self.tasks.discard(task)
+                    # Shards reconnect forever; one that ends failed or was cancelled, as with gather
+                    task.result()
+        finally:
+            self.tasks_changed = None
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            self.tasks.clear()